@@ -0,0 +1,2 @@
+# makes the mobileGazeMapping package in this checkout importable by the tests
+# without installing it (pytest puts the dir of this file on sys.path)
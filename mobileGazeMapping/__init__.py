@@ -0,0 +1,24 @@
+""" Mobile Gaze-Mapping: map mobile eye-tracker gaze data to a fixed target
+stimulus
+
+Modules:
+    mapGaze - map gaze from the world camera to the reference image(s)
+    core - video and feature helpers shared by mapping and preprocessing
+    gazeData - gaze data as NumPy columns (in memory or memory-mapped) with a
+        per-frame sample index
+    homographySmoothing, gazeHeatmap, gazeAnalysis - post-processing of
+        mapped recordings
+    remapGaze - batched perspective transforms, and remapping gaze data with
+        stored homographies
+    gazeStream, mapGazeService, pipeline, preprocessAndMap - ways of running
+        the mapping (live, as a service, in batches)
+    threadTuning - OpenCV/NumPy thread settings for concurrent mapping jobs
+    stimulusPrefilter - cheap check for whether a reference is on a frame
+    frameDedup - detect frames repeating the last registered frame
+    preprocessing - per-device preprocessing of raw recordings
+    cli - the `mobileGazeMapping` command
+
+Importing the package doesn't import any of them (or their dependencies).
+"""
+
+__version__ = '2018.11.19'
@@ -0,0 +1,5 @@
+""" `python -m mobileGazeMapping ...` runs the command line (see cli) """
+
+from .cli import main
+
+main(prog='python -m mobileGazeMapping')
@@ -0,0 +1,2 @@
+""" Benchmarks of the mapping and analysis steps (run with
+`mobileGazeMapping bench ...`) """
@@ -0,0 +1,70 @@
+""" Benchmark fixation detection and AOI statistics on a synthetic study
+
+Generates mapped gaze for a study of many recordings (120 Hz, ~250 ms
+fixations on random points of a 1000x1000 reference image with small gaze
+noise and 1% missing samples), then times:
+    ivt, idt - gazeAnalysis.detectFixations with each method
+    aoiStats - gazeAnalysis.aoiStats over the I-DT fixations, with nAOIs
+               100x100 px rectangle AOIs
+
+Usage:
+    mobileGazeMapping bench analysis [--nSamples N] [--nRecordings N]
+                                     [--nAOIs N]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import time
+import argparse
+
+from ..lazyImport import lazyImport
+from .. import gazeAnalysis
+
+np = lazyImport('numpy')
+pd = lazyImport('pandas')
+
+
+def syntheticStudy(nSamples, nRecordings, seed=0):
+    """ Mapped gaze table (see gazeAnalysis.loadMapped) of a synthetic study """
+    rng = np.random.RandomState(seed)
+    perRecording = nSamples // nRecordings
+    fixation = np.arange(perRecording * nRecordings) // 30
+    cx, cy = rng.uniform(0, 1000, fixation[-1] + 1), rng.uniform(0, 1000, fixation[-1] + 1)
+    x = cx[fixation] + rng.normal(0, 2, fixation.shape[0])
+    y = cy[fixation] + rng.normal(0, 2, fixation.shape[0])
+    x[rng.rand(x.shape[0]) < 0.01] = np.nan
+    return pd.DataFrame({'recording': np.repeat(['rec{}'.format(i) for i in range(nRecordings)], perRecording),
+                         'refImage': '',
+                         'gaze_ts': np.tile(np.arange(perRecording) * (1000 / 120), nRecordings),
+                         'confidence': 1.0,
+                         'ref_gazeX': x,
+                         'ref_gazeY': y})
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--nSamples', type=int, default=10000000, help='total samples [default: 10000000]')
+    parser.add_argument('--nRecordings', type=int, default=100, help='number of recordings [default: 100]')
+    parser.add_argument('--nAOIs', type=int, default=20, help='number of AOIs [default: 20]')
+    args = parser.parse_args(argv)
+
+    gaze = syntheticStudy(args.nSamples, args.nRecordings)
+    rng = np.random.RandomState(1)
+    aois = {'aoi{}'.format(i): [rng.uniform(0, 900), rng.uniform(0, 900), 100, 100] for i in range(args.nAOIs)}
+
+    print('{:<12}{:>12}{:>12}'.format('step', 'seconds', 'rows'))
+    for method in gazeAnalysis.FIXATION_METHODS:
+        t0 = time.time()
+        fixations = gazeAnalysis.detectFixations(gaze, method=method)
+        print('{:<12}{:>12.2f}{:>12}'.format(method, time.time() - t0, len(fixations)))
+    t0 = time.time()
+    stats = gazeAnalysis.aoiStats(gaze, fixations, aois, (1000, 1000))
+    print('{:<12}{:>12.2f}{:>12}'.format('aoiStats', time.time() - t0, len(stats)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+""" Benchmark the memory used by the per-frame mapping work
+
+Runs the per-frame work of GazeMapper.map_recording (decode the frame, find
+the mapping to the reference image, and project the reference image back into
+the frame) in two ways:
+    allocating - a new array for every intermediate image, every frame (how
+                 the mapping loop used to work)
+    buffered - decoded frames, frame copies, and the projectImage2D working
+               images all written into buffers that are reused from frame to
+               frame (how it works now)
+
+and reports, for each:
+    allocMB - median MB of NumPy/Python memory allocated while processing a
+              frame (tracemalloc peak over the frame)
+    peakRSS - peak resident memory of the process (MB). Each mode runs in its
+              own process so this isn't shared between them
+    sPerFrame - median processing time per frame (seconds)
+
+Usage:
+    mobileGazeMapping bench frameMemory [--nFrames N] [--worldCameraVid VID]
+                                        [--referenceImage IMG]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import subprocess
+import tracemalloc
+from os.path import join
+
+from ..lazyImport import lazyImport
+from .. import mapGaze
+
+np = lazyImport('numpy')
+cv2 = lazyImport('cv2')
+
+MODES = ['allocating', 'buffered']
+
+# test data of a source checkout
+repoDir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+testDataDir = join(repoDir, 'tests')
+
+
+def resetPeak():
+    """ Reset the tracemalloc peak (restart tracing on Python < 3.9) """
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.stop()
+        tracemalloc.start()
+
+
+def runFrames(mode, worldCameraVid, referenceImage, nFrames):
+    """ Process nFrames frames in the given mode; returns the measurements """
+    buffered = mode == 'buffered'
+    mapper = mapGaze.GazeMapper(referenceImage)
+    refColor = mapper.refImgColor
+    projectBuffers = {} if buffered else None
+
+    vid = cv2.VideoCapture(worldCameraVid)
+    frameBuffer = None
+    allocBytes, frameTimes = [], []
+
+    tracemalloc.start()
+    for frameIdx in range(nFrames):
+        resetPeak()
+        startBytes = tracemalloc.get_traced_memory()[0]
+        startTime = time.time()
+
+        if buffered and frameBuffer is not None:
+            ret, frame = vid.read(frameBuffer)
+        else:
+            ret, frame = vid.read()
+        if not ret:
+            break
+        frameBuffer = frame
+
+        fr = mapper.map_frame(frame, frameIdx, reuseBuffers=buffered)
+        if fr['foundGoodMatch']:
+            mapGaze.projectImage2D(fr['origFrame'], fr['ref2world'], refColor, buffers=projectBuffers)
+
+        frameTimes.append(time.time() - startTime)
+        allocBytes.append(tracemalloc.get_traced_memory()[1] - startBytes)
+    tracemalloc.stop()
+    vid.release()
+
+    return {'mode': mode,
+            'nFrames': len(frameTimes),
+            'allocMB': float(np.median(allocBytes)) / 1e6,
+            'peakRSS': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,   # KB on linux
+            'sPerFrame': float(np.median(frameTimes))}
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--nFrames', type=int, default=50, help='number of frames to process [default: 50]')
+    parser.add_argument('--worldCameraVid', default=join(testDataDir, 'worldCamera.mp4'),
+                        help='world camera video [default: test data]')
+    parser.add_argument('--referenceImage', default=join(testDataDir, 'referenceImage.jpg'),
+                        help='reference image [default: test data]')
+    parser.add_argument('--mode', choices=MODES, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    # worker: run a single mode and print the measurements as json
+    if args.mode is not None:
+        logging.getLogger('mapGaze').disabled = True
+        print(json.dumps(runFrames(args.mode, args.worldCameraVid, args.referenceImage, args.nFrames)))
+        sys.exit()
+
+    # run every mode in its own process, so peak RSS isn't shared
+    results = []
+    for mode in MODES:
+        output = subprocess.check_output([sys.executable, '-m', 'mobileGazeMapping.benchmarks.frameMemory',
+                                          '--mode', mode,
+                                          '--nFrames', str(args.nFrames),
+                                          '--worldCameraVid', args.worldCameraVid,
+                                          '--referenceImage', args.referenceImage], cwd=repoDir)
+        results.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    print('{:<12}{:>8}{:>12}{:>12}{:>12}'.format('mode', 'frames', 'allocMB', 'peakRSS', 'sPerFrame'))
+    for r in results:
+        print('{mode:<12}{nFrames:>8}{allocMB:>12.2f}{peakRSS:>12.1f}{sPerFrame:>12.3f}'.format(**r))
+
+
+if __name__ == '__main__':
+    main()
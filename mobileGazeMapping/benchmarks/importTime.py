@@ -0,0 +1,89 @@
+""" Benchmark the startup cost of the command line subcommands
+
+Runs each subcommand with --help in a fresh interpreter (ignoring PYTHON*
+environment variables), and reports:
+    seconds - time from the start of the interpreter's first statement to the
+              end of the subcommand's help
+    wall - wall time of the whole process, incl. interpreter startup
+    heavy - which of the heavy dependencies (NumPy, pandas, OpenCV, msgpack)
+            ended up imported
+
+alongside a baseline of importing all of the heavy dependencies up front, as
+the scripts used to.
+
+Usage:
+    mobileGazeMapping bench imports [--repeat N]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+from .. import cli
+
+# dir the package is in, so the fresh interpreters import this copy of it
+packageRoot = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HEAVY_MODULES = ['numpy', 'pandas', 'cv2', 'msgpack']
+
+# run in the fresh interpreter: {setup} imports and runs what's measured
+TIMING_CODE = '''
+import sys, time, json
+t0 = time.perf_counter()
+sys.path.insert(0, {packageRoot!r})
+try:
+    {setup}
+except SystemExit:
+    pass
+sys.stdout = sys.__stdout__
+print(json.dumps({{'seconds': time.perf_counter() - t0,
+                  'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def timeStartup(argv=None, setup=None):
+    """ Time running the CLI with argv (or the setup statement) in a fresh
+    interpreter; returns a dict of seconds, wall, and heavy (see module docs) """
+    if setup is None:
+        setup = 'import io; from mobileGazeMapping import cli; sys.stdout = io.StringIO(); cli.main({!r})'.format(
+            list(argv))
+    code = TIMING_CODE.format(packageRoot=packageRoot, setup=setup, heavy=HEAVY_MODULES)
+    t0 = time.time()
+    output = subprocess.check_output([sys.executable, '-E', '-c', code])
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    result['wall'] = time.time() - t0
+    return result
+
+
+def entries():
+    """ (name, argv) of the --help of every subcommand """
+    return [('--help', ['--help'])] + [(command, command.split() + ['--help']) for command in sorted(cli.COMMANDS)]
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each subcommand (the fastest is shown) [default: 3]')
+    args = parser.parse_args(argv)
+
+    runs = [(name, lambda argv=argv: timeStartup(argv)) for name, argv in entries()]
+    runs.append(('eager imports', lambda: timeStartup(setup='import {}'.format(', '.join(HEAVY_MODULES)))))
+
+    print('{:<22}{:>10}{:>10}  {}'.format('command', 'seconds', 'wall', 'heavy'))
+    for name, run in runs:
+        results = [run() for i in range(args.repeat)]
+        best = min(results, key=lambda r: r['seconds'])
+        print('{:<22}{:>10.3f}{:>10.3f}  {}'.format(name, best['seconds'], min(r['wall'] for r in results),
+                                                    ', '.join(best['heavy']) or '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+""" Regression test the mapping modes against golden outputs
+
+Maps a set of recordings in every mapping mode and compares the homographies
+and mapped gaze of each to golden outputs of the baseline (serial, default
+settings) mapping, so the speed of a faster mode can be weighed against
+exactly how far its results move:
+    serial - default settings, one recording after another (the baseline)
+    parallel - default settings, the recordings mapped concurrently, each
+               process with its share of the cores
+    guided - guided matching (matchSettings={'guided': True})
+    prefilter - frames checked for the reference image(s) first
+    dedup - repeated frames reuse the last registered frame's homographies
+    fastFlann - fewer FLANN checks (matchSettings={'checks': 4})
+
+Each mode is compared to the golden outputs on:
+    homographyError - max distance (world camera px), over all frames, between
+                      the reference image corners projected with the mode's
+                      and the golden homography
+    gazeError - max distance (reference image px) between the mode's and the
+                golden mapped gaze, over samples mapped in both
+    frameMismatch - fraction of frames the reference was found on in one of
+                    them but not the other
+and passes if all of them are within its tolerances (see MODES). Its speedup
+is the serial mapping time over its own.
+
+Golden outputs (homographies.npz and gazeData_mapped.tsv of every recording,
+in <goldenDir>/<recording name>/) are written with --update, which maps the
+recordings in the serial mode. Mapping runs in a temporary directory that is
+removed afterwards.
+
+Usage:
+    mobileGazeMapping bench regression [--golden DIR] [--update]
+                                       [--modes MODE [MODE ...]]
+                                       [--nFrames N]
+                                       [--recording NAME GAZE VID REF]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from os.path import join
+
+from ..lazyImport import lazyImport
+from .. import mapGaze
+from .. import threadTuning
+
+np = lazyImport('numpy')
+pd = lazyImport('pandas')
+cv2 = lazyImport('cv2')
+
+# mapping modes: GazeMapper keyword arguments, number of recordings mapped
+# at once, and tolerances for the comparison with the golden outputs
+MODES = {'serial': {'settings': {},
+                    'processes': 1,
+                    'tolerance': {'homographyError': 1.0, 'gazeError': 1.0, 'frameMismatch': 0.0}},
+         'parallel': {'settings': {},
+                      'processes': None,       # one per recording
+                      'tolerance': {'homographyError': 1.0, 'gazeError': 1.0, 'frameMismatch': 0.0}},
+         'guided': {'settings': {'matchSettings': {'guided': True}},
+                    'processes': 1,
+                    'tolerance': {'homographyError': 5.0, 'gazeError': 5.0, 'frameMismatch': 0.05}},
+         'prefilter': {'settings': {'prefilter': {}},
+                       'processes': 1,
+                       'tolerance': {'homographyError': 1.0, 'gazeError': 1.0, 'frameMismatch': 0.0}},
+         'dedup': {'settings': {'dedup': {}},
+                   'processes': 1,
+                   'tolerance': {'homographyError': 1.0, 'gazeError': 1.0, 'frameMismatch': 0.0}},
+         'fastFlann': {'settings': {'matchSettings': {'checks': 4}},
+                       'processes': 1,
+                       'tolerance': {'homographyError': 5.0, 'gazeError': 5.0, 'frameMismatch': 0.05}}}
+
+BASELINE = 'serial'
+
+# test data of a source checkout
+repoDir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+testDataDir = join(repoDir, 'tests')
+TEST_RECORDINGS = [{'name': 'testRecording',
+                    'gazeData': join(testDataDir, 'gazeData_world.tsv'),
+                    'worldCameraVid': join(testDataDir, 'worldCamera.mp4'),
+                    'referenceImage': [join(testDataDir, 'referenceImage.jpg')]}]
+
+
+def _mapRecording(recording, outputDir, nFrames, settings, threads=None):
+    """ Map a recording (without the preview videos). Returns the seconds it
+    took """
+    logger = logging.getLogger('mapGaze')
+    wasDisabled, logger.disabled = logger.disabled, True
+    try:
+        startTime = time.time()
+        mapper = mapGaze.GazeMapper(recording['referenceImage'], videoSettings={'layout': 'none'}, threads=threads,
+                                    **settings)
+        mapper.map_recording(recording['gazeData'], recording['worldCameraVid'], outputDir, nFrames=nFrames)
+        return time.time() - startTime
+    finally:
+        logger.disabled = wasDisabled
+
+
+def runMode(mode, recordings, workDir, nFrames=None):
+    """ Map every recording in a mode, into <workDir>/<mode>/<recording name>.
+    Returns the total (wall clock) seconds """
+    modeSettings = MODES[mode]
+    outputDirs = [join(workDir, mode, recording['name']) for recording in recordings]
+    processes = modeSettings['processes'] or len(recordings)
+
+    startTime = time.time()
+    if processes == 1:
+        for recording, outputDir in zip(recordings, outputDirs):
+            _mapRecording(recording, outputDir, nFrames, modeSettings['settings'])
+    else:
+        threads = threadTuning.splitCores(processes)
+        with threadTuning.spawnExecutor(processes) as pool:
+            jobs = [pool.submit(_mapRecording, recording, outputDir, nFrames, modeSettings['settings'], threads)
+                    for recording, outputDir in zip(recordings, outputDirs)]
+            [job.result() for job in jobs]
+    return time.time() - startTime
+
+
+def readOutputs(outputDir):
+    """ world2ref homographies ({reference name: (nFrames, 3, 3) array}) and
+    mapped gaze of a mapped recording """
+    with np.load(join(outputDir, 'homographies.npz')) as homographies:
+        homographies = {name: homographies[name] for name in homographies.files}
+    gaze = pd.read_table(join(outputDir, 'gazeData_mapped.tsv'))
+    return homographies, gaze
+
+
+def _projectedCorners(world2ref, refSize):
+    """ (nFrames, 4, 2) reference image corners projected into the frames with
+    the inverse of each world2ref homography (nan where it is missing) """
+    w, h = refSize
+    corners = np.array([[0, 0, 1], [w, 0, 1], [w, h, 1], [0, h, 1]], dtype=np.float64)
+    valid = np.isfinite(world2ref).all(axis=(1, 2))
+    projected = np.full((world2ref.shape[0], 4, 2), np.nan)
+    if valid.any():
+        ref2world = np.linalg.inv(world2ref[valid])
+        points = np.einsum('fij,cj->fci', ref2world, corners)
+        projected[valid] = points[..., :2] / points[..., 2:]
+    return projected
+
+
+def compareOutputs(golden, candidate, refSizes):
+    """ Compare a recording's mapping outputs to the golden ones
+
+    Parameters
+    ----------
+    golden, candidate : tuple
+        (homographies, gaze) of each, as returned by readOutputs
+    refSizes : dict
+        (width, height) of each reference image, by name
+
+    Returns
+    -------
+    errors : dict
+        'homographyError', 'gazeError', and 'frameMismatch' (see the module
+        docstring)
+
+    """
+    goldenH, goldenGaze = golden
+    candidateH, candidateGaze = candidate
+    if sorted(goldenH) != sorted(candidateH):
+        raise ValueError('reference images differ: {} vs {}'.format(sorted(goldenH), sorted(candidateH)))
+
+    homographyError, nMismatched, nFrames = 0.0, 0, 0
+    for name in goldenH:
+        if goldenH[name].shape != candidateH[name].shape:
+            raise ValueError('number of frames differs: {} vs {}'.format(goldenH[name].shape[0],
+                                                                        candidateH[name].shape[0]))
+        goldenCorners = _projectedCorners(goldenH[name], refSizes[name])
+        candidateCorners = _projectedCorners(candidateH[name], refSizes[name])
+        goldenFound = np.isfinite(goldenCorners).all(axis=(1, 2))
+        candidateFound = np.isfinite(candidateCorners).all(axis=(1, 2))
+        both = goldenFound & candidateFound
+        if both.any():
+            distances = np.hypot(*(goldenCorners[both] - candidateCorners[both]).transpose(2, 0, 1))
+            homographyError = max(homographyError, float(distances.max()))
+        nMismatched += int((goldenFound != candidateFound).sum())
+        nFrames += goldenFound.shape[0]
+
+    if len(goldenGaze) != len(candidateGaze):
+        raise ValueError('number of gaze samples differs: {} vs {}'.format(len(goldenGaze), len(candidateGaze)))
+    gazeDistance = np.hypot(goldenGaze['ref_gazeX'].values - candidateGaze['ref_gazeX'].values,
+                            goldenGaze['ref_gazeY'].values - candidateGaze['ref_gazeY'].values)
+    gazeDistance = gazeDistance[np.isfinite(gazeDistance)]
+
+    return {'homographyError': homographyError,
+            'gazeError': float(gazeDistance.max()) if len(gazeDistance) > 0 else 0.0,
+            'frameMismatch': nMismatched / max(1, nFrames)}
+
+
+def withinTolerance(errors, tolerance):
+    """ True if every error is within its tolerance """
+    return all(errors[key] <= tolerance[key] for key in tolerance)
+
+
+def _refSizes(recording):
+    """ (width, height) of each of a recording's reference images, by the
+    name GazeMapper gives them """
+    sizes = {}
+    for path in recording['referenceImage']:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name in sizes:
+            name = '{}_{}'.format(name, len(sizes))
+        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise IOError('could not read reference image {}'.format(path))
+        sizes[name] = (img.shape[1], img.shape[0])
+    return sizes
+
+
+def writeGolden(recordings, goldenDir, nFrames=None):
+    """ Map the recordings in the baseline mode and store their homographies
+    and mapped gaze as the golden outputs """
+    workDir = tempfile.mkdtemp(prefix='mapGazeGolden')
+    try:
+        runMode(BASELINE, recordings, workDir, nFrames)
+        for recording in recordings:
+            recordingDir = join(goldenDir, recording['name'])
+            if not os.path.isdir(recordingDir):
+                os.makedirs(recordingDir)
+            for f in ['homographies.npz', 'gazeData_mapped.tsv']:
+                shutil.copy(join(workDir, BASELINE, recording['name'], f), recordingDir)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+
+def runHarness(recordings, goldenDir, modes=None, nFrames=None):
+    """ Map the recordings in every mode and compare them to the golden
+    outputs
+
+    The baseline mode is always run as well, to time the speedups against.
+
+    Parameters
+    ----------
+    recordings : list of dicts
+        'name', 'gazeData', 'worldCameraVid', and 'referenceImage' (list of
+        paths) of each recording
+    goldenDir : string
+        directory with the golden outputs (see writeGolden)
+    modes : list of strings, optional
+        modes to run (default: all of MODES)
+    nFrames : int, optional
+        only map the first nFrames frames of every recording (has to match
+        the golden outputs)
+
+    Returns
+    -------
+    results : list of dicts
+        'mode', 'seconds', 'speedup', the largest of each error over the
+        recordings, and 'passed', for every mode
+
+    """
+    modes = list(modes or sorted(MODES, key=lambda mode: mode != BASELINE))
+    if BASELINE not in modes:
+        modes.insert(0, BASELINE)
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        raise ValueError('unknown modes: {} (options: {})'.format(unknown, sorted(MODES)))
+
+    golden = {recording['name']: readOutputs(join(goldenDir, recording['name'])) for recording in recordings}
+    refSizes = {recording['name']: _refSizes(recording) for recording in recordings}
+
+    workDir = tempfile.mkdtemp(prefix='mapGazeRegression')
+    results = []
+    try:
+        for mode in modes:
+            seconds = runMode(mode, recordings, workDir, nFrames)
+            errors = [compareOutputs(golden[recording['name']],
+                                     readOutputs(join(workDir, mode, recording['name'])),
+                                     refSizes[recording['name']])
+                      for recording in recordings]
+            worst = {key: max(e[key] for e in errors) for key in errors[0]}
+            results.append(dict(worst, mode=mode, seconds=seconds,
+                                passed=withinTolerance(worst, MODES[mode]['tolerance'])))
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    baselineSeconds = results[modes.index(BASELINE)]['seconds']
+    for result in results:
+        result['speedup'] = baselineSeconds / result['seconds']
+    return results
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--golden', default=join(testDataDir, 'golden'),
+                        help='directory of the golden outputs [default: tests/golden]')
+    parser.add_argument('--update', action='store_true',
+                        help='(re)write the golden outputs with the serial mode, instead of comparing to them')
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=None,
+                        help='modes to run [default: all]')
+    parser.add_argument('--nFrames', type=int, default=10, help='frames mapped per recording [default: 10]')
+    parser.add_argument('--recording', nargs=4, action='append', metavar=('NAME', 'GAZE', 'VID', 'REF'),
+                        help='recording to map (repeat for more) [default: test data]')
+    args = parser.parse_args(argv)
+
+    recordings = TEST_RECORDINGS
+    if args.recording:
+        recordings = [{'name': name, 'gazeData': gaze, 'worldCameraVid': vid, 'referenceImage': [ref]}
+                      for name, gaze, vid, ref in args.recording]
+
+    if args.update:
+        writeGolden(recordings, args.golden, args.nFrames)
+        print('golden outputs written to {}'.format(args.golden))
+        return
+
+    results = runHarness(recordings, args.golden, args.modes, args.nFrames)
+    print('{:<12}{:>10}{:>10}{:>12}{:>12}{:>12}{:>8}'.format('mode', 'seconds', 'speedup', 'homogError',
+                                                             'gazeError', 'mismatch', 'passed'))
+    for r in results:
+        print('{mode:<12}{seconds:>10.2f}{speedup:>10.2f}{homographyError:>12.3f}{gazeError:>12.3f}'
+              '{frameMismatch:>12.3f}{passed!s:>8}'.format(**r))
+    if not all(r['passed'] for r in results):
+        sys.exit(1)
+    return results
+
+
+if __name__ == '__main__':
+    main()
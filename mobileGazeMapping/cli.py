@@ -0,0 +1,87 @@
+""" Command line interface for mapping, analysis, and preprocessing
+
+Runs each of the package's scripts as a subcommand, with the same arguments:
+
+    mobileGazeMapping map gazeData worldCameraVid referenceImage [...]
+    mobileGazeMapping preprocess {pl,smi,tobii,batch} ...
+    mobileGazeMapping bench {frameMemory,analysis,imports,regression} ...
+
+(or `python -m mobileGazeMapping ...`). `mobileGazeMapping --help` lists all
+of the subcommands.
+
+Only the script for the subcommand is imported, and the scripts import NumPy,
+pandas, OpenCV, and msgpack on first use (see lazyImport), so `--help`, a bad
+argument, or a job that doesn't need some of them doesn't pay to import them.
+`mobileGazeMapping bench imports` reports the import cost of every subcommand.
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import argparse
+import importlib
+
+# subcommand: (script module, within this package; description)
+COMMANDS = {'map': ('mapGaze', 'map gaze data from the world camera to the reference image(s)'),
+            'smooth': ('homographySmoothing', 'smooth the homographies of a mapped recording and remap its gaze'),
+            'remap': ('remapGaze', 'remap gaze data with the homographies of an earlier mapping'),
+            'heatmap': ('gazeHeatmap', 'gaze density heatmaps of a mapped recording'),
+            'analyze': ('gazeAnalysis', 'fixations and AOI statistics of mapped recordings'),
+            'stream': ('gazeStream', 'map a recording replayed as a live stream'),
+            'serve': ('mapGazeService', 'run the mapping service'),
+            'pipeline': ('pipeline', 'preprocess (and map) many recordings, overlapping the stages'),
+            'preprocessAndMap': ('preprocessAndMap', 'preprocess and map a recording in one step'),
+            'gazeArrays': ('gazeData', 'convert a gaze data file to memory-mapped arrays for long recordings'),
+            'tune': ('threadTuning', 'find the process/thread split with the highest mapping throughput'),
+            'preprocess pl': ('preprocessing.pl_preprocessing', 'preprocess a Pupil Labs recording'),
+            'preprocess smi': ('preprocessing.smi_preprocessing', 'preprocess an SMI recording'),
+            'preprocess tobii': ('preprocessing.tobii_preprocessing', 'preprocess a Tobii recording'),
+            'preprocess batch': ('preprocessing.batch_preprocessing',
+                                 'preprocess many recordings (any mix of devices) in parallel'),
+            'bench frameMemory': ('benchmarks.frameMemory', 'memory used per frame by the mapping loop'),
+            'bench analysis': ('benchmarks.analysis', 'fixation and AOI analysis speed'),
+            'bench imports': ('benchmarks.importTime', 'import time of every subcommand'),
+            'bench regression': ('benchmarks.regression',
+                                 'speed and accuracy of every mapping mode against golden outputs')}
+
+
+def loadCommand(command):
+    """ Import the script module that runs a subcommand """
+    return importlib.import_module('.' + COMMANDS[command][0], __package__)
+
+
+def commandParser(prog, group=None):
+    """ Parser that lists the subcommands (of a group, e.g. 'preprocess') """
+    commands = [c for c in sorted(COMMANDS) if group is None or c.split()[0] == group]
+    width = max(len(c) for c in commands)
+    epilog = 'commands:\n' + '\n'.join('  {:<{}}  {}'.format(c, width, COMMANDS[c][1]) for c in commands)
+    parser = argparse.ArgumentParser(prog=prog if group is None else '{} {}'.format(prog, group),
+                                     formatter_class=argparse.RawDescriptionHelpFormatter, epilog=epilog)
+    parser.add_argument('command', choices=sorted(set(c.split()[-1] if group else c.split()[0]
+                                                      for c in commands)))
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='arguments of the command (see COMMAND --help)')
+    return parser
+
+
+def main(argv=None, prog=None):
+    """ Run a subcommand, with argv in place of sys.argv[1:] """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    prog = prog or os.path.basename(sys.argv[0])
+
+    for nWords in [2, 1]:
+        command = ' '.join(argv[:nWords])
+        if len(argv) >= nWords and command in COMMANDS:
+            return loadCommand(command).main(argv[nWords:], prog='{} {}'.format(prog, command))
+
+    # not a full command: show the commands (of a group), or an error
+    groups = set(c.split()[0] for c in COMMANDS if ' ' in c)
+    if len(argv) > 0 and argv[0] in groups:
+        commandParser(prog, argv[0]).parse_args(argv[1:])
+    commandParser(prog).parse_args(argv)
+
+
+if __name__ == '__main__':
+    main()
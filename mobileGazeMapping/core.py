@@ -0,0 +1,103 @@
+""" Video and feature helpers shared by mapping and every device's preprocessing
+
+Everything that depends on which version of OpenCV is installed lives here,
+so the rest of the package doesn't need to branch on it:
+    - opening videos and reading their frame count, size, and frame rate
+    - writing the preview videos
+    - reading the timestamp of every frame of a video
+    - creating the feature detector
+
+(the gaze table every device's preprocessing produces is gazeData.GazeData)
+
+Any version of OpenCV from 3 on has the same API for all of these (OpenCV 2's
+`cv2.cv` constants are still supported as a fallback).
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+from .lazyImport import lazyImport
+
+np = lazyImport('numpy')
+cv2 = lazyImport('cv2')
+
+
+def opencvVersion():
+    """ (major, minor) version of the installed OpenCV """
+    return tuple(int(v) for v in cv2.__version__.split('.')[:2])
+
+
+def _capProp(name):
+    """ OpenCV VideoCapture property id, e.g. _capProp('FPS') """
+    if hasattr(cv2, 'CAP_PROP_' + name):
+        return getattr(cv2, 'CAP_PROP_' + name)
+    return getattr(cv2.cv, 'CV_CAP_PROP_' + name)
+
+
+def fourcc(code):
+    """ OpenCV video codec id of a four character code, e.g. 'mp4v' """
+    if hasattr(cv2, 'VideoWriter_fourcc'):
+        return cv2.VideoWriter_fourcc(*code)
+    return cv2.cv.CV_FOURCC(*code)
+
+
+def openVideo(path):
+    """ Open a video for reading, raising an IOError if it can't be opened """
+    vid = cv2.VideoCapture(path)
+    if not vid.isOpened():
+        raise IOError('could not open video {}'.format(path))
+    return vid
+
+
+def videoProperties(vid):
+    """ Frame count, (width, height), and frame rate of an open video """
+    return (int(vid.get(_capProp('FRAME_COUNT'))),
+            (int(vid.get(_capProp('FRAME_WIDTH'))), int(vid.get(_capProp('FRAME_HEIGHT')))),
+            vid.get(_capProp('FPS')))
+
+
+def videoSize(path):
+    """ (width, height) of the frames of a video file """
+    vid = openVideo(path)
+    try:
+        return videoProperties(vid)[1]
+    finally:
+        vid.release()
+
+
+def openVideoWriter(path, fps, size, codec='mp4v'):
+    """ Open a color video file for writing """
+    writer = cv2.VideoWriter()
+    writer.open(path, fourcc(codec), fps, size, True)
+    return writer
+
+
+def getVidFrameTimestamps(vid_file):
+    """ Array of the timestamp (ms) of every frame of a video
+
+    Frames are grabbed without being converted to images, which is all that's
+    needed for their timestamps.
+
+    """
+    vid = openVideo(vid_file)
+    posMsec = _capProp('POS_MSEC')
+    frame_ts = []
+    while vid.grab():
+        frame_ts.append(vid.get(posMsec))
+    vid.release()
+    return np.array(frame_ts, dtype=np.float64)
+
+
+def createFeatureDetector():
+    """ Create the SIFT feature detector for the installed version of OpenCV
+
+    SIFT is part of the main OpenCV module from 4.4 on, and in the contrib
+    xfeatures2d module before that (OpenCV 2 has its own constructor).
+
+    """
+    if hasattr(cv2, 'SIFT_create'):
+        return cv2.SIFT_create()
+    if hasattr(cv2, 'xfeatures2d'):
+        return cv2.xfeatures2d.SIFT_create()
+    return cv2.SIFT()
@@ -0,0 +1,81 @@
+""" Detect world camera frames that repeat the last registered frame
+
+Some world cameras record runs of identical or nearly identical frames (SMI
+recordings repeat frames often enough that smi_preprocessing relabels
+duplicate frame numbers). Registering each of them again finds the same
+homography at the full cost of a frame, so the mapping can reuse the
+homography of the last registered frame instead.
+
+Frames are compared on thumbnails: the grayscale frame scaled down to width
+pixels (area interpolation, which also averages out most compression noise).
+A frame is a duplicate if no thumbnail pixel differs from the thumbnail of
+the last registered frame by more than threshold gray levels. Comparing to
+the last registered frame, rather than to the previous frame, keeps slow
+camera motion from building up over a run of reused frames.
+
+On the test recording, re-encoded copies of a frame differ by at most 2 gray
+levels, and consecutive frames of the (slowly moving) camera by at least 5.
+
+Settings (see DEFAULT_DEDUP):
+    width - width (px) of the thumbnails
+    threshold - max difference (gray levels) of any thumbnail pixel for a
+                frame to count as a duplicate
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+from .lazyImport import lazyImport
+
+np = lazyImport('numpy')
+cv2 = lazyImport('cv2')
+
+DEFAULT_DEDUP = {'width': 64,
+                 'threshold': 3}
+
+
+def getDedupSettings(settings=None):
+    """ Return a complete dedup settings dict, filling in defaults for any
+    missing keys """
+    fullSettings = dict(DEFAULT_DEDUP)
+    if settings is not None:
+        unknown = set(settings) - set(fullSettings)
+        if len(unknown) > 0:
+            raise ValueError('unknown dedup settings: {}'.format(sorted(unknown)))
+        fullSettings.update(settings)
+    if int(fullSettings['width']) != fullSettings['width'] or fullSettings['width'] < 1:
+        raise ValueError('width must be a positive integer (got {})'.format(fullSettings['width']))
+    if fullSettings['threshold'] < 0:
+        raise ValueError('threshold must be >= 0 (got {})'.format(fullSettings['threshold']))
+    return fullSettings
+
+
+def thumbnail(frame_gray, width):
+    """ grayscale frame scaled down to width pixels """
+    height = max(1, int(round(frame_gray.shape[0] * width / frame_gray.shape[1])))
+    return cv2.resize(frame_gray, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class FrameDeduplicator(object):
+    """ Compares frames to the last registered frame
+
+    Parameters
+    ----------
+    settings : dict, optional
+        dedup settings (see DEFAULT_DEDUP)
+
+    """
+    def __init__(self, settings=None):
+        self.settings = getDedupSettings(settings)
+
+    def thumbnail(self, frame_gray):
+        """ thumbnail of a grayscale frame to compare to others """
+        return thumbnail(frame_gray, self.settings['width'])
+
+    def isDuplicate(self, thumb, registeredThumb):
+        """ True if a frame's thumbnail matches that of the last registered
+        frame (None if there isn't one) """
+        if registeredThumb is None or thumb.shape != registeredThumb.shape:
+            return False
+        return cv2.norm(thumb, registeredThumb, cv2.NORM_INF) <= self.settings['threshold']
@@ -0,0 +1,602 @@
+""" Fixation and area-of-interest (AOI) analysis of mapped gaze
+
+Works on the mapped gaze of one or many recordings (gazeData_mapped.tsv
+files, or arrays already in memory), with every step vectorized over all of
+the samples at once, so a whole study can be analyzed in seconds:
+
+    fixations - detected with either
+        I-VT: samples moving slower than velocityThreshold (reference image
+              px/s) are fixation samples, and runs of them lasting at least
+              minDuration (ms) are fixations
+        I-DT: windows of at least minDuration (ms) whose dispersion ((max x -
+              min x) + (max y - min y), reference image px) is at most
+              maxDispersion are fixations, grown for as long as the
+              dispersion stays under the threshold
+    AOIs - polygons on the reference image(s). They are rasterized once into
+           a lookup image (one bit per AOI, so AOIs can overlap), and every
+           sample or fixation is assigned to its AOIs with a single array
+           lookup. Dwell time, sample hits, fixation counts, time to first
+           fixation, etc. are then summed per recording and AOI
+
+Samples are split into segments wherever the recording or reference image
+changes (or, for I-VT, where consecutive samples are more than maxGap ms
+apart), and fixations never span segments. Samples that weren't mapped to the
+reference image (nan coordinates) or below minConfidence break fixations.
+
+AOIs are given as a dict of {aoiName: [[x, y], ...]} polygons (or
+[x, y, width, height] rectangles), or, with several reference images, a dict
+of those per reference image name. loadAOIs reads them from a JSON file.
+
+Outputs (from the command line):
+    fixations.tsv - one row per fixation: recording, refImage, start_ts,
+        end_ts, duration, x, y, nSamples, and (with AOIs) aoi
+    aoiStats.tsv - per recording and AOI: nSamples, dwellTime, nFixations,
+        fixationTime, timeToFirstFixation, firstFixationDuration
+
+Usage:
+    mobileGazeMapping analyze mappedGazeDir [mappedGazeDir ...] [-o OUTPUTDIR]
+                              [--aois AOIS.json] [--method {ivt,idt}]
+                              [--velocityThreshold V] [--maxDispersion D]
+                              [--minDuration MS] [--minConfidence C]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import argparse
+from os.path import join
+
+from .lazyImport import lazyImport
+
+np = lazyImport('numpy')
+pd = lazyImport('pandas')
+cv2 = lazyImport('cv2')
+
+FIXATION_METHODS = ['ivt', 'idt']
+
+# thresholds are in reference image pixels and milliseconds
+DEFAULT_FIXATION_SETTINGS = {'method': 'ivt',
+                             'velocityThreshold': 1000.0,
+                             'maxDispersion': 50.0,
+                             'minDuration': 60.0,
+                             'maxGap': 75.0,
+                             'minConfidence': 0.0}
+
+FIXATION_COLUMNS = ['recording', 'refImage', 'start_ts', 'end_ts', 'duration', 'x', 'y', 'nSamples']
+
+
+def getFixationSettings(settings=None):
+    """ Return the fixation detection settings, filling in defaults for
+    anything unspecified
+
+    Settings
+    --------
+    method : string
+        'ivt' (velocity threshold) or 'idt' (dispersion threshold)
+    velocityThreshold : float
+        I-VT only: max speed (reference image px/s) of a fixation sample
+    maxDispersion : float
+        I-DT only: max dispersion (reference image px) of a fixation
+    minDuration : float
+        shortest fixation (ms)
+    maxGap : float
+        I-VT only: consecutive samples further apart (ms) than this end a
+        fixation
+    minConfidence : float
+        samples with a lower confidence are treated as missing
+
+    """
+    fullSettings = dict(DEFAULT_FIXATION_SETTINGS)
+    if settings is not None:
+        unknown = set(settings) - set(fullSettings)
+        if len(unknown) > 0:
+            raise ValueError('unknown fixation settings: {}'.format(sorted(unknown)))
+        fullSettings.update(settings)
+    if fullSettings['method'] not in FIXATION_METHODS:
+        raise ValueError('unknown fixation method: {} (options: {})'.format(fullSettings['method'],
+                                                                          FIXATION_METHODS))
+    return fullSettings
+
+
+def loadMapped(mappedGazeDirs, smoothed=False):
+    """ Load the mapped gaze of one or more recordings into a single table
+
+    Parameters
+    ----------
+    mappedGazeDirs : string or list of strings
+        mapGaze output dir(s)
+    smoothed : bool, optional
+        load gazeData_mapped_smoothed.tsv instead of gazeData_mapped.tsv
+
+    Returns
+    -------
+    pd.DataFrame
+        columns recording (the output dir), refImage (blank with a single
+        reference image), gaze_ts, confidence, ref_gazeX, ref_gazeY, sorted by
+        recording and timestamp
+
+    """
+    if isinstance(mappedGazeDirs, str):
+        mappedGazeDirs = [mappedGazeDirs]
+    fname = 'gazeData_mapped_smoothed.tsv' if smoothed else 'gazeData_mapped.tsv'
+    cols = ['gaze_ts', 'confidence', 'ref_gazeX', 'ref_gazeY', 'refImage']
+
+    tables = []
+    for mappedGazeDir in mappedGazeDirs:
+        df = pd.read_csv(join(mappedGazeDir, fname), sep='\t', usecols=lambda c: c in cols)
+        if 'refImage' not in df:
+            df['refImage'] = ''
+        df['refImage'] = df['refImage'].fillna('')
+        df.insert(0, 'recording', mappedGazeDir)
+        tables.append(df.sort_values('gaze_ts', kind='mergesort'))
+    return pd.concat(tables, ignore_index=True)[['recording'] + cols]
+
+
+def segmentIds(*keys):
+    """ Id of the run of equal keys each sample belongs to (the keys are
+    arrays of labels, e.g. recording and reference image) """
+    n = len(keys[0])
+    changed = np.zeros(n, dtype=bool)
+    for key in keys:
+        key = np.asarray(key)
+        changed[1:] |= key[1:] != key[:-1]
+    return np.cumsum(changed)
+
+
+def _runs(flags):
+    """ Start and (inclusive) end indices of the runs of True in a boolean array """
+    padded = np.concatenate([[False], flags, [False]])
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[::2], edges[1::2] - 1
+
+
+def _summarize(ts, x, y, starts, ends):
+    """ Fixation table columns for the samples starts[i]:ends[i] (inclusive) """
+    cx, cy = np.concatenate([[0], np.cumsum(x)]), np.concatenate([[0], np.cumsum(y)])
+    nSamples = ends - starts + 1
+    return {'start_ts': ts[starts],
+            'end_ts': ts[ends],
+            'duration': ts[ends] - ts[starts],
+            'x': (cx[ends + 1] - cx[starts]) / nSamples,
+            'y': (cy[ends + 1] - cy[starts]) / nSamples,
+            'nSamples': nSamples}
+
+
+def ivt(ts, x, y, segments=None, velocityThreshold=1000.0, minDuration=60.0, maxGap=75.0):
+    """ I-VT fixation detection
+
+    Parameters
+    ----------
+    ts, x, y : np.ndarray
+        timestamps (ms) and reference image coordinates (px, nan if missing)
+        of the samples, in time order within each segment
+    segments : np.ndarray, optional
+        segment id of every sample (see segmentIds)
+    velocityThreshold, minDuration, maxGap : float, optional
+        see getFixationSettings
+
+    Returns
+    -------
+    starts, ends : np.ndarray
+        index of the first and last sample of every fixation
+
+    """
+    dt = np.diff(ts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.hypot(np.diff(x), np.diff(y)) / dt * 1000
+    # a pair of consecutive samples is slow if both are valid, in the same
+    # segment, close enough in time, and moving slower than the threshold
+    slow = (speed < velocityThreshold) & (dt > 0) & (dt <= maxGap)
+    if segments is not None:
+        slow &= segments[1:] == segments[:-1]
+
+    # runs of slow pairs: pairs s..e cover samples s..e+1
+    starts, ends = _runs(slow)
+    ends = ends + 1
+    keep = ts[ends] - ts[starts] >= minDuration
+    return starts[keep], ends[keep]
+
+
+def idt(ts, x, y, segments=None, maxDispersion=50.0, minDuration=60.0, chunkSize=250000):
+    """ I-DT fixation detection
+
+    The dispersion of the minimum-duration window starting at every sample,
+    and how far each valid window can grow, are computed at once (with
+    cumulative max/min over a block of samples ahead of every window); the
+    search then only has to jump from one fixation to the next valid window.
+
+    Parameters
+    ----------
+    ts, x, y : np.ndarray
+        timestamps (ms) and reference image coordinates (px, nan if missing)
+        of the samples, in time order within each segment
+    segments : np.ndarray, optional
+        segment id of every sample (see segmentIds)
+    maxDispersion, minDuration : float, optional
+        see getFixationSettings
+    chunkSize : int, optional
+        number of windows evaluated at a time (bounds the memory used)
+
+    Returns
+    -------
+    starts, ends : np.ndarray
+        index of the first and last sample of every fixation
+
+    """
+    n = ts.shape[0]
+    if n == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    if segments is None:
+        segments = np.zeros(n, dtype=np.intp)
+    # last sample of each sample's segment
+    changes = np.flatnonzero(segments[1:] != segments[:-1])
+    segLast = np.repeat(np.append(changes, n - 1), np.diff(np.concatenate([[-1], changes, [n - 1]])))
+
+    # end of the shortest window starting at each sample that lasts
+    # minDuration, searched within the sample's segment
+    windowEnd = np.empty(n, dtype=np.intp)
+    first = 0
+    for last in np.append(changes, n - 1):
+        seg = ts[first:last + 1]
+        windowEnd[first:last + 1] = first + np.searchsorted(seg, seg + minDuration)
+        first = last + 1
+    valid = windowEnd <= segLast
+
+    # dispersion of every window (in chunks, padding short windows by
+    # repeating their last sample)
+    width = int(np.max(np.where(valid, windowEnd - np.arange(n), 0))) + 1
+    for c0 in range(0, n, chunkSize):
+        c1 = min(c0 + chunkSize, n)
+        rows = np.arange(c0, c1)
+        # (width, rows) so the reductions run over contiguous rows
+        idx = np.minimum(rows + np.arange(width)[:, None], np.minimum(windowEnd[c0:c1], n - 1))
+        wx, wy = x[idx], y[idx]
+        dispersion = (wx.max(axis=0) - wx.min(axis=0)) + (wy.max(axis=0) - wy.min(axis=0))
+        valid[c0:c1] &= dispersion <= maxDispersion        # nan (missing samples) is invalid
+
+    # how far each valid window can grow before the dispersion exceeds the
+    # threshold (or the segment ends), looking up to `reach` samples ahead.
+    # Windows still growing at the end of the reach are grown later, only if
+    # they start a fixation
+    reach = max(2 * width, 32)
+    validIdx = np.flatnonzero(valid)
+    grownEnd = np.full(n, -1, dtype=np.intp)
+    for c0 in range(0, validIdx.shape[0], chunkSize // reach + 1):
+        rows = validIdx[c0:c0 + chunkSize // reach + 1]
+        rowLast = segLast[rows]
+        maxX, minX, maxY, minY = x[rows], x[rows], y[rows], y[rows]
+        firstOver = np.full(rows.shape[0], reach)
+        for k in range(1, reach):
+            idx = np.minimum(rows + k, rowLast)
+            xk, yk = x[idx], y[idx]
+            np.fmax(maxX, xk, out=maxX)
+            np.fmin(minX, xk, out=minX)
+            np.fmax(maxY, yk, out=maxY)
+            np.fmin(minY, yk, out=minY)
+            over = (maxX - minX + maxY - minY > maxDispersion) | np.isnan(xk) | np.isnan(yk)
+            firstOver[over & (firstOver == reach)] = k      # missing samples end a window too
+            if k % 8 == 0 and (firstOver < reach).all():
+                break
+        ends = np.where(firstOver < reach, rows + firstOver - 1, np.minimum(rows + reach - 1, rowLast))
+        stillGrowing = (firstOver == reach) & (rows + reach - 1 < segLast[rows])
+        grownEnd[rows] = np.where(stillGrowing, -1, ends)
+
+    # first valid window at or after each sample
+    nextValid = np.where(valid, np.arange(n), n)
+    nextValid = np.append(np.minimum.accumulate(nextValid[::-1])[::-1], n).tolist()
+
+    # step from each fixation to the next valid window after it
+    starts, ends = [], []
+    grownEndList = grownEnd.tolist()
+    i = nextValid[0]
+    while i < n:
+        end = grownEndList[i]
+        if end < 0:
+            end = _growWindow(x, y, i, i + reach - 1, segLast[i], maxDispersion)
+        starts.append(i)
+        ends.append(end)
+        i = nextValid[end + 1]
+    return np.array(starts, dtype=np.intp), np.array(ends, dtype=np.intp)
+
+
+def _growWindow(x, y, start, end, last, maxDispersion):
+    """ Grow the window start:end (inclusive) until its dispersion exceeds
+    maxDispersion, or it reaches last. Returns the new end """
+    step = max(end - start, 16)
+    while end < last:
+        stop = min(end + step, last)
+        sx, sy = x[start:stop + 1], y[start:stop + 1]
+        dispersion = (np.fmax.accumulate(sx) - np.fmin.accumulate(sx) +
+                      np.fmax.accumulate(sy) - np.fmin.accumulate(sy))
+        over = (dispersion > maxDispersion) | np.isnan(sx) | np.isnan(sy)
+        over = np.flatnonzero(over[end - start + 1:])
+        if over.shape[0] > 0:
+            return end + over[0]
+        end = stop
+        step *= 2
+    return end
+
+
+def detectFixations(gaze, **settings):
+    """ Detect the fixations in mapped gaze data
+
+    Parameters
+    ----------
+    gaze : pd.DataFrame
+        mapped gaze, e.g. from loadMapped: columns gaze_ts, ref_gazeX,
+        ref_gazeY, and optionally confidence, recording, and refImage. Samples
+        must be in time order within each recording
+    **settings
+        fixation detection settings (see getFixationSettings)
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per fixation, with FIXATION_COLUMNS
+
+    """
+    settings = getFixationSettings(settings)
+    ts = gaze['gaze_ts'].values.astype(np.float64)
+    x = gaze['ref_gazeX'].values.astype(np.float64)
+    y = gaze['ref_gazeY'].values.astype(np.float64)
+    if 'confidence' in gaze and settings['minConfidence'] > 0:
+        lowConfidence = gaze['confidence'].values < settings['minConfidence']
+        x, y = np.where(lowConfidence, np.nan, x), np.where(lowConfidence, np.nan, y)
+    recording = gaze['recording'].values if 'recording' in gaze else np.zeros(len(gaze), dtype=int)
+    refImage = gaze['refImage'].values if 'refImage' in gaze else np.zeros(len(gaze), dtype=int)
+    segments = segmentIds(recording, refImage)
+
+    if settings['method'] == 'ivt':
+        starts, ends = ivt(ts, x, y, segments, settings['velocityThreshold'], settings['minDuration'],
+                           settings['maxGap'])
+    else:
+        starts, ends = idt(ts, x, y, segments, settings['maxDispersion'], settings['minDuration'])
+
+    fixations = pd.DataFrame(_summarize(ts, np.nan_to_num(x), np.nan_to_num(y), starts, ends))
+    fixations.insert(0, 'recording', recording[starts] if 'recording' in gaze else '')
+    fixations.insert(1, 'refImage', refImage[starts] if 'refImage' in gaze else '')
+    return fixations[FIXATION_COLUMNS]
+
+
+def loadAOIs(path):
+    """ Load AOI definitions from a JSON file (see the module docs) """
+    with open(path) as f:
+        return json.load(f)
+
+
+class AOIIndex(object):
+    """ Raster lookup of the AOIs on a reference image
+
+    Parameters
+    ----------
+    aois : dict
+        {aoiName: polygon} with polygons as [[x, y], ...] vertex lists, or
+        [x, y, width, height] rectangles, in reference image pixels
+    refSize : tuple
+        (width, height) of the reference image
+    cellSize : int, optional
+        size (px) of the raster cells; larger cells use less memory but
+        blur the AOI edges
+
+    """
+    def __init__(self, aois, refSize, cellSize=1):
+        self.names = list(aois)
+        self.refSize = refSize
+        self.cellSize = int(cellSize)
+        shape = (-(-refSize[1] // self.cellSize), -(-refSize[0] // self.cellSize))
+
+        # one bit per AOI, 64 AOIs per plane
+        self.planes = [np.zeros(shape, dtype=np.uint64) for i in range(-(-len(self.names) // 64))]
+        mask = np.zeros(shape, dtype=np.uint8)
+        for k, name in enumerate(self.names):
+            polygon = np.asarray(aois[name], dtype=np.float64)
+            mask[:] = 0
+            if polygon.ndim == 1:
+                # rectangles cover the cells of pixels x to x + width - 1
+                px, py, w, h = polygon / self.cellSize
+                mask[max(int(py), 0):int(np.ceil(py + h)), max(int(px), 0):int(np.ceil(px + w))] = 1
+            else:
+                cv2.fillPoly(mask, [np.round(polygon / self.cellSize * 16).astype(np.int32).reshape(-1, 1, 2)],
+                             1, cv2.LINE_8, 4)
+            self.planes[k // 64] |= mask.astype(np.uint64) << np.uint64(k % 64)
+
+    def lookup(self, x, y):
+        """ (n, nAOIs) boolean array of which AOIs each (x, y) point is in """
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        inside = (x >= 0) & (x < self.refSize[0]) & (y >= 0) & (y < self.refSize[1])
+        col = np.where(inside, x, 0).astype(np.intp) // self.cellSize
+        row = np.where(inside, y, 0).astype(np.intp) // self.cellSize
+        shifts = np.arange(64, dtype=np.uint64)
+        hits = []
+        for plane in self.planes:
+            bits = np.where(inside, plane[row, col], np.uint64(0))
+            hits.append((bits[:, None] >> shifts) & np.uint64(1))
+        return np.concatenate(hits, axis=1)[:, :len(self.names)].astype(bool)
+
+
+def _aoisByRef(aois, refNames):
+    """ AOI definitions keyed by reference image name """
+    values = list(aois.values())
+    if len(values) > 0 and isinstance(values[0], dict):
+        return aois
+    return {name: aois for name in refNames}
+
+
+def aoiStats(gaze, fixations, aois, refSizes, maxGap=75.0, cellSize=1):
+    """ Per recording and AOI gaze statistics
+
+    Parameters
+    ----------
+    gaze : pd.DataFrame
+        mapped gaze (see detectFixations)
+    fixations : pd.DataFrame
+        fixations detected in the gaze (see detectFixations)
+    aois : dict
+        AOI polygons (see the module docs)
+    refSizes : dict or tuple
+        (width, height) of each reference image, by name (or of the single
+        reference image)
+    maxGap : float, optional
+        longest time (ms) a sample counts for in the dwell time (the time to
+        the next sample, capped at this)
+    cellSize : int, optional
+        AOI raster cell size (see AOIIndex)
+
+    Returns
+    -------
+    pd.DataFrame
+        per recording, refImage and AOI: nSamples (samples in the AOI),
+        dwellTime (ms), nFixations, fixationTime (ms), timeToFirstFixation
+        (ms from the recording's first sample), firstFixationDuration (ms)
+
+    """
+    n = len(gaze)
+    recording = gaze['recording'].values if 'recording' in gaze else np.zeros(n, dtype=int)
+    refImage = gaze['refImage'].values if 'refImage' in gaze else np.full(n, '', dtype=object)
+    fixRefImage = fixations['refImage'].values
+
+    # recordings as integer codes, shared by the samples and the fixations
+    recCodes, recNames = pd.factorize(recording)
+    fixRecCodes = pd.Index(recNames).get_indexer(fixations['recording'].values if 'recording' in gaze
+                                                 else np.zeros(len(fixations), dtype=int))
+    nRec = len(recNames)
+    refNames = sorted(set(pd.unique(refImage)) | set(pd.unique(fixRefImage)))
+    if not isinstance(refSizes, dict):
+        refSizes = {name: refSizes for name in refNames}
+    aois = _aoisByRef(aois, refNames)
+
+    # time each sample counts for, and when each recording starts
+    ts = gaze['gaze_ts'].values.astype(np.float64)
+    duration = np.zeros(n)
+    duration[:-1] = np.where(recCodes[1:] == recCodes[:-1], np.clip(np.diff(ts), 0, maxGap), 0)
+    recordingStart = np.full(nRec, np.inf)
+    np.minimum.at(recordingStart, recCodes, ts)
+
+    fixStart = fixations['start_ts'].values.astype(np.float64)
+    fixDuration = fixations['duration'].values.astype(np.float64)
+
+    refCodes = pd.Index(refNames).get_indexer(refImage)
+    fixRefCodes = pd.Index(refNames).get_indexer(fixRefImage)
+
+    tables = []
+    for r, refName in enumerate(refNames):
+        if refName not in aois or len(aois[refName]) == 0:
+            continue
+        index = AOIIndex(aois[refName], refSizes[refName], cellSize)
+        nAOIs = len(index.names)
+
+        # (sample, AOI) pairs of every hit, counted per (recording, AOI)
+        onRef = np.flatnonzero(refCodes == r)
+        rows, aoiIdx = np.nonzero(index.lookup(gaze['ref_gazeX'].values[onRef], gaze['ref_gazeY'].values[onRef]))
+        keys = recCodes[onRef[rows]] * nAOIs + aoiIdx
+        nSamples = np.bincount(keys, minlength=nRec * nAOIs)
+        dwellTime = np.bincount(keys, weights=duration[onRef[rows]], minlength=nRec * nAOIs)
+
+        # same for the fixations. They are in time order within each
+        # recording, so the first hit of each (recording, AOI) is the first
+        # fixation in the AOI
+        fixOnRef = np.flatnonzero(fixRefCodes == r)
+        rows, aoiIdx = np.nonzero(index.lookup(fixations['x'].values[fixOnRef], fixations['y'].values[fixOnRef]))
+        hitFix = fixOnRef[rows]
+        keys = fixRecCodes[hitFix] * nAOIs + aoiIdx
+        nFixations = np.bincount(keys, minlength=nRec * nAOIs)
+        fixationTime = np.bincount(keys, weights=fixDuration[hitFix], minlength=nRec * nAOIs)
+        firstKeys, first = np.unique(keys, return_index=True)
+        timeToFirst = np.full(nRec * nAOIs, np.nan)
+        firstDuration = np.full(nRec * nAOIs, np.nan)
+        timeToFirst[firstKeys] = fixStart[hitFix[first]] - recordingStart[firstKeys // nAOIs]
+        firstDuration[firstKeys] = fixDuration[hitFix[first]]
+
+        tables.append(pd.DataFrame({'recording': np.repeat(recNames, nAOIs),
+                                    'refImage': refName,
+                                    'aoi': np.tile(index.names, nRec),
+                                    'nSamples': nSamples,
+                                    'dwellTime': dwellTime,
+                                    'nFixations': nFixations,
+                                    'fixationTime': fixationTime,
+                                    'timeToFirstFixation': timeToFirst,
+                                    'firstFixationDuration': firstDuration}))
+
+    columns = ['recording', 'refImage', 'aoi', 'nSamples', 'dwellTime', 'nFixations', 'fixationTime',
+               'timeToFirstFixation', 'firstFixationDuration']
+    if len(tables) == 0:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(tables, ignore_index=True)[columns]
+
+
+def labelFixations(fixations, aois, refSizes, cellSize=1):
+    """ Add an 'aoi' column naming the AOI(s) each fixation landed in
+    (separated by '|' if AOIs overlap; blank for none) """
+    fixations = fixations.copy()
+    labels = np.full(len(fixations), '', dtype=object)
+    refNames = sorted(pd.unique(fixations['refImage']))
+    if not isinstance(refSizes, dict):
+        refSizes = {name: refSizes for name in refNames}
+    aois = _aoisByRef(aois, refNames)
+    for refName in refNames:
+        if refName not in aois or len(aois[refName]) == 0:
+            continue
+        index = AOIIndex(aois[refName], refSizes[refName], cellSize)
+        onRef = (fixations['refImage'] == refName).values
+        hits = index.lookup(fixations['x'].values[onRef], fixations['y'].values[onRef])
+        labels[onRef] = ['|'.join(np.array(index.names)[h]) for h in hits]
+    fixations['aoi'] = labels
+    return fixations
+
+
+def _refSizes(mappedGazeDir, refNames):
+    """ (width, height) of the reference images, from the copies mapGaze
+    puts in its output dir. With a single reference image (refNames ['']),
+    it's the only image there besides the heatmap """
+    sizes = {}
+    for fname in sorted(os.listdir(mappedGazeDir)):
+        name, ext = os.path.splitext(fname)
+        if ext.lower() not in ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff'] or name.startswith('heatmap'):
+            continue
+        if name not in refNames:
+            if refNames != ['']:
+                continue
+            name = ''
+        image = cv2.imread(join(mappedGazeDir, fname))
+        sizes[name] = (image.shape[1], image.shape[0])
+    return sizes
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('mappedGazeDir', nargs='+', help='mapGaze output dir(s)')
+    parser.add_argument('-o', '--outputDir', default='.', help='where to write the results [default: .]')
+    parser.add_argument('--aois', help='JSON file of AOI polygons on the reference image(s)')
+    parser.add_argument('--smoothed', action='store_true', help='analyze gazeData_mapped_smoothed.tsv')
+    parser.add_argument('--method', choices=FIXATION_METHODS, default=DEFAULT_FIXATION_SETTINGS['method'],
+                        help='fixation detection method [default: ivt]')
+    for setting in ['velocityThreshold', 'maxDispersion', 'minDuration', 'maxGap', 'minConfidence']:
+        parser.add_argument('--' + setting, type=float, default=DEFAULT_FIXATION_SETTINGS[setting],
+                            help='[default: {}]'.format(DEFAULT_FIXATION_SETTINGS[setting]))
+    args = parser.parse_args(argv)
+
+    gaze = loadMapped(args.mappedGazeDir, smoothed=args.smoothed)
+    fixations = detectFixations(gaze, method=args.method, velocityThreshold=args.velocityThreshold,
+                                maxDispersion=args.maxDispersion, minDuration=args.minDuration,
+                                maxGap=args.maxGap, minConfidence=args.minConfidence)
+    print('Found {} fixations in {} samples'.format(len(fixations), len(gaze)))
+
+    if not os.path.isdir(args.outputDir):
+        os.makedirs(args.outputDir)
+    if args.aois is not None:
+        aois = loadAOIs(args.aois)
+        refSizes = _refSizes(args.mappedGazeDir[0], sorted(set(gaze['refImage'])))
+        fixations = labelFixations(fixations, aois, refSizes)
+        stats = aoiStats(gaze, fixations, aois, refSizes, maxGap=args.maxGap)
+        stats.to_csv(join(args.outputDir, 'aoiStats.tsv'), sep='\t', index=False, float_format='%.3f')
+    fixations.to_csv(join(args.outputDir, 'fixations.tsv'), sep='\t', index=False, float_format='%.3f')
+    print('Results saved in: {}'.format(args.outputDir))
+
+
+if __name__ == '__main__':
+    main()
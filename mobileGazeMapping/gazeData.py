@@ -0,0 +1,258 @@
+""" In-memory table of gaze data expressed in world camera coordinates
+
+GazeData holds the same information as a gazeData_world.tsv file (see the
+processRecording docs in mapGaze.py), stored as NumPy columns along with:
+    - an index of where each world camera frame's samples start and stop, so
+      the samples for a single frame can be sliced out without searching
+    - (optionally) the timestamp of every world camera frame
+
+The preprocessing routines return a GazeData object, which can be handed
+directly to mapGaze.processRecording instead of writing the gaze data to disk
+and parsing it back in.
+
+For recordings too long to comfortably hold in memory (e.g. all-day field
+recordings), the gaze data can be stored as a directory of .npy arrays (one
+per column, plus the frame timestamps and the per-frame index), which
+GazeData.load memory-maps: only the pages holding the samples of the frames
+actually being processed are read into memory, and the OS can drop them
+again afterwards. convertFile creates the arrays from a gazeData_world.tsv
+file, reading it in chunks. Anywhere a gaze data file path is accepted
+(GazeData.fromFile, processRecording), the arrays directory can be used
+instead.
+
+Usage:
+    mobileGazeMapping gazeArrays gazeData_world.tsv [frame_timestamps.tsv]
+                                 [-o OUTPUTDIR]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import argparse
+from os.path import join
+
+from .lazyImport import lazyImport
+
+np = lazyImport('numpy')
+pd = lazyImport('pandas')
+
+COLUMNS = ['timestamp', 'frame_idx', 'confidence', 'norm_pos_x', 'norm_pos_y']
+
+# default name of the .npy arrays directory, next to gazeData_world.tsv
+ARRAYS_DIR = 'gazeData_world_arrays'
+
+
+class GazeData(object):
+    """ Gaze samples in world camera coordinates, stored as NumPy columns
+
+    Parameters
+    ----------
+    timestamp : array_like
+        timestamp (ms) of each sample
+    frame_idx : array_like
+        index (0-based) of the world camera frame corresponding to each sample
+    confidence : array_like
+        confidence of the validity of each sample (0-1)
+    norm_pos_x, norm_pos_y : array_like
+        normalized gaze position (0-1) w/r/t the world camera frame width and
+        height
+    frame_timestamps : array_like, optional
+        timestamp (ms) of each world camera frame
+
+    Samples are stored sorted by frame_idx (keeping the original order of the
+    samples within each frame)
+
+    """
+    def __init__(self, timestamp, frame_idx, confidence, norm_pos_x, norm_pos_y, frame_timestamps=None):
+        frame_idx = np.asarray(frame_idx).astype(np.int64)
+        order = np.argsort(frame_idx, kind='mergesort')     # stable
+
+        self.timestamp = np.asarray(timestamp, dtype=np.float64)[order]
+        self.frame_idx = frame_idx[order]
+        self.confidence = np.asarray(confidence, dtype=np.float64)[order]
+        self.norm_pos_x = np.asarray(norm_pos_x, dtype=np.float64)[order]
+        self.norm_pos_y = np.asarray(norm_pos_y, dtype=np.float64)[order]
+        if frame_timestamps is not None:
+            frame_timestamps = np.asarray(frame_timestamps, dtype=np.float64)
+        self.frame_timestamps = frame_timestamps
+
+        # index of the first sample of each frame; samples for frame i are
+        # frameOffsets[i]:frameOffsets[i+1]
+        nFrames = self.frame_idx.max() + 1 if len(self.frame_idx) > 0 else 0
+        if frame_timestamps is not None:
+            nFrames = max(nFrames, len(frame_timestamps))
+        self.frameOffsets = np.searchsorted(self.frame_idx, np.arange(nFrames + 1))
+
+    @classmethod
+    def fromDataFrame(cls, df, frame_timestamps=None):
+        """ Create from a DataFrame with the standard gaze data columns """
+        return cls(*[df[col].values for col in COLUMNS], frame_timestamps=frame_timestamps)
+
+    @classmethod
+    def fromFile(cls, gazeDataFile, frameTimestampsFile=None):
+        """ Load from a gazeData_world.tsv file (and optional
+        frame_timestamps.tsv), or memory-map a directory of arrays written by
+        save() or convertFile() """
+        if os.path.isdir(gazeDataFile):
+            if frameTimestampsFile is not None:
+                raise ValueError('the frame timestamps of a gaze arrays directory are stored in it')
+            return cls.load(gazeDataFile)
+        df = pd.read_table(gazeDataFile, sep='\t')
+        frame_timestamps = None
+        if frameTimestampsFile is not None:
+            frame_timestamps = pd.read_table(frameTimestampsFile, sep='\t')['timestamp'].values
+        return cls.fromDataFrame(df, frame_timestamps)
+
+    def __len__(self):
+        return self.timestamp.shape[0]
+
+    @property
+    def nFrames(self):
+        return self.frameOffsets.shape[0] - 1
+
+    def frameSlice(self, frameIdx):
+        """ Return the slice of samples that belong to the specified frame """
+        if frameIdx < 0 or frameIdx >= self.nFrames:
+            return slice(0, 0)
+        return slice(self.frameOffsets[frameIdx], self.frameOffsets[frameIdx + 1])
+
+    def toDataFrame(self):
+        """ Return the gaze data as a DataFrame with the standard columns """
+        return pd.DataFrame({col: getattr(self, col) for col in COLUMNS})[COLUMNS]
+
+    def write(self, fname, float_format='%.3f'):
+        """ Write the gaze data to a tab separated (gazeData_world.tsv) file """
+        self.toDataFrame().to_csv(fname, sep='\t', index=False, float_format=float_format)
+
+    def save(self, arrayDir):
+        """ Write the columns, frame timestamps, and per-frame index as .npy
+        files in arrayDir, to be memory-mapped by load() """
+        if not os.path.isdir(arrayDir):
+            os.makedirs(arrayDir)
+        for name in COLUMNS + ['frameOffsets']:
+            np.save(join(arrayDir, name + '.npy'), getattr(self, name))
+        if self.frame_timestamps is not None:
+            np.save(join(arrayDir, 'frame_timestamps.npy'), self.frame_timestamps)
+
+    @classmethod
+    def load(cls, arrayDir, mmap=True):
+        """ Load the gaze data from a directory written by save() or
+        convertFile(), memory-mapping the arrays (read-only) unless mmap is
+        False """
+        mode = 'r' if mmap else None
+        gazeData = cls.__new__(cls)
+        for name in COLUMNS + ['frameOffsets']:
+            setattr(gazeData, name, np.load(join(arrayDir, name + '.npy'), mmap_mode=mode))
+        gazeData.frame_timestamps = None
+        if os.path.exists(join(arrayDir, 'frame_timestamps.npy')):
+            gazeData.frame_timestamps = np.load(join(arrayDir, 'frame_timestamps.npy'), mmap_mode=mode)
+        return gazeData
+
+
+def _countRows(tsvFile):
+    """ number of lines after the header of a text table (an upper bound on the
+    number of data rows: blank lines are counted too) """
+    nLines = 0
+    with open(tsvFile, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            nLines += block.count(b'\n')
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            nLines += f.read(1) != b'\n'       # last line without a newline
+    return max(0, nLines - 1)
+
+
+def _truncateArray(array, path, n):
+    """ rewrite the .npy file of a memory-mapped array with only its first n
+    elements, and return it memory-mapped again """
+    tmpPath = path + '.tmp'
+    truncated = np.lib.format.open_memmap(tmpPath, mode='w+', dtype=array.dtype, shape=(n,))
+    truncated[:] = array[:n]
+    truncated.flush()
+    del array, truncated
+    os.replace(tmpPath, path)
+    return np.lib.format.open_memmap(path, mode='r+')
+
+
+def convertFile(gazeDataFile, arrayDir, frameTimestampsFile=None, chunkSize=1000000):
+    """ Convert a gazeData_world.tsv file (and optional frame_timestamps.tsv)
+    to a directory of .npy arrays, and memory-map them
+
+    The file is read chunkSize rows at a time and each chunk written straight
+    into the arrays, so it is never held in memory as a whole. Samples that
+    aren't in frame order are sorted afterwards (which does hold the frame
+    index, and one column at a time, in memory).
+
+    Returns
+    -------
+    gazeData : GazeData
+        the gaze data, memory-mapped from arrayDir (see GazeData.load)
+
+    """
+    if not os.path.isdir(arrayDir):
+        os.makedirs(arrayDir)
+    nRows = _countRows(gazeDataFile)
+    dtypes = {col: np.int64 if col == 'frame_idx' else np.float64 for col in COLUMNS}
+    arrays = {col: np.lib.format.open_memmap(join(arrayDir, col + '.npy'), mode='w+', dtype=dtypes[col],
+                                             shape=(nRows,))
+              for col in COLUMNS}
+
+    start, inOrder, lastFrame = 0, True, None
+    for chunk in pd.read_table(gazeDataFile, sep='\t', chunksize=chunkSize):
+        stop = start + len(chunk)
+        for col in COLUMNS:
+            arrays[col][start:stop] = chunk[col].values
+        frames = chunk['frame_idx'].values
+        if len(frames) > 0:
+            inOrder = inOrder and (np.diff(frames) >= 0).all() and (lastFrame is None or frames[0] >= lastFrame)
+            lastFrame = frames[-1]
+        start = stop
+
+    # blank lines were counted but not parsed
+    if start < nRows:
+        for col in COLUMNS:
+            arrays[col] = _truncateArray(arrays.pop(col), join(arrayDir, col + '.npy'), start)
+        nRows = start
+
+    if not inOrder:
+        order = np.argsort(arrays['frame_idx'], kind='mergesort')       # stable
+        for col in COLUMNS:
+            arrays[col][:] = np.asarray(arrays[col])[order]
+
+    frameIdx = arrays['frame_idx']
+    nFrames = int(frameIdx[-1]) + 1 if nRows > 0 else 0
+    if frameTimestampsFile is not None:
+        frame_timestamps = pd.read_table(frameTimestampsFile, sep='\t')['timestamp'].values.astype(np.float64)
+        np.save(join(arrayDir, 'frame_timestamps.npy'), frame_timestamps)
+        nFrames = max(nFrames, len(frame_timestamps))
+    np.save(join(arrayDir, 'frameOffsets.npy'), np.searchsorted(frameIdx, np.arange(nFrames + 1)))
+    for array in arrays.values():
+        array.flush()
+    del arrays, frameIdx
+
+    return GazeData.load(arrayDir)
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('gazeData', help='path to gazeData_world.tsv file')
+    parser.add_argument('frameTimestamps', nargs='?', default=None, help='path to frame_timestamps.tsv file')
+    parser.add_argument('-o', '--outputDir', default=None,
+                        help='directory to write the arrays to [default: {} next to the gazeData file]'.format(
+                            ARRAYS_DIR))
+    parser.add_argument('--chunkSize', type=int, default=1000000,
+                        help='rows of the gazeData file read at a time [default: 1000000]')
+    args = parser.parse_args(argv)
+
+    outputDir = args.outputDir or join(os.path.dirname(os.path.abspath(args.gazeData)), ARRAYS_DIR)
+    gazeData = convertFile(args.gazeData, outputDir, args.frameTimestamps, args.chunkSize)
+    print('{} samples on {} frames written to {}'.format(len(gazeData), gazeData.nFrames, outputDir))
+    return outputDir
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+""" Gaze density heatmaps on the reference image
+
+Accumulates the mapped gaze into a density grid over the reference image as
+the recording is mapped, so a heatmap doesn't need a second pass over
+gazeData_mapped.tsv (which can run to millions of rows), and memory use stays
+at the size of the grid:
+
+    1. every mapped sample adds its confidence to the bin of the grid it
+       lands in (bins are binSize x binSize reference image pixels; samples
+       below minConfidence, or off the reference image, are left out)
+    2. once all of the samples are in, the grid is blurred with a gaussian
+       (sigma in reference image pixels), and normalized to a 0-1 density
+    3. the density is colored and blended over the reference image
+
+Outputs (written alongside the mapGaze outputs; with multiple reference
+images, one of each per reference, named heatmap_<name>):
+    heatmap.npy - the raw (unblurred) confidence-weighted grid, shape
+        (ceil(height / binSize), ceil(width / binSize))
+    heatmap.png - the reference image with the blurred density overlaid
+
+Heatmaps can also be made from existing mapGaze outputs, reading
+gazeData_mapped.tsv in chunks.
+
+Usage:
+    mobileGazeMapping heatmap mappedGazeDir referenceImage [referenceImage ...]
+                              [--binSize N] [--sigma PX] [--minConfidence C]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import argparse
+from os.path import join
+
+from .lazyImport import lazyImport
+
+np = lazyImport('numpy')
+pd = lazyImport('pandas')
+cv2 = lazyImport('cv2')
+
+DEFAULT_HEATMAP = {'binSize': 4, 'sigma': 30.0, 'minConfidence': 0.0, 'alpha': 0.6}
+
+
+class HeatmapAccumulator(object):
+    """ Confidence-weighted density grid of gaze positions on a reference image
+
+    Parameters
+    ----------
+    refSize : tuple
+        (width, height) of the reference image
+    binSize : int, optional
+        width and height (reference image pixels) of the grid bins
+    sigma : float, optional
+        standard deviation (reference image pixels) of the gaussian blur
+        applied to the grid
+    minConfidence : float, optional
+        samples with a lower confidence are left out
+    alpha : float, optional
+        opacity of the densest part of the heatmap overlay
+
+    """
+    def __init__(self, refSize, binSize=4, sigma=30.0, minConfidence=0.0, alpha=0.6):
+        self.refSize = refSize
+        self.binSize = int(binSize)
+        self.sigma = sigma
+        self.minConfidence = minConfidence
+        self.alpha = alpha
+        self.shape = (-(-refSize[1] // self.binSize), -(-refSize[0] // self.binSize))
+        self.grid = np.zeros(self.shape, dtype=np.float64)
+        self.nSamples = 0
+
+    def add(self, coords, confidence):
+        """ Add (n, 2) reference image gaze coordinates, weighted by their (n,)
+        confidence """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        confidence = np.asarray(confidence, dtype=np.float64).ravel()
+        keep = ((confidence >= self.minConfidence) & (coords[:, 0] >= 0) & (coords[:, 0] < self.refSize[0]) &
+                (coords[:, 1] >= 0) & (coords[:, 1] < self.refSize[1]))
+        if not keep.any():
+            return
+        col = (coords[keep, 0] // self.binSize).astype(np.intp)
+        row = (coords[keep, 1] // self.binSize).astype(np.intp)
+        self.grid += np.bincount(row * self.shape[1] + col, weights=confidence[keep],
+                                 minlength=self.grid.size).reshape(self.shape)
+        self.nSamples += int(keep.sum())
+
+    def density(self):
+        """ The grid blurred with the gaussian, scaled to 0-1 """
+        density = cv2.GaussianBlur(self.grid, (0, 0), max(self.sigma / self.binSize, 1e-3))
+        if density.max() > 0:
+            density /= density.max()
+        return density
+
+    def render(self, refImage):
+        """ Blend the colored density over the reference image (BGR) """
+        density = cv2.resize(self.density(), self.refSize, interpolation=cv2.INTER_LINEAR)
+        colored = cv2.applyColorMap(np.uint8(np.clip(density, 0, 1) * 255), cv2.COLORMAP_JET)
+        weight = (self.alpha * density)[:, :, None]
+        return np.uint8(np.round(refImage * (1 - weight) + colored * weight))
+
+    def write(self, outputDir, refImage, name='heatmap'):
+        """ Write the raw grid (<name>.npy) and the heatmap image (<name>.png) """
+        np.save(join(outputDir, name + '.npy'), self.grid)
+        cv2.imwrite(join(outputDir, name + '.png'), self.render(refImage))
+
+
+def getHeatmapSettings(settings=None):
+    """ Return the heatmap settings, filling in defaults for anything
+    unspecified (see HeatmapAccumulator) """
+    fullSettings = dict(DEFAULT_HEATMAP)
+    if settings is not None:
+        unknown = set(settings) - set(fullSettings)
+        if len(unknown) > 0:
+            raise ValueError('unknown heatmap settings: {}'.format(sorted(unknown)))
+        fullSettings.update(settings)
+    if fullSettings['binSize'] < 1:
+        raise ValueError('heatmap binSize must be at least 1')
+    return fullSettings
+
+
+def outputName(refName, multiRef):
+    """ File name (without extension) of a reference image's heatmap """
+    return 'heatmap_{}'.format(refName) if multiRef else 'heatmap'
+
+
+def heatmapsFromFile(mappedGazeDir, referenceImage, chunkSize=500000, **settings):
+    """ Make the heatmaps for an existing mapGaze output dir, reading
+    gazeData_mapped.tsv in chunks
+
+    Parameters
+    ----------
+    mappedGazeDir : string
+        mapGaze output dir. The heatmaps are written here
+    referenceImage : string or list of strings
+        the reference image(s) the gaze was mapped to
+    chunkSize : int, optional
+        number of rows of gazeData_mapped.tsv read at a time
+    **settings
+        heatmap settings (see HeatmapAccumulator)
+
+    Returns
+    -------
+    dict
+        HeatmapAccumulator for each reference image, by name
+
+    """
+    if isinstance(referenceImage, str):
+        referenceImage = [referenceImage]
+    settings = getHeatmapSettings(settings)
+    multiRef = len(referenceImage) > 1
+
+    refImages, heatmaps = {}, {}
+    for path in referenceImage:
+        name = os.path.splitext(os.path.basename(path))[0]
+        refImages[name] = cv2.imread(path)
+        if refImages[name] is None:
+            raise IOError('could not read reference image {}'.format(path))
+        heatmaps[name] = HeatmapAccumulator((refImages[name].shape[1], refImages[name].shape[0]), **settings)
+
+    for chunk in pd.read_csv(join(mappedGazeDir, 'gazeData_mapped.tsv'), sep='\t', chunksize=chunkSize):
+        for name, heatmap in heatmaps.items():
+            rows = chunk if not multiRef else chunk[chunk['refImage'] == name]
+            heatmap.add(rows[['ref_gazeX', 'ref_gazeY']].values, rows['confidence'].values)
+
+    for name, heatmap in heatmaps.items():
+        heatmap.write(mappedGazeDir, refImages[name], outputName(name, multiRef))
+    return heatmaps
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('mappedGazeDir', help='mapGaze output dir (containing gazeData_mapped.tsv)')
+    parser.add_argument('referenceImage', nargs='+', help='reference image file(s) the gaze was mapped to')
+    parser.add_argument('--binSize', type=int, default=DEFAULT_HEATMAP['binSize'],
+                        help='size (px) of the grid bins [default: 4]')
+    parser.add_argument('--sigma', type=float, default=DEFAULT_HEATMAP['sigma'],
+                        help='standard deviation (px) of the gaussian blur [default: 30]')
+    parser.add_argument('--minConfidence', type=float, default=DEFAULT_HEATMAP['minConfidence'],
+                        help='leave out samples with a lower confidence [default: 0]')
+    args = parser.parse_args(argv)
+
+    heatmaps = heatmapsFromFile(args.mappedGazeDir, args.referenceImage,
+                                binSize=args.binSize, sigma=args.sigma, minConfidence=args.minConfidence)
+    for name, heatmap in heatmaps.items():
+        print('{}: {} samples'.format(name, heatmap.nSamples))
+    print('Heatmaps saved in: {}'.format(args.mappedGazeDir))
+
+
+if __name__ == '__main__':
+    main()
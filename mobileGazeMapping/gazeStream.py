@@ -0,0 +1,366 @@
+""" Map gaze to a reference image in real time, as frames and samples arrive
+
+processRecording (see mapGaze.py) maps a finished recording offline. This
+module maps a live stream instead: world camera frames and gaze samples are
+consumed as they arrive, and every gaze sample is returned in reference image
+coordinates as soon as the homography for its frame is known.
+
+Feature detection and matching is much slower than most world cameras, so the
+mapper never lets a backlog build up. Only the newest `maxQueue` frames are
+kept waiting for the detector; older ones are dropped. Gaze samples that
+belong to a dropped frame are mapped with the most recent good homography
+('coasted') as long as it is no more than `maxCoastFrames` frames away,
+otherwise they are reported as 'lost'. The homographies of processed frames
+are only kept until no waiting gaze sample can need them, so memory doesn't
+grow with the length of the stream; a sample that arrives after its frame's
+homography was dropped is coasted as well. Each mapped sample carries its
+end-to-end latency (from the moment it arrived to the moment it was returned),
+and the latency percentiles for the stream are available from latencyStats().
+
+Input is any iterable (or async iterable) of Frame and GazeSample items, e.g.
+from a live eye-tracker API. replayRecording produces such a stream from a
+recorded worldCamera.mp4 and gazeData_world.tsv, paced at real-time rate.
+
+Usage (replay a recording and report the latencies):
+    mobileGazeMapping stream gazeData worldCameraVid referenceImage [--speed S]
+                             [--maxQueue N] [--nFrames N]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import time
+import argparse
+import threading
+from collections import deque, namedtuple
+
+from .lazyImport import lazyImport
+from . import core
+from . import mapGaze
+from .gazeData import GazeData
+
+np = lazyImport('numpy')
+cv2 = lazyImport('cv2')
+
+# a world camera frame; image is a BGR array
+Frame = namedtuple('Frame', ['frameIdx', 'image'])
+
+# a gaze sample, with the same fields as a gazeData_world.tsv row
+GazeSample = namedtuple('GazeSample', ['timestamp', 'frame_idx', 'confidence', 'norm_pos_x', 'norm_pos_y'])
+
+SAMPLE_STATUS = ['mapped', 'coasted', 'nomatch', 'lost']
+
+
+def iterateSource(source):
+    """ Iterate over a regular or async iterable from synchronous code """
+    if not hasattr(source, '__aiter__'):
+        for item in source:
+            yield item
+        return
+
+    import asyncio
+    loop = asyncio.new_event_loop()
+    iterator = source.__aiter__()
+    try:
+        while True:
+            try:
+                item = loop.run_until_complete(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        loop.close()
+
+
+class StreamingMapper(object):
+    """ Map a live stream of world camera frames and gaze samples
+
+    Parameters
+    ----------
+    referenceImage : string, list of strings, or GazeMapper
+        Path(s) to the 2D reference image(s), or a GazeMapper to reuse
+    maxQueue : int, optional
+        Maximum number of frames waiting for the detector. When a new frame
+        arrives and the queue is full, the oldest waiting frame is dropped
+    coast : bool, optional
+        Map the samples of dropped frames with the most recent good
+        homography. If False, they are reported as 'lost'
+    maxCoastFrames : int, optional
+        Maximum distance (in frames) between a dropped frame and the
+        homography used to coast it
+    maxLatencies : int, optional
+        Number of most recent sample latencies kept for latencyStats
+    **mapperOptions
+        Passed on to GazeMapper when referenceImage is a path
+
+    """
+    def __init__(self, referenceImage, maxQueue=1, coast=True, maxCoastFrames=15, maxLatencies=100000,
+                 **mapperOptions):
+        if isinstance(referenceImage, mapGaze.GazeMapper):
+            self.mapper = referenceImage
+        else:
+            self.mapper = mapGaze.GazeMapper(referenceImage, **mapperOptions)
+        self.maxQueue = maxQueue
+        self.coast = coast
+        self.maxCoastFrames = maxCoastFrames
+        self.latencies = deque(maxlen=maxLatencies)
+        self.sampleCounts = {status: 0 for status in SAMPLE_STATUS}
+        self.frameCounts = {'processed': 0, 'dropped': 0}
+
+    def _feed(self, source, state, cond):
+        """ Feeder thread: pull items from the source and queue them, dropping
+        the oldest waiting frames if the detector falls behind """
+        try:
+            for item in iterateSource(source):
+                now = time.time()
+                with cond:
+                    if state['stop']:
+                        return
+                    if isinstance(item, Frame):
+                        state['frameSize'] = item.image.shape[:2]
+                        state['frames'].append((now, item))
+                        while len(state['frames']) > self.maxQueue:
+                            dropped = state['frames'].popleft()[1]
+                            state['maxDropped'] = max(state['maxDropped'], dropped.frameIdx)
+                            self.frameCounts['dropped'] += 1
+                    else:
+                        state['gaze'].append((now, item))
+                    cond.notify_all()
+        except Exception as e:
+            with cond:
+                state['error'] = e
+        finally:
+            with cond:
+                state['done'] = True
+                cond.notify_all()
+
+    def map_stream(self, source):
+        """ Map a stream of frames and gaze samples
+
+        Parameters
+        ----------
+        source : iterable or async iterable
+            Frame and GazeSample items, in the order they arrive. A frame's
+            gaze samples may arrive before or after the frame itself
+
+        Yields
+        ------
+        dict
+            one per gaze sample, with the GazeSample fields plus:
+            world_gazeX, world_gazeY - world camera pixel coordinates
+            ref_gazeX, ref_gazeY - reference image pixel coordinates (NaN
+                                   unless status is 'mapped' or 'coasted')
+            refImage - name of the reference image the sample landed on
+            status - 'mapped', 'coasted' (frame was dropped, mapped with a
+                     recent homography), 'nomatch' (reference image not found
+                     on the frame), or 'lost' (frame dropped, nothing to coast on)
+            latency - seconds between the sample arriving and being returned
+
+        """
+        state = {'frames': deque(), 'gaze': deque(), 'frameSize': None, 'maxDropped': -1,
+                 'done': False, 'stop': False, 'error': None}
+        cond = threading.Condition()
+        feeder = threading.Thread(target=self._feed, args=(source, state, cond))
+        feeder.daemon = True
+        feeder.start()
+
+        homographies = {}       # frameIdx -> [(refIdx, world2ref), ...] for processed frames
+        lastGood = None         # (frameIdx, [(refIdx, world2ref), ...]) of the newest matched frame
+        lastProcessed = -1
+        lastFr = None           # result of the last processed frame, to guide matching on the next
+        try:
+            while True:
+                with cond:
+                    while True:
+                        resolvedUpTo = max(lastProcessed, state['maxDropped'])
+                        ready = [g for g in state['gaze'] if g[1].frame_idx <= resolvedUpTo]
+                        if state['frames'] or ready or state['done']:
+                            break
+                        cond.wait()
+                    finished = state['done'] and not state['frames']
+                    if finished:
+                        ready = list(state['gaze'])
+                    if ready:
+                        state['gaze'] = deque(g for g in state['gaze'] if g[1].frame_idx > resolvedUpTo
+                                              and not finished)
+                    nextFrame = state['frames'].popleft() if state['frames'] else None
+                    frameSize = state['frameSize']
+                    oldestWaiting = min((g[1].frame_idx for g in state['gaze']), default=None)
+
+                for result in self._resolve(ready, homographies, lastGood, frameSize):
+                    yield result
+
+                if nextFrame is not None:
+                    frame = nextFrame[1]
+                    fr = self.mapper.map_frame(frame.image, frame.frameIdx, previous=lastFr)
+                    lastFr = fr
+                    matched = [(i, refFr['world2ref']) for i, refFr in enumerate(fr['references'])
+                               if refFr['foundGoodMatch']]
+                    homographies[frame.frameIdx] = matched
+                    if matched and (lastGood is None or frame.frameIdx >= lastGood[0]):
+                        lastGood = (frame.frameIdx, matched)
+                    lastProcessed = max(lastProcessed, frame.frameIdx)
+                    self.frameCounts['processed'] += 1
+                elif finished:
+                    break
+
+                # forget the homographies of frames older than any waiting
+                # sample (lastGood keeps the newest match for coasting)
+                oldest = lastProcessed if oldestWaiting is None else min(oldestWaiting, lastProcessed)
+                for frameIdx in [k for k in homographies if k < oldest]:
+                    del homographies[frameIdx]
+        finally:
+            with cond:
+                state['stop'] = True
+
+        if state['error'] is not None:
+            raise state['error']
+
+    def _resolve(self, ready, homographies, lastGood, frameSize):
+        """ Map a batch of gaze samples whose frames have been processed or dropped """
+        if not ready:
+            return
+        references = self.mapper.references
+
+        # group the samples by frame, so each frame's samples are mapped in one call
+        byFrame = {}
+        for arrival, sample in ready:
+            byFrame.setdefault(sample.frame_idx, []).append((arrival, sample))
+
+        for frameIdx in sorted(byFrame):
+            group = byFrame[frameIdx]
+            if frameIdx in homographies:
+                matched = homographies[frameIdx]
+                status = 'mapped' if matched else 'nomatch'
+            elif (self.coast and lastGood is not None
+                  and abs(frameIdx - lastGood[0]) <= self.maxCoastFrames):
+                matched = lastGood[1]
+                status = 'coasted'
+            else:
+                matched = []
+                status = 'lost'
+
+            nSamples = len(group)
+            worldCoords = np.full((nSamples, 2), np.nan)
+            if frameSize is not None:
+                worldCoords[:, 0] = [s.norm_pos_x * frameSize[1] for a, s in group]
+                worldCoords[:, 1] = [s.norm_pos_y * frameSize[0] for a, s in group]
+            refCoords = np.full((nSamples, 2), np.nan)
+            refLabels = np.full(nSamples, -1)
+            if frameSize is not None:
+                for i, world2ref in matched:
+                    mapped = self.mapper.map_points(worldCoords, world2ref)
+                    if len(references) > 1:
+                        onRef = (refLabels == -1) & references[i].contains(mapped)
+                    else:
+                        onRef = np.ones(nSamples, dtype=bool)
+                    refCoords[onRef] = mapped[onRef]
+                    refLabels[onRef] = i
+
+            now = time.time()
+            for j, (arrival, sample) in enumerate(group):
+                result = sample._asdict()
+                result['world_gazeX'] = worldCoords[j, 0]
+                result['world_gazeY'] = worldCoords[j, 1]
+                result['ref_gazeX'] = refCoords[j, 0]
+                result['ref_gazeY'] = refCoords[j, 1]
+                result['refImage'] = references[refLabels[j]].name if refLabels[j] >= 0 else ''
+                result['status'] = status if status in ['nomatch', 'lost'] or refLabels[j] >= 0 else 'nomatch'
+                result['latency'] = now - arrival
+                self.latencies.append(result['latency'])
+                self.sampleCounts[result['status']] += 1
+                yield result
+
+    def latencyStats(self, percentiles=(50, 90, 95, 99)):
+        """ Summarize the end-to-end latency (ms) of the samples mapped so far,
+        along with the sample and frame counts """
+        stats = {'nSamples': len(self.latencies)}
+        if len(self.latencies) > 0:
+            latencies = np.asarray(self.latencies) * 1000
+            for p, value in zip(percentiles, np.percentile(latencies, percentiles)):
+                stats['p{}'.format(p)] = value
+            stats['max'] = latencies.max()
+        stats.update(self.sampleCounts)
+        stats.update(self.frameCounts)
+        return stats
+
+
+def replayRecording(worldCameraVid, gazeData, speed=1.0, nFrames=None, fps=None):
+    """ Replay a recording as a live stream of Frame and GazeSample items
+
+    Frames are emitted at the video frame rate (scaled by `speed`), each
+    followed by its gaze samples spread evenly across the frame interval.
+
+    Parameters
+    ----------
+    worldCameraVid : string
+        Path to the world camera video
+    gazeData : string or GazeData
+        Path to the gazeData_world.tsv file, or a GazeData object
+    speed : float, optional
+        Playback speed relative to real time. None replays as fast as possible
+    nFrames : int, optional
+        Only replay the given number of frames
+    fps : float, optional
+        Frame rate to replay at (default: read from the video)
+
+    """
+    if not isinstance(gazeData, GazeData):
+        gazeData = GazeData.fromFile(gazeData)
+
+    vid = core.openVideo(worldCameraVid)
+    if fps is None:
+        fps = core.videoProperties(vid)[2] or 30
+    interval = 1 / fps / speed if speed else 0
+
+    startTime = time.time()
+    frameIdx = 0
+    try:
+        while nFrames is None or frameIdx < nFrames:
+            ret, image = vid.read()
+            if not ret:
+                break
+
+            samples = gazeData.frameSlice(frameIdx)
+            nSamples = samples.stop - samples.start
+            frameTime = startTime + frameIdx * interval
+            waitTime = frameTime - time.time()
+            if waitTime > 0:
+                time.sleep(waitTime)
+            yield Frame(frameIdx, image)
+
+            for i, s in enumerate(range(samples.start, samples.stop)):
+                waitTime = frameTime + (i + 1) * interval / (nSamples + 1) - time.time()
+                if waitTime > 0:
+                    time.sleep(waitTime)
+                yield GazeSample(gazeData.timestamp[s], frameIdx, gazeData.confidence[s],
+                                 gazeData.norm_pos_x[s], gazeData.norm_pos_y[s])
+            frameIdx += 1
+    finally:
+        vid.release()
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('gazeData', help='path to gaze data file')
+    parser.add_argument('worldCameraVid', help='path to world camera video file')
+    parser.add_argument('referenceImage', nargs='+', help='path to reference image file(s)')
+    parser.add_argument('--speed', type=float, default=1.0, help='playback speed relative to real time [default: 1.0]')
+    parser.add_argument('--maxQueue', type=int, default=1, help='maximum number of frames waiting for the detector [default: 1]')
+    parser.add_argument('--nFrames', type=int, default=None, help='only replay the given number of frames')
+    args = parser.parse_args(argv)
+
+    streamMapper = StreamingMapper(args.referenceImage, maxQueue=args.maxQueue)
+    stream = replayRecording(args.worldCameraVid, args.gazeData, speed=args.speed, nFrames=args.nFrames)
+    for result in streamMapper.map_stream(stream):
+        print('{frame_idx}\t{timestamp:.3f}\t{ref_gazeX:.0f}\t{ref_gazeY:.0f}\t{status}\t{latency:.3f}'.format(**result))
+
+    for key, value in sorted(streamMapper.latencyStats().items()):
+        print('{}: {}'.format(key, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+""" Smooth the per-frame homographies of a mapped recording over time
+
+The homography found on each world camera frame is computed independently of
+its neighbors, so the mapping jitters from frame to frame, and every frame
+where the reference image wasn't found loses all of its gaze samples. This
+module smooths the homographies stored in homographies.npz after the fact,
+without re-running feature detection:
+
+    1. every world2ref homography is represented by where it maps the 4
+       corners of the world camera frame in the reference image
+    2. each corner coordinate is smoothed over time with a centered moving
+       median (robust to the occasional bad frame)
+    3. gaps of up to maxGap frames without a homography are filled by
+       linearly interpolating the corners across the gap
+    4. a homography is recomputed from the smoothed corners of every frame,
+       and all of the gaze samples are mapped with them
+
+All steps operate on every frame at once (NumPy/pandas), so smoothing a
+recording takes a fraction of a second.
+
+Outputs (written alongside the mapGaze outputs):
+    homographies_smoothed.npz - smoothed world2ref homography for every frame
+    gazeData_mapped_smoothed.tsv - every gaze sample mapped with the smoothed
+        homographies. Same columns as gazeData_mapped.tsv, plus 'homography'
+        saying whether the frame's homography was 'smoothed' from measured
+        ones, 'filled' across a gap, or 'none' (ref coordinates are nan)
+
+Usage:
+    mobileGazeMapping smooth mappedGazeDir gazeData worldCameraVid
+                             [--window N] [--maxGap N]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+from os.path import join
+
+from .lazyImport import lazyImport
+from .gazeData import GazeData
+from . import core
+from . import remapGaze
+
+np = lazyImport('numpy')
+pd = lazyImport('pandas')
+
+DEFAULT_SMOOTHING = {'window': 5, 'maxGap': 5}
+
+
+def frameCorners(frameSize):
+    """ (4, 2) array of the corners of a (width, height) frame """
+    w, h = frameSize
+    return np.float64([[0, 0], [w, 0], [w, h], [0, h]])
+
+
+def transformPoints(H, points):
+    """ Apply (N, 3, 3) homographies to (N, M, 2) points; returns (N, M, 2) """
+    points = np.concatenate([points, np.ones(points.shape[:-1] + (1,))], axis=-1)
+    mapped = np.einsum('nij,nmj->nmi', H, points)
+    return mapped[..., :2] / mapped[..., 2:]
+
+
+def homographiesFromCorners(src, dst):
+    """ Solve for the (N, 3, 3) homographies mapping the (N, 4, 2) src corners
+    onto the dst corners (nan where dst is nan, or where the corners are
+    degenerate, e.g. 3 of them on a line) """
+    n = src.shape[0]
+    H = np.full((n, 3, 3), np.nan)
+    valid = ~np.isnan(dst).any(axis=(1, 2))
+    if not valid.any():
+        return H
+
+    x, y = src[valid, :, 0], src[valid, :, 1]
+    u, v = dst[valid, :, 0], dst[valid, :, 1]
+    zeros, ones = np.zeros_like(x), np.ones_like(x)
+    # 2 rows of the DLT system for every corner: (m, 8, 8) A @ h = b
+    rowsU = np.stack([x, y, ones, zeros, zeros, zeros, -u * x, -u * y], axis=-1)
+    rowsV = np.stack([zeros, zeros, zeros, x, y, ones, -v * x, -v * y], axis=-1)
+    A = np.concatenate([rowsU, rowsV], axis=1)
+    b = np.concatenate([u, v], axis=1)
+    try:
+        h = np.linalg.solve(A, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        # a single singular system fails the whole batch; solve frame by frame
+        h = np.zeros((A.shape[0], 8))
+        solved = np.zeros(A.shape[0], dtype=bool)
+        for i in range(A.shape[0]):
+            try:
+                h[i] = np.linalg.solve(A[i], b[i])
+                solved[i] = True
+            except np.linalg.LinAlgError:
+                pass
+        valid[valid] = solved
+        h = h[solved]
+
+    H[valid] = np.concatenate([h, np.ones((h.shape[0], 1))], axis=1).reshape(-1, 3, 3)
+    return H
+
+
+def gapLengths(missing):
+    """ For a boolean array, return the length of the run of True values each
+    element belongs to (0 for False), and whether that run is bounded by False
+    values on both sides """
+    missing = np.asarray(missing, dtype=bool)
+    runId = np.cumsum(np.r_[True, missing[1:] != missing[:-1]])
+    runLengths = np.bincount(runId)
+    lengths = np.where(missing, runLengths[runId], 0)
+    inside = missing & (runId != runId[0]) & (runId != runId[-1])
+    return lengths, inside
+
+
+def smoothHomographies(homographies, frameSize, window=5, maxGap=5):
+    """ Smooth a sequence of world2ref homographies and fill short gaps
+
+    Parameters
+    ----------
+    homographies : np.ndarray
+        (nFrames, 3, 3) world2ref homographies, nan for frames without one
+    frameSize : tuple
+        (width, height) of the world camera frames
+    window : int, optional
+        length (frames) of the centered moving median applied to the corner
+        trajectories. 1 disables smoothing
+    maxGap : int, optional
+        longest run of frames without a homography that will be filled in
+
+    Returns
+    -------
+    smoothed : np.ndarray
+        (nFrames, 3, 3) smoothed world2ref homographies (nan where a frame is
+        in a gap longer than maxGap, or at either end of the recording)
+    filled : np.ndarray
+        (nFrames,) boolean array, True for frames whose homography was
+        filled in across a gap
+
+    """
+    homographies = np.asarray(homographies, dtype=np.float64)
+    nFrames = homographies.shape[0]
+    corners = frameCorners(frameSize)
+    missing = np.isnan(homographies).any(axis=(1, 2))
+
+    # trajectories of the frame corners in reference image coordinates
+    trajectories = np.full((nFrames, 4, 2), np.nan)
+    trajectories[~missing] = transformPoints(homographies[~missing],
+                                             np.broadcast_to(corners, ((~missing).sum(), 4, 2)))
+    trajectories = pd.DataFrame(trajectories.reshape(nFrames, 8))
+
+    # robust smoothing of the measured frames
+    if window > 1:
+        trajectories = trajectories.rolling(window, center=True, min_periods=1).median()
+        trajectories.loc[missing] = np.nan
+
+    # fill short gaps by interpolating linearly across them
+    lengths, inside = gapLengths(missing)
+    filled = inside & (lengths <= maxGap)
+    trajectories = trajectories.values.copy()
+    gaps, measured = np.flatnonzero(filled), np.flatnonzero(~missing)
+    for col in range(trajectories.shape[1]):
+        trajectories[gaps, col] = np.interp(gaps, measured, trajectories[measured, col])
+
+    smoothed = homographiesFromCorners(np.broadcast_to(corners, (nFrames, 4, 2)),
+                                       trajectories.reshape(nFrames, 4, 2))
+    return smoothed, filled
+
+
+def mapGazeData(gazeData, homographies, frameSize):
+    """ Map every gaze sample with its frame's world2ref homography
+
+    Parameters
+    ----------
+    gazeData : GazeData
+        gaze data in normalized world camera coordinates
+    homographies : np.ndarray
+        (nFrames, 3, 3) world2ref homographies (nan where unavailable)
+    frameSize : tuple
+        (width, height) of the world camera frames
+
+    Returns
+    -------
+    worldCoords, refCoords : np.ndarray
+        (nSamples, 2) gaze positions in world camera and reference image pixel
+        coordinates (refCoords is nan for samples without a homography)
+
+    """
+    worldCoords = np.stack([gazeData.norm_pos_x * frameSize[0], gazeData.norm_pos_y * frameSize[1]], axis=1)
+    refCoords = remapGaze.perspectiveTransform(worldCoords, homographies, gazeData.frame_idx)
+    return worldCoords, refCoords
+
+
+def smoothRecording(outputDir, gazeData, frameSize, homographies=None, refSizes=None, window=5, maxGap=5):
+    """ Smooth the homographies of a mapped recording, and remap its gaze data
+
+    Parameters
+    ----------
+    outputDir : string
+        mapGaze output dir. homographies_smoothed.npz and
+        gazeData_mapped_smoothed.tsv are written here
+    gazeData : string or GazeData
+        the recording's gaze data (path to gazeData_world.tsv, or a GazeData)
+    frameSize : tuple
+        (width, height) of the world camera frames
+    homographies : dict, optional
+        world2ref homographies for each reference image, by name (default:
+        loaded from homographies.npz in outputDir)
+    refSizes : dict, optional
+        (width, height) of each reference image, by name. With multiple
+        reference images, a sample is assigned to the first reference it
+        lands on; without refSizes, to the first one with a homography
+    window, maxGap : int, optional
+        see smoothHomographies
+
+    Returns
+    -------
+    pd.DataFrame
+        the smoothed gaze data, as written to gazeData_mapped_smoothed.tsv
+
+    """
+    if not isinstance(gazeData, GazeData):
+        gazeData = GazeData.fromFile(gazeData)
+    if homographies is None:
+        with np.load(join(outputDir, 'homographies.npz')) as f:
+            homographies = {name: f[name] for name in f.files}
+    names = list(homographies)
+    multiRef = len(names) > 1
+
+    refCoords = None
+    refLabels = np.full(len(gazeData), -1)
+    source = np.full(len(gazeData), 'none', dtype=object)
+    smoothedAll = {}
+    for i, name in enumerate(names):
+        smoothed, filled = smoothHomographies(homographies[name], frameSize, window, maxGap)
+        smoothedAll[name] = smoothed
+        worldCoords, mapped = mapGazeData(gazeData, smoothed, frameSize)
+        if refCoords is None:
+            refCoords = np.full(mapped.shape, np.nan)
+
+        onRef = (refLabels == -1) & ~np.isnan(mapped).any(axis=1)
+        if multiRef and refSizes is not None:
+            w, h = refSizes[name]
+            onRef &= (mapped[:, 0] >= 0) & (mapped[:, 0] < w) & (mapped[:, 1] >= 0) & (mapped[:, 1] < h)
+        refCoords[onRef] = np.round(mapped[onRef])
+        refLabels[onRef] = i
+
+        frameFilled = np.zeros(len(gazeData), dtype=bool)
+        inRange = (gazeData.frame_idx >= 0) & (gazeData.frame_idx < filled.shape[0])
+        frameFilled[inRange] = filled[gazeData.frame_idx[inRange]]
+        source[onRef] = np.where(frameFilled[onRef], 'filled', 'smoothed')
+
+    np.savez(join(outputDir, 'homographies_smoothed.npz'), **smoothedAll)
+
+    smoothed_df = pd.DataFrame({'worldFrame': gazeData.frame_idx,
+                                'gaze_ts': gazeData.timestamp,
+                                'confidence': gazeData.confidence,
+                                'world_gazeX': worldCoords[:, 0],
+                                'world_gazeY': worldCoords[:, 1],
+                                'ref_gazeX': refCoords[:, 0],
+                                'ref_gazeY': refCoords[:, 1]})
+    colOrder = ['worldFrame', 'gaze_ts', 'confidence', 'world_gazeX', 'world_gazeY', 'ref_gazeX', 'ref_gazeY']
+    if multiRef:
+        smoothed_df['refImage'] = [names[i] if i >= 0 else '' for i in refLabels]
+        colOrder.append('refImage')
+    smoothed_df['homography'] = source
+    colOrder.append('homography')
+
+    # only keep the frames that were mapped
+    nFrames = homographies[names[0]].shape[0]
+    smoothed_df = smoothed_df[colOrder][(gazeData.frame_idx >= 0) & (gazeData.frame_idx < nFrames)]
+    smoothed_df.to_csv(join(outputDir, 'gazeData_mapped_smoothed.tsv'),
+                       sep='\t',
+                       index=False,
+                       float_format='%.3f')
+    return smoothed_df
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('mappedGazeDir', help='mapGaze output dir (containing homographies.npz)')
+    parser.add_argument('gazeData', help='path to gaze data file')
+    parser.add_argument('worldCameraVid', help='path to world camera video file (to get the frame size)')
+    parser.add_argument('--window', type=int, default=DEFAULT_SMOOTHING['window'],
+                        help='length (frames) of the moving median [default: 5]')
+    parser.add_argument('--maxGap', type=int, default=DEFAULT_SMOOTHING['maxGap'],
+                        help='longest gap (frames) without a homography to fill in [default: 5]')
+    args = parser.parse_args(argv)
+
+    smoothed_df = smoothRecording(args.mappedGazeDir, args.gazeData, core.videoSize(args.worldCameraVid),
+                                  window=args.window, maxGap=args.maxGap)
+    print('Mapped {} of {} samples; output saved in: {}'.format(
+        (smoothed_df['homography'] != 'none').sum(), smoothed_df.shape[0], args.mappedGazeDir))
+
+
+if __name__ == '__main__':
+    main()
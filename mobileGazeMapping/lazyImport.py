@@ -0,0 +1,49 @@
+""" Deferred imports of heavy dependencies
+
+NumPy, pandas, OpenCV, and msgpack together take a good fraction of a second
+to import, which adds up over thousands of short jobs, and is wasted entirely
+on e.g. `--help` or a bad argument. Modules import them with
+
+    np = lazyImport('numpy')
+
+instead of `import numpy as np`, which returns a stand-in module that does
+the real import the first time one of its attributes is used, so only the
+dependencies of the code path that actually runs are ever imported.
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import types
+import importlib
+
+
+class LazyModule(types.ModuleType):
+    """ Stand-in for a module that imports it on first attribute access
+
+    Once imported, the module's attributes are copied onto the stand-in, so
+    later lookups cost the same as on the module itself. Concurrent first
+    uses from several threads are safe: the import system's per-module lock
+    makes them all wait for the one import.
+
+    """
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __dir__(self):
+        return dir(importlib.import_module(self.__name__))
+
+
+def lazyImport(name):
+    """ The module `name`, or a LazyModule that imports it on first use if it
+    hasn't been imported yet """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -0,0 +1,1919 @@
+""" Map gaze data from world camera coordinate system to reference image
+
+This script automates mapping of gaze data from a world camera coordinate
+system to a fixed reference image. Mobile eye-trackers often record gaze data
+with respect to an outward facing world camera approximating the
+participant's point-of-view. As a result, the gaze data is expressed in
+an egocentric coordinate system which moves along with the participant's head.
+
+Typical eye-tracking research, on the other hand, seeks to analyze gaze
+behavior on a particular stimulus over time. In order to use mobile
+eye-trackers in this context, one must first map the recorded gaze points from
+the world camera coordinate system to the fixed coordinate system of the
+target stimulus. This requires 1) identifying the target stimulus in every
+frame of the world camera recording, 2) finding a linear transform that will
+map between the appearance of the stimulus on the world camera frame and a 2D
+reference version of the same stimulus, and 3) using that transform to project
+the recorded gaze points to the 2D reference stimulus.
+
+With the help of computers vision tools, this script automates this process
+and yeilds output data files that facilitate subsequent analysis, specifically:
+    - world_gaze.m4v:           world video w/ gaze points overlaid
+    - ref_gaze.m4v:             video of ref image w/ gaze points overlaid
+    - ref2world_mapping.m4v     video of reference image projected back into
+                                world video
+    - mapping_qa.m4v:           (optional) the videos above side by side, in
+                                place of them
+    - gazeData_mapped.tsv:      gazeData mapped to both coordinate systems, the
+                                world and reference image
+    - homographies.npz:         world2ref homography for every frame
+    - frameMetrics.tsv:         prefilter score, match count, and homography
+                                quality for every frame
+    - homographies_smoothed.npz, gazeData_mapped_smoothed.tsv: (optional)
+                                homographies smoothed over time, and the gaze
+                                data mapped with them
+    - heatmap.png, heatmap.npy: (optional) gaze density on the ref image
+
+Multiple reference images can be supplied, in which case every frame is only
+decoded and searched for features once, and matched against all of them.
+
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+from os.path import join
+import logging
+import shutil
+import time
+import threading
+import argparse
+
+from .lazyImport import lazyImport
+from .gazeData import GazeData
+from . import core
+from . import homographySmoothing
+from . import gazeHeatmap
+from . import threadTuning
+from . import stimulusPrefilter
+from . import frameDedup
+
+# imported on first use, so the command line starts (and --help answers)
+# without loading them
+np = lazyImport('numpy')
+pd = lazyImport('pandas')
+cv2 = lazyImport('cv2')
+
+# robust estimators that can be used to compute the homographies, by the name
+# of their OpenCV flag. The USAC methods are only available in newer versions
+# of OpenCV (>= 4.5; see homographyMethods)
+HOMOGRAPHY_FLAGS = {'ransac': 'RANSAC',
+                    'lmeds': 'LMEDS',
+                    'rho': 'RHO',
+                    'usac': 'USAC_DEFAULT',
+                    'usac_fast': 'USAC_FAST',
+                    'usac_accurate': 'USAC_ACCURATE',
+                    'magsac': 'USAC_MAGSAC'}
+
+# homography estimation and quality check settings (see getHomographySettings)
+DEFAULT_HOMOGRAPHY_SETTINGS = {'method': 'ransac',
+                               'threshold': 5.0,
+                               'maxIters': 2000,
+                               'confidence': 0.995,
+                               'minInlierRatio': 0.25,
+                               'maxReprojError': None,
+                               'minAreaRatio': 0.001,
+                               'maxAreaRatio': 50.0}
+
+# feature matching settings (see getMatchSettings)
+DEFAULT_MATCH_SETTINGS = {'distanceRatio': 0.5,
+                          'checks': 10,
+                          'trees': 5,
+                          'guided': False,
+                          'searchRadius': 40.0,
+                          'guidedRatio': 0.7,
+                          'gridSize': 32}
+
+# ways of showing the reference image(s) in the ref2world_mapping video (see
+# projectImage2D)
+PROJECTION_MODES = ['image', 'outline']
+
+# preview video outputs (see getVideoSettings)
+VIDEO_NAMES = ['world', 'ref', 'ref2world', 'qa']
+VIDEO_LAYOUTS = ['separate', 'qa', 'none']
+DEFAULT_VIDEO_SETTINGS = {'layout': 'separate',
+                          'scale': 1.0,
+                          'every': 1,
+                          'world': None,
+                          'ref': None,
+                          'ref2world': None,
+                          'qa': None}
+
+
+def findMatches(img1_kp, img1_des, img2_kp, img2_des, settings=None):
+    """ Find the matches between the descriptors for two images
+
+    Parameters
+    ----------
+    img1_kp, img2_kp : list
+        list of identified keypoints for each image; returned from
+        detectAndCompute method on the cv2 featureDetect class.
+    img1_des, img2_des : np.ndarray
+        descriptors for each image; returned from detectAndCompute method on
+        the cv2 featureDetect class.
+    settings : dict, optional
+        ratio test and FLANN search settings (see getMatchSettings)
+
+    Returns
+    -------
+    img1_pts, img2_pts : list or None
+        list of matched keypoints on each image
+
+    """
+    # Match settings
+    settings = getMatchSettings(settings)
+    min_good_matches = 4
+    num_matches = 2
+    distance_ratio = settings['distanceRatio']
+    matcher = createMatcher(settings)
+
+    # find all matches
+    matches = matcher.knnMatch(img1_des, img2_des, k=num_matches)
+
+    # filter out cases where the 2 matches are too close to each other
+    goodMatches = []
+    for m, n in matches:
+        if m.distance < distance_ratio * n.distance:
+            goodMatches.append(m)
+
+    if len(goodMatches) > min_good_matches:
+        img1_pts = np.float32([img1_kp[i.queryIdx].pt for i in goodMatches])
+        img2_pts = np.float32([img2_kp[i.trainIdx].pt for i in goodMatches])
+
+        return img1_pts, img2_pts
+
+    else:
+        return None, None
+
+
+def getMatchSettings(settings=None):
+    """ Return the feature matching settings, filling in defaults for anything
+    unspecified
+
+    Settings
+    --------
+    distanceRatio : float
+        ratio test threshold (0-1) applied to the 2 nearest reference features
+        of every frame feature; lower values are more conservative
+    checks : int
+        number of FLANN tree leaves searched per feature; lower is faster and
+        less accurate
+    trees : int
+        number of randomized kd-trees in the FLANN index
+    guided : bool
+        when the reference was found on the previous frame, predict where each
+        reference keypoint should appear on this frame with that frame's
+        homography, and only match frame features near their prediction (see
+        guidedMatches). Falls back to matching against all of the reference
+        features if that doesn't produce a good homography
+    searchRadius : float
+        max distance (px) between a frame feature and the predicted position
+        of a reference keypoint for them to be matched in guided matching
+    guidedRatio : float
+        ratio test threshold of guided matching, applied to the 2 nearest
+        candidates within the search radius. There are far fewer candidates
+        per feature than in unguided matching, so it can be looser
+    gridSize : int
+        cell size (px) of the grid the frame features are indexed by for
+        guided matching
+
+    """
+    fullSettings = dict(DEFAULT_MATCH_SETTINGS)
+    if settings is not None:
+        unknown = set(settings) - set(fullSettings)
+        if len(unknown) > 0:
+            raise ValueError('unknown match settings: {}'.format(sorted(unknown)))
+        fullSettings.update(settings)
+    for key in ['distanceRatio', 'guidedRatio']:
+        if not 0 < fullSettings[key] <= 1:
+            raise ValueError('{} must be between 0 and 1 (got {})'.format(key, fullSettings[key]))
+    for key in ['checks', 'trees', 'searchRadius', 'gridSize']:
+        if not fullSettings[key] > 0:
+            raise ValueError('{} must be > 0 (got {})'.format(key, fullSettings[key]))
+    return fullSettings
+
+
+def createMatcher(settings=None):
+    """ FLANN kd-tree matcher with the search settings (see getMatchSettings) """
+    settings = getMatchSettings(settings)
+    FLANN_INDEX_KDTREE = 0
+    index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=int(settings['trees']))
+    search_params = dict(checks=int(settings['checks']))
+    return cv2.FlannBasedMatcher(index_params, search_params)
+
+
+class KeypointGrid(object):
+    """ Uniform grid index over a set of 2D points, for finding every point
+    within a radius of many query points at once
+
+    Parameters
+    ----------
+    points : np.ndarray
+        (N, 2) array of (x, y) point coordinates
+    cellSize : float
+        width and height of the grid cells
+
+    """
+    def __init__(self, points, cellSize):
+        self.points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        self.cellSize = float(cellSize)
+        if len(self.points) == 0:
+            self.origin = np.zeros(2, dtype=np.int64)
+            self.shape = (1, 1)
+        else:
+            self.origin = np.floor(self.points.min(axis=0) / self.cellSize).astype(np.int64)
+            self.shape = tuple(np.floor(self.points.max(axis=0) / self.cellSize).astype(np.int64)
+                               - self.origin + 1)
+        cells = self._cellIds(self._cellCoords(self.points))
+
+        # points sorted by cell, with the range of every cell in the sorted order
+        self.order = np.argsort(cells, kind='stable')
+        self.counts = np.bincount(cells, minlength=self.shape[0] * self.shape[1])
+        self.starts = np.cumsum(self.counts) - self.counts
+
+    def _cellCoords(self, points):
+        return np.floor(points / self.cellSize).astype(np.int64) - self.origin
+
+    def _cellIds(self, cellCoords):
+        return cellCoords[:, 1] * self.shape[0] + cellCoords[:, 0]
+
+    def query(self, queries, radius):
+        """ All (query, point) pairs less than radius apart
+
+        Returns
+        -------
+        queryIdx, pointIdx : np.ndarray
+            index of the query and of the point of every pair
+
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, 2)
+        empty = np.zeros(0, dtype=np.int64)
+        if len(queries) == 0 or len(self.points) == 0:
+            return empty, empty
+
+        # every cell overlapping the square around each query
+        reach = int(np.ceil(radius / self.cellSize))
+        offsets = np.arange(-reach, reach + 1)
+        dx, dy = [o.ravel() for o in np.meshgrid(offsets, offsets)]
+        cellCoords = self._cellCoords(queries)
+        cx = cellCoords[:, :1] + dx
+        cy = cellCoords[:, 1:] + dy
+        inGrid = (cx >= 0) & (cx < self.shape[0]) & (cy >= 0) & (cy < self.shape[1])
+        queryIdx = np.nonzero(inGrid)[0]
+        cells = cy[inGrid] * self.shape[0] + cx[inGrid]
+
+        # expand each (query, cell) into the points in the cell
+        counts = self.counts[cells]
+        queryIdx = np.repeat(queryIdx, counts)
+        firstOfCell = np.repeat(self.starts[cells], counts)
+        withinCell = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pointIdx = self.order[firstOfCell + withinCell]
+
+        near = (((queries[queryIdx] - self.points[pointIdx]) ** 2).sum(axis=1)) < radius ** 2
+        return queryIdx[near], pointIdx[near]
+
+
+def _ratioTest(groups, distances, ratio):
+    """ Boolean mask of the (squared) distances that are the smallest of their
+    group, and smaller than ratio times the second smallest """
+    order = np.lexsort((distances, groups))
+    groups, distances = groups[order], distances[order]
+    first = np.ones(len(groups), dtype=bool)
+    first[1:] = groups[1:] != groups[:-1]
+    hasSecond = np.zeros(len(groups), dtype=bool)
+    hasSecond[:-1] = first[:-1] & ~first[1:]
+    passed = np.zeros(len(groups), dtype=bool)
+    passed[order] = hasSecond & (distances < ratio ** 2 * np.roll(distances, -1))
+    return passed
+
+
+def guidedMatches(ref_pts, ref_des, ref2world, frameGrid, frame_des, settings=None):
+    """ Match reference keypoints to the frame features near where a
+    homography (e.g. the previous frame's) predicts them to be
+
+    Only the descriptors of (reference keypoint, frame feature) pairs within
+    searchRadius of each other are compared, instead of searching all of the
+    reference descriptors for every frame feature. A pair is a match if each
+    is the other's nearest candidate, and it passes the guidedRatio test
+    against the second nearest candidate of both (so keypoints with a single
+    candidate, which can't be checked, are left out).
+
+    Parameters
+    ----------
+    ref_pts, ref_des : np.ndarray
+        reference keypoint locations (N, 2) and descriptors
+    ref2world : np.ndarray
+        homography predicting where the reference keypoints are on the frame
+    frameGrid : KeypointGrid
+        grid index of the frame keypoint locations
+    frame_des : np.ndarray
+        frame keypoint descriptors
+    settings : dict, optional
+        match settings (see getMatchSettings)
+
+    Returns
+    -------
+    refIdx, frameIdx : np.ndarray
+        indices of the matched reference and frame keypoints
+
+    """
+    settings = getMatchSettings(settings)
+    predicted = cv2.perspectiveTransform(ref_pts.reshape(-1, 1, 2), ref2world).reshape(-1, 2)
+    refIdx, frameIdx = frameGrid.query(predicted, settings['searchRadius'])
+    if len(refIdx) == 0:
+        return refIdx, frameIdx
+
+    # squared descriptor distance of every candidate pair
+    diff = ref_des[refIdx] - frame_des[frameIdx]
+    distances = np.einsum('ij,ij->i', diff, diff)
+
+    match = (_ratioTest(frameIdx, distances, settings['guidedRatio']) &
+             _ratioTest(refIdx, distances, settings['guidedRatio']))
+    return refIdx[match], frameIdx[match]
+
+
+def mapCoords2D(coords, transform2D):
+    """ Map the supplied coords to a new coordinate system using the supplied
+    transformation matrix
+
+    Parameters
+    ----------
+    coords : tuple
+        (x,y) coordinates
+    transform2D : np.ndarray
+        2D transformation matrix; produce by cv2.findHomography
+
+    Returns
+    -------
+    float, float
+        mapped coordinates after applying transform2D
+
+    See remapGaze.perspectiveTransform to map many points (with per-frame
+    homographies) at once.
+
+    """
+
+    coords = np.array(coords).reshape(-1, 1, 2)
+    mappedCoords = cv2.perspectiveTransform(coords, transform2D)
+    mappedCoords = np.round(mappedCoords.ravel())
+
+    return mappedCoords[0], mappedCoords[1]
+
+
+def _bufferView(buffers, key, shape, dtype='uint8'):
+    """ View of the given shape into a reusable working buffer, (re)allocating
+    the buffer if it's too small or of a different type """
+    buf = buffers.get(key)
+    if (buf is None or buf.dtype != dtype or buf.ndim != len(shape)
+            or any(b < s for b, s in zip(buf.shape, shape))):
+        buf = np.empty(shape, dtype=dtype)
+        buffers[key] = buf
+    return buf[tuple(slice(0, s) for s in shape)]
+
+
+def projectImage2D(origFrame, transform2D, newImage, buffers=None, mode='image', color=(0, 255, 0), thickness=3):
+    """ Project newImage into the origFrame
+
+    Warp newImage according to the supplied transformation matrix, then
+    project (insert) into the original frame. Only the bounding box of the
+    projected newImage corners is warped, and the pixels it covers are found
+    by filling the projected quadrilateral (or, if some of its corners fall
+    behind the camera, by warping a constant mask), so black pixels in
+    newImage are copied like any other. Transparent pixels of a 4-channel
+    newImage are left out.
+
+    Parameters
+    ----------
+    origFrame : np.ndarray
+        The original image you want to insert the newImage into
+    transform2D : np.ndarray
+        2D transformation matrix; produce by cv2.findHomography
+    newImage : np.ndarray
+        The image you would like to warp and project into the origFrame
+    buffers : dict, optional
+        Working buffers to reuse from one call to the next (pass the same,
+        initially empty, dict every time). If supplied, the newImage is
+        written into origFrame in place instead of into a copy of it
+    mode : string, optional
+        'image' to insert the warped newImage, or 'outline' to only draw the
+        outline of where its corners project to (much cheaper; enough to
+        check the mapping)
+    color : tuple, optional
+        BGR color of the outline ('outline' mode only)
+    thickness : int, optional
+        line thickness of the outline ('outline' mode only)
+
+    Returns
+    -------
+    newFrame : np.ndarray
+        New frame (same dimensions as origFrame) with the warped and projected
+        newImage written into it
+
+    """
+    if mode not in PROJECTION_MODES:
+        raise ValueError('unknown projection mode: {} (options: {})'.format(mode, PROJECTION_MODES))
+    if buffers is None:
+        buffers = {}
+        newFrame = origFrame.copy()
+    else:
+        newFrame = origFrame
+    frameH, frameW = origFrame.shape[:2]
+
+    # where the centers of the newImage corner pixels land on the frame.
+    # Corners with w <= 0 are behind the camera, and the projected
+    # quadrilateral isn't meaningful
+    imgH, imgW = newImage.shape[:2]
+    corners = np.float64([[0, 0, 1], [imgW - 1, 0, 1], [imgW - 1, imgH - 1, 1], [0, imgH - 1, 1]])
+    projected = corners.dot(np.asarray(transform2D, dtype=np.float64).T)
+    inFront = np.all(projected[:, 2] > 1e-9)
+
+    if mode == 'outline':
+        if inFront:
+            # keep the points within the range OpenCV can draw
+            limit = 8 * max(frameW, frameH)
+            quad = np.clip(projected[:, :2] / projected[:, 2:], -limit, limit)
+            cv2.polylines(newFrame, [np.round(quad).astype(np.int32).reshape(-1, 1, 2)], True,
+                          color, thickness, cv2.LINE_AA)
+        return newFrame
+
+    # region of the frame the warped newImage can cover
+    if inFront:
+        quad = projected[:, :2] / projected[:, 2:]
+        x0, y0 = np.maximum(np.floor(quad.min(axis=0)), 0).astype(int)
+        x1, y1 = np.minimum(np.ceil(quad.max(axis=0)) + 1, [frameW, frameH]).astype(int)
+    else:
+        x0, y0, x1, y1 = 0, 0, frameW, frameH
+    if x1 <= x0 or y1 <= y0:
+        return newFrame
+    roiSize = (x1 - x0, y1 - y0)
+
+    # warp the new image into the region only
+    shifted = np.array([[1, 0, -x0], [0, 1, -y0], [0, 0, 1]], dtype=np.float64).dot(transform2D)
+    warpedImage = cv2.warpPerspective(newImage, shifted, roiSize,
+                                      dst=_bufferView(buffers, 'warped', roiSize[::-1] + newImage.shape[2:]))
+
+    # mask of the pixels the warped new image covers
+    mask = _bufferView(buffers, 'mask', roiSize[::-1])
+    if inFront:
+        mask[:] = 0
+        cv2.fillPoly(mask, [np.round((quad - [x0, y0]) * 16).astype(np.int32).reshape(-1, 1, 2)],
+                     255, cv2.LINE_8, 4)
+    else:
+        cv2.warpPerspective(np.full((imgH, imgW), 255, dtype=np.uint8), shifted, roiSize, dst=mask,
+                            flags=cv2.INTER_NEAREST)
+    if newImage.ndim == 3 and newImage.shape[2] == 4:
+        # leave out transparent pixels
+        cv2.bitwise_and(mask, warpedImage[:, :, 3], dst=mask)
+        cv2.threshold(mask, 0, 255, cv2.THRESH_BINARY, dst=mask)
+        warpedImage = np.ascontiguousarray(warpedImage[:, :, :3])
+
+    # copy the warped new image over the frame, only where the mask is set
+    roi = newFrame[y0:y1, x0:x1]
+    if hasattr(cv2, 'copyTo'):
+        cv2.copyTo(warpedImage, mask, roi)
+    else:
+        cv2.bitwise_and(warpedImage, warpedImage, dst=roi, mask=mask)
+
+    # return the warped new frame
+    return newFrame
+
+
+class _SlotResult(object):
+    """ Base for the per-frame result objects. Fields can be read and written
+    as attributes or like dict items (fr['foundGoodMatch']); unset fields
+    behave like missing keys """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def update(self, values):
+        for key, value in values.items():
+            setattr(self, key, value)
+
+    def copy(self):
+        """ shallow copy, with the same fields set """
+        result = type(self)()
+        result.update({key: getattr(self, key) for key in self.__slots__ if hasattr(self, key)})
+        return result
+
+
+class ReferenceMatch(_SlotResult):
+    """ Result of registering a frame with one reference image (see
+    registerMatches and homographyQuality for the fields) """
+    __slots__ = ('foundGoodMatch', 'skipped', 'prefilterScore', 'reused', 'numMatches', 'guided', 'rejectReason',
+                 'ref2world', 'world2ref', 'numInliers', 'inlierRatio', 'reprojError', 'convex', 'quadArea',
+                 'areaRatio')
+
+    def __init__(self):
+        self.foundGoodMatch = False
+        self.skipped = False
+        self.reused = 0
+        self.guided = False
+
+
+class FrameResult(_SlotResult):
+    """ Result of mapping a single world camera frame (see GazeMapper.map_frame) """
+    __slots__ = ('references', 'foundGoodMatch', 'ref2world', 'world2ref', 'origFrame', 'frame_gray', 'reused',
+                 'thumbnail')
+
+    def __init__(self):
+        self.reused = 0
+
+
+def homographyMethods():
+    """ {name: OpenCV flag} of the robust estimators available in the
+    installed version of OpenCV """
+    return {name: getattr(cv2, flag) for name, flag in HOMOGRAPHY_FLAGS.items() if hasattr(cv2, flag)}
+
+
+def getHomographySettings(settings=None):
+    """ Return the homography settings, filling in defaults for anything
+    unspecified
+
+    Settings
+    --------
+    method : string
+        robust estimator, one of homographyMethods() ('ransac', 'lmeds',
+        'rho', and with newer OpenCV versions 'usac', 'usac_fast',
+        'usac_accurate', 'magsac')
+    threshold : float
+        max reprojection error (px) for a match to count as an inlier
+    maxIters : int
+        max number of iterations. RANSAC-type estimators stop early once they
+        are `confidence` sure they've found the best model, so this is only
+        reached when the inlier ratio is low
+    confidence : float
+        confidence level (0-1) at which the estimator stops iterating
+    minInlierRatio : float
+        reject homographies supported by a smaller fraction of the matches
+    maxReprojError : float or None
+        reject homographies whose mean inlier reprojection error (px) is larger
+    minAreaRatio, maxAreaRatio : float
+        reject homographies that project the reference image to an area
+        outside of this range (as a fraction of the world frame area)
+
+    """
+    fullSettings = dict(DEFAULT_HOMOGRAPHY_SETTINGS)
+    if settings is not None:
+        unknown = set(settings) - set(fullSettings)
+        if len(unknown) > 0:
+            raise ValueError('unknown homography settings: {}'.format(sorted(unknown)))
+        fullSettings.update(settings)
+    if fullSettings['method'] not in homographyMethods():
+        raise ValueError('homography method must be one of {}, not {}'.format(
+            sorted(homographyMethods()), fullSettings['method']))
+    return fullSettings
+
+
+def homographyQuality(ref2world, mask, ref_matchPts, frame_matchPts, refSize=None, frameSize=None):
+    """ Score a homography computed from a set of matched points
+
+    Parameters
+    ----------
+    ref2world : np.ndarray
+        homography from the reference image to the world camera frame
+    mask : np.ndarray
+        inlier mask returned by cv2.findHomography
+    ref_matchPts, frame_matchPts : np.ndarray
+        matched keypoint locations on the reference image and the frame
+    refSize : tuple, optional
+        (width, height) of the reference image. Required for the corner checks
+    frameSize : tuple, optional
+        (height, width) of the world camera frame. Required for areaRatio
+
+    Returns
+    -------
+    quality : dict
+        numInliers - number of matches consistent with the homography
+        inlierRatio - fraction of the matches that are inliers
+        reprojError - mean distance (px) between the inliers on the frame and
+                      the reference keypoints projected onto it
+        convex - whether the reference image corners project to a convex
+                 quadrilateral (None if refSize isn't given)
+        quadArea - signed area (px) of that quadrilateral; negative if the
+                   reference image is mirrored (nan if refSize isn't given)
+        areaRatio - quadArea as a fraction of the frame area (nan if
+                    refSize or frameSize isn't given)
+
+    """
+    inliers = mask.ravel().astype(bool)
+    quality = {'numInliers': int(inliers.sum()),
+               'inlierRatio': inliers.mean() if inliers.size > 0 else 0.0,
+               'reprojError': np.nan,
+               'convex': None,
+               'quadArea': np.nan,
+               'areaRatio': np.nan}
+
+    if quality['numInliers'] > 0:
+        projected = cv2.perspectiveTransform(ref_matchPts[inliers].reshape(-1, 1, 2).astype(np.float64),
+                                             ref2world).reshape(-1, 2)
+        quality['reprojError'] = np.linalg.norm(projected - frame_matchPts[inliers], axis=1).mean()
+
+    if refSize is not None:
+        corners = np.float64([[0, 0], [refSize[0], 0], [refSize[0], refSize[1]], [0, refSize[1]]])
+        quad = cv2.perspectiveTransform(corners.reshape(-1, 1, 2), ref2world).reshape(-1, 2)
+        quality['convex'] = bool(cv2.isContourConvex(quad.astype(np.float32)))
+        # shoelace formula; positive when the corners keep their orientation
+        x, y = quad[:, 0], quad[:, 1]
+        quality['quadArea'] = (np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+        if frameSize is not None:
+            quality['areaRatio'] = quality['quadArea'] / (frameSize[0] * frameSize[1])
+
+    return quality
+
+
+def checkHomography(quality, settings):
+    """ Return the reason a homography should be rejected given its quality
+    (see homographyQuality) and the homography settings, or None if it's fine """
+    if quality['numInliers'] < 4:
+        return 'only {} inliers'.format(quality['numInliers'])
+    if quality['inlierRatio'] < settings['minInlierRatio']:
+        return 'inlier ratio {:.2f} below {}'.format(quality['inlierRatio'], settings['minInlierRatio'])
+    if settings['maxReprojError'] is not None and quality['reprojError'] > settings['maxReprojError']:
+        return 'reprojection error {:.2f} above {}'.format(quality['reprojError'], settings['maxReprojError'])
+    if quality['convex'] is False:
+        return 'reference corners project to a non-convex quadrilateral'
+    if quality['quadArea'] <= 0:
+        return 'reference image is mirrored'
+    if not np.isnan(quality['areaRatio']) and not (settings['minAreaRatio'] <= quality['areaRatio'] <= settings['maxAreaRatio']):
+        return 'projected area ratio {:.4f} outside [{}, {}]'.format(quality['areaRatio'], settings['minAreaRatio'],
+                                                                      settings['maxAreaRatio'])
+    return None
+
+
+def getVideoSettings(settings=None):
+    """ Return the preview video settings, filling in defaults for anything
+    unspecified. Each video's scale and decimation are resolved into its own
+    entry, e.g. settings['ref']['scale']
+
+    Settings
+    --------
+    layout : string
+        'separate' to write world_gaze, ref_gaze, and ref2world_mapping
+        videos, 'qa' to write a single mapping_qa.m4v video instead (the
+        world camera frame with the reference image projected into it and the
+        gaze overlaid, side by side with the reference image(s) and the mapped
+        gaze, all at the height of the scaled world frame), or 'none' to skip
+        the videos
+    scale : float
+        factor every video is resized by (the QA video's world panel, for the
+        'qa' layout)
+    every : int
+        only write every Nth frame (at 1/N of the frame rate)
+    world, ref, ref2world, qa : dict or None
+        'scale' and/or 'every' for that video only, overriding the values
+        above
+
+    """
+    fullSettings = dict(DEFAULT_VIDEO_SETTINGS)
+    if settings is not None:
+        unknown = set(settings) - set(fullSettings)
+        if len(unknown) > 0:
+            raise ValueError('unknown video settings: {}'.format(sorted(unknown)))
+        fullSettings.update(settings)
+    if fullSettings['layout'] not in VIDEO_LAYOUTS:
+        raise ValueError('unknown video layout: {} (options: {})'.format(fullSettings['layout'], VIDEO_LAYOUTS))
+
+    for name in VIDEO_NAMES:
+        videoSettings = {'scale': fullSettings['scale'], 'every': fullSettings['every']}
+        overrides = fullSettings[name] or {}
+        unknown = set(overrides) - set(videoSettings)
+        if len(unknown) > 0:
+            raise ValueError('unknown {} video settings: {}'.format(name, sorted(unknown)))
+        videoSettings.update(overrides)
+        if not videoSettings['scale'] > 0:
+            raise ValueError('{} video scale must be positive'.format(name))
+        if int(videoSettings['every']) != videoSettings['every'] or videoSettings['every'] < 1:
+            raise ValueError('{} video "every" must be a positive integer'.format(name))
+        videoSettings['every'] = int(videoSettings['every'])
+        fullSettings[name] = videoSettings
+    return fullSettings
+
+
+def _scaledSize(size, scale):
+    """ (width, height) of an image of the given size resized by scale """
+    return (max(int(round(size[0] * scale)), 1), max(int(round(size[1] * scale)), 1))
+
+
+def drawGaze(image, coords, isLast, scale=1.0):
+    """ Draw gaze samples as dots on an image, in place
+
+    Parameters
+    ----------
+    image : np.ndarray
+        image to draw on
+    coords : np.ndarray
+        (n, 2) gaze positions, in pixel coordinates of the unscaled image
+    isLast : np.ndarray
+        (n,) boolean array, True for the last sample of the frame (drawn
+        larger and in red)
+    scale : float, optional
+        factor the image was resized by; coordinates and dot sizes are
+        scaled to match
+
+    """
+    for (x, y), last in zip(coords, isLast):
+        if last:
+            dotColor = [96, 52, 234]            # pinkish/red
+            dotSize = 12
+        else:
+            dotColor = [168, 231, 86]            # minty green
+            dotSize = 8
+        cv2.circle(image, (int(x * scale), int(y * scale)), max(int(round(dotSize * scale)), 1), dotColor, -1)
+
+
+class PreviewVideos(object):
+    """ Writes the preview videos for a recording as it's mapped, resized and
+    decimated according to the video settings (see getVideoSettings)
+
+    Parameters
+    ----------
+    outputDir : string
+        dir to write the videos to
+    references : list of ReferenceImage
+        the reference images gaze is mapped to
+    vidSize : tuple
+        (width, height) of the world camera frames
+    fps : float
+        frame rate of the world camera video
+    settings : dict, optional
+        video settings (see getVideoSettings)
+    projection : string, optional
+        how the reference images are projected into the world frames (see
+        projectImage2D)
+
+    """
+    def __init__(self, outputDir, references, vidSize, fps, settings=None, projection='image'):
+        self.settings = getVideoSettings(settings)
+        self.references = references
+        self.projection = projection
+        self.writers = {}
+        self._buffers = {}
+        self._projectBuffers = {}
+
+        layout = self.settings['layout']
+        if layout == 'separate':
+            names = ['world', 'ref', 'ref2world']
+        elif layout == 'qa':
+            names = ['qa']
+        else:
+            names = []
+
+        def openWriter(fname, name, size):
+            return core.openVideoWriter(join(outputDir, fname), fps / self.settings[name]['every'], size)
+
+        # reference images resized for the videos they appear in; gaze is
+        # drawn on copies of them (see _refImage)
+        self._refImages = {}
+        if 'world' in names:
+            self.writers['world'] = [openWriter('world_gaze.m4v', 'world',
+                                                _scaledSize(vidSize, self.settings['world']['scale']))]
+        if 'ref' in names:
+            scale = self.settings['ref']['scale']
+            self._refScales = [scale] * len(references)
+            self.writers['ref'] = []
+            for ref in references:
+                fname = 'ref_gaze_{}.m4v'.format(ref.name) if len(references) > 1 else 'ref_gaze.m4v'
+                self.writers['ref'].append(openWriter(fname, 'ref', _scaledSize(ref.size, scale)))
+        if 'ref2world' in names:
+            self.writers['ref2world'] = [openWriter('ref2world_mapping.m4v', 'ref2world',
+                                                    _scaledSize(vidSize, self.settings['ref2world']['scale']))]
+        if 'qa' in names:
+            # world panel, then each reference image scaled to the same height
+            self._qaScale = self.settings['qa']['scale']
+            worldPanel = _scaledSize(vidSize, self._qaScale)
+            self._qaRefScales = [worldPanel[1] / ref.size[1] for ref in references]
+            self._qaPanels = [(0, worldPanel[0])]
+            for ref, refScale in zip(references, self._qaRefScales):
+                x0 = self._qaPanels[-1][1]
+                self._qaPanels.append((x0, x0 + _scaledSize(ref.size, refScale)[0]))
+            self._qaSize = (self._qaPanels[-1][1], worldPanel[1])
+            self.writers['qa'] = [openWriter('mapping_qa.m4v', 'qa', self._qaSize)]
+
+    def due(self, frameIdx):
+        """ Names of the videos that get a frame for frameIdx """
+        return [name for name in self.writers if frameIdx % self.settings[name]['every'] == 0]
+
+    def _resized(self, key, image, scale, dst=None):
+        """ image resized by scale (into a reused buffer, or dst) """
+        if scale == 1 and dst is None:
+            return image
+        size = _scaledSize((image.shape[1], image.shape[0]), scale)
+        if dst is None:
+            dst = _bufferView(self._buffers, key, size[::-1] + image.shape[2:])
+        return cv2.resize(image, size, dst=dst, interpolation=cv2.INTER_AREA)
+
+    def _scaledRef(self, i, scale):
+        """ Reference image i resized by scale (cached) """
+        if (i, scale) not in self._refImages:
+            ref = self.references[i]
+            if scale == 1:
+                self._refImages[i, scale] = ref.color
+            else:
+                self._refImages[i, scale] = cv2.resize(ref.color, _scaledSize(ref.size, scale),
+                                                       interpolation=cv2.INTER_AREA)
+        return self._refImages[i, scale]
+
+    def _refImage(self, key, i, scale, dst=None):
+        """ Copy of reference image i, resized by scale, to draw the gaze on
+        (in a reused buffer, or dst) """
+        refImage = self._scaledRef(i, scale)
+        if dst is None:
+            dst = _bufferView(self._buffers, '{}{}'.format(key, i), refImage.shape)
+        np.copyto(dst, refImage)
+        return dst
+
+    def _project(self, image, ref2worlds, scale):
+        """ Project the matched reference images into a (resized) world frame """
+        for i, ref2world in ref2worlds:
+            if scale != 1:
+                ref2world = np.diag([scale, scale, 1.0]).dot(ref2world)
+            projectImage2D(image, ref2world, self.references[i].color,
+                           buffers=self._projectBuffers, mode=self.projection)
+
+    def write(self, frameIdx, frame, origFrame, ref2worlds=(), worldCoords=None, refCoords=None, refLabels=None):
+        """ Write the frame to every video that is due to get it
+
+        Parameters
+        ----------
+        frameIdx : int
+            index of the frame (0-based)
+        frame : np.ndarray
+            world camera frame to draw the gaze on (may be drawn on in place)
+        origFrame : np.ndarray
+            copy of the world camera frame to project the reference images
+            into (may be drawn on in place)
+        ref2worlds : list of tuples, optional
+            (reference index, ref2world homography) of every reference image
+            found on the frame
+        worldCoords, refCoords : np.ndarray, optional
+            (n, 2) world and reference image coordinates of the frame's gaze
+            samples, if they should be drawn
+        refLabels : np.ndarray, optional
+            (n,) index of the reference each sample landed on (-1 if none)
+
+        """
+        due = self.due(frameIdx)
+        if len(due) == 0:
+            return
+        if worldCoords is None:
+            worldCoords = refCoords = np.zeros((0, 2))
+            refLabels = np.zeros(0, dtype=int)
+        isLast = np.arange(len(worldCoords)) == len(worldCoords) - 1
+
+        if 'qa' in due:
+            canvas = _bufferView(self._buffers, 'qa', self._qaSize[::-1] + (3,))
+            x0, x1 = self._qaPanels[0]
+            worldPanel = self._resized('qa', origFrame, self._qaScale, dst=canvas[:, x0:x1])
+            self._project(worldPanel, ref2worlds, self._qaScale)
+            drawGaze(worldPanel, worldCoords, isLast, self._qaScale)
+            for i, refScale in enumerate(self._qaRefScales):
+                x0, x1 = self._qaPanels[i + 1]
+                refPanel = self._refImage('qa', i, refScale, dst=canvas[:, x0:x1])
+                onRef = refLabels == i
+                drawGaze(refPanel, refCoords[onRef], isLast[onRef], refScale)
+            self.writers['qa'][0].write(canvas)
+
+        if 'world' in due:
+            scale = self.settings['world']['scale']
+            worldFrame = self._resized('world', frame, scale)
+            drawGaze(worldFrame, worldCoords, isLast, scale)
+            self.writers['world'][0].write(worldFrame)
+
+        if 'ref' in due:
+            for i, writer in enumerate(self.writers['ref']):
+                onRef = refLabels == i
+                scale = self._refScales[i]
+                if onRef.any():
+                    refFrame = self._refImage('ref', i, scale)
+                    drawGaze(refFrame, refCoords[onRef], isLast[onRef], scale)
+                else:
+                    refFrame = self._scaledRef(i, scale)
+                writer.write(refFrame)
+
+        if 'ref2world' in due:
+            scale = self.settings['ref2world']['scale']
+            ref2worldFrame = self._resized('ref2world', origFrame, scale)
+            self._project(ref2worldFrame, ref2worlds, scale)
+            self.writers['ref2world'][0].write(ref2worldFrame)
+
+    def release(self):
+        for writers in self.writers.values():
+            for writer in writers:
+                writer.release()
+
+
+def setupLogging(outputDir):
+    """ Add a log file handler for a recording to the mapGaze logger
+
+    The console handler is only added the first time this is called, so
+    mapping several recordings in the same process doesn't duplicate console
+    output. Returns the logger, and the file handler, which should be passed
+    to closeLogging once the recording is finished.
+
+    """
+    logger = logging.getLogger('mapGaze')
+    logger.setLevel(logging.DEBUG)
+    if not any(getattr(h, 'isMapGazeConsole', False) for h in logger.handlers):
+        consoleLogger = logging.StreamHandler(sys.stdout)
+        consoleLogger.setLevel(logging.INFO)
+        consoleLogger.setFormatter(logging.Formatter('%(message)s'))
+        consoleLogger.isMapGazeConsole = True
+        logger.addHandler(consoleLogger)
+
+    fileLogger = logging.FileHandler(join(outputDir, 'mapGazeLog.log'), mode='w')
+    fileLogger.setLevel(logging.DEBUG)
+    # only log messages from this thread, so recordings mapped concurrently in
+    # different threads each get their own log
+    thisThread = threading.current_thread().ident
+    fileLogger.addFilter(lambda record: record.thread == thisThread)
+    fileLogFormat = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%m-%d %H:%M:%S')
+    fileLogger.setFormatter(fileLogFormat)
+    logger.addHandler(fileLogger)
+
+    return logger, fileLogger
+
+
+def closeLogging(fileLogger):
+    """ Remove and close a recording's log file handler """
+    logging.getLogger('mapGaze').removeHandler(fileLogger)
+    fileLogger.close()
+
+
+class ReferenceImage(object):
+    """ A reference image, along with its keypoints and descriptors
+
+    Parameters
+    ----------
+    path : string
+        Path to the 2D reference image
+    featureDetect : object
+        instance of cv2 SIFT class used to find the keypoints
+    name : string, optional
+        label for this reference in the outputs (default: the file name
+        without its extension)
+
+    """
+    def __init__(self, path, featureDetect, name=None):
+        self.path = path
+        self.name = name or os.path.splitext(os.path.basename(path))[0]
+
+        # Load the reference image
+        self.color = cv2.imread(path)
+        if self.color is None:
+            raise IOError('could not read reference image: {}'.format(path))
+        self.gray = cv2.cvtColor(self.color, cv2.COLOR_BGR2GRAY)
+        self.size = (self.gray.shape[1], self.gray.shape[0])
+
+        # Find keypoints, descriptors for the reference image
+        self.kp, self.des = featureDetect.detectAndCompute(self.gray, None)
+        self.pts = np.float32([kp.pt for kp in self.kp])
+
+    def contains(self, points):
+        """ Return a boolean array; True where the (N, 2) points fall on the image """
+        return ((points[:, 0] >= 0) & (points[:, 0] < self.size[0]) &
+                (points[:, 1] >= 0) & (points[:, 1] < self.size[1]))
+
+
+class GazeMapper(object):
+    """ Map gaze data from the world camera to one or more fixed reference images
+
+    All of the setup that only depends on the reference images (the feature
+    detector, the reference image keypoints and descriptors, and a matcher
+    trained on those descriptors) happens once, when the GazeMapper is
+    created. The same GazeMapper can then be used to map any number of
+    recordings, individual frames, or points without repeating that work.
+
+    When given several reference images (e.g. multiple stimuli on a gallery
+    wall), features are detected on each world camera frame once and matched
+    against a single index of the descriptors from every reference image, with
+    each match labelled by the reference it came from. A homography is then
+    computed for every reference that has enough matches on the frame.
+
+    Parameters
+    ----------
+    referenceImage : string or list of strings
+        Path(s) to the 2D reference image(s)
+    distanceRatio : float, optional
+        Ratio test threshold (0-1) applied to the 2 nearest matches of every
+        frame feature; lower values are more conservative (overrides the
+        matchSettings value)
+    minMatches : int, optional
+        A frame needs more than this many good matches to a reference image
+        before a homography is computed for it
+    homographySettings : dict, optional
+        robust estimator and quality check settings for the homographies (see
+        getHomographySettings). Homographies that fail the quality checks are
+        treated as if the reference wasn't found on the frame
+    smoothing : dict, optional
+        if supplied, the homographies of every mapped recording are smoothed
+        over time and short gaps are filled in, and the gaze data is remapped
+        with them (see homographySmoothing.py). Keys 'window' and 'maxGap'
+        override the defaults in homographySmoothing.DEFAULT_SMOOTHING
+    projection : string, optional
+        how the reference images are shown in the ref2world_mapping video:
+        'image' to insert them into the frame, or 'outline' to only draw
+        their outline (cheaper; see projectImage2D)
+    videoSettings : dict, optional
+        size, frame rate, and layout of the preview videos (see
+        getVideoSettings)
+    heatmap : dict, optional
+        if supplied, a confidence-weighted gaze density grid is accumulated
+        for every reference image as each recording is mapped, and written
+        out as a heatmap (see gazeHeatmap.py). Keys override the defaults in
+        gazeHeatmap.DEFAULT_HEATMAP
+    threads : dict, optional
+        OpenCV and NumPy thread settings applied whenever a recording is
+        mapped (see threadTuning.getThreadSettings). They apply to the whole
+        process, so set them when running several mapping jobs side by side
+        to keep them from oversubscribing the cores
+    matchSettings : dict, optional
+        ratio test and FLANN search settings, and guided matching, which
+        matches each frame against the reference keypoints near where the
+        previous frame's homography puts them (see getMatchSettings)
+    prefilter : dict, optional
+        if supplied, each frame is first checked for the reference images
+        with a cheap, low resolution search, and only registered with the
+        ones it finds (see stimulusPrefilter.py). Keys override the defaults
+        in stimulusPrefilter.DEFAULT_PREFILTER
+    dedup : dict, optional
+        if supplied, a frame that is (nearly) identical to the last registered
+        frame isn't registered again, and reuses its homographies (see
+        frameDedup.py). Keys override the defaults in frameDedup.DEFAULT_DEDUP
+    threadPlan : dict, optional
+        the plan threadTuning.autoTune picked the thread settings with. Its
+        thread settings are used for any that threads leaves as None, and the
+        plan and its trials are recorded in each recording's log
+
+    """
+    def __init__(self, referenceImage, distanceRatio=None, minMatches=10, homographySettings=None,
+                 smoothing=None, projection='image', videoSettings=None, heatmap=None, threads=None,
+                 matchSettings=None, prefilter=None, dedup=None, threadPlan=None):
+        if isinstance(referenceImage, str):
+            referenceImage = [referenceImage]
+        self.matchSettings = getMatchSettings(matchSettings)
+        if distanceRatio is not None:
+            self.matchSettings = getMatchSettings(dict(self.matchSettings, distanceRatio=distanceRatio))
+        self.distanceRatio = self.matchSettings['distanceRatio']
+        self.minMatches = minMatches
+        self.homographySettings = getHomographySettings(homographySettings)
+        if projection not in PROJECTION_MODES:
+            raise ValueError('unknown projection mode: {} (options: {})'.format(projection, PROJECTION_MODES))
+        self.projection = projection
+        self.videoSettings = getVideoSettings(videoSettings)
+        self.smoothing = None
+        if smoothing is not None:
+            self.smoothing = dict(homographySmoothing.DEFAULT_SMOOTHING, **smoothing)
+        self.heatmap = None
+        if heatmap is not None:
+            self.heatmap = gazeHeatmap.getHeatmapSettings(heatmap)
+        self.threadPlan = threadPlan
+        self.threads = threadTuning.getThreadSettings(threads)
+        if threadPlan is not None:
+            self.threads = threadTuning.withPlan(self.threads, threadPlan)
+        self.logger = logging.getLogger('mapGaze')
+
+        # Load the reference images, find their keypoints and descriptors
+        self.featureDetect = core.createFeatureDetector()
+        self.references = []
+        for path in referenceImage:
+            name = os.path.splitext(os.path.basename(path))[0]
+            if name in [ref.name for ref in self.references]:
+                name = '{}_{}'.format(name, len(self.references))
+            self.references.append(ReferenceImage(path, self.featureDetect, name))
+
+        # attributes of the first reference, for single reference use
+        self.referenceImage = self.references[0].path
+        self.refImgColor = self.references[0].color
+        self.refImg = self.references[0].gray
+        self.ref_kp, self.ref_des, self.ref_pts = (self.references[0].kp,
+                                                   self.references[0].des,
+                                                   self.references[0].pts)
+
+        # cheap check for the references on each frame, before registering it
+        self.prefilter = None
+        if prefilter is not None:
+            self.prefilter = stimulusPrefilter.StimulusPrefilter([ref.gray for ref in self.references], prefilter)
+
+        # check for frames repeating the last registered one
+        self.dedup = None
+        if dedup is not None:
+            self.dedup = frameDedup.FrameDeduplicator(dedup)
+
+        # Train a matcher on the combined reference descriptors; each match's
+        # imgIdx identifies which reference it belongs to
+        self.matcher = createMatcher(self.matchSettings)
+        self.matcher.add([ref.des for ref in self.references])
+        self.matcher.train()
+
+        # working buffers reused from frame to frame (see map_frame)
+        self._frameBuffers = {}
+
+    def map_recording(self, gazeData, worldCameraVid, outputDir, nFrames=None, progress=None):
+        """ Map the gaze across all frames of a mobile eye-tracking session
+
+        See processRecording for a description of the inputs and output files.
+        If supplied, progress is called after every frame with a dict of
+        per-frame metrics: 'frame' (index), 'nFrames' (number of frames to
+        process), 'foundGoodMatch', 'numMatches', and 'frameTime' (seconds
+        spent on the frame)
+
+        Returns
+        -------
+        gazeMapped_df : pandas.DataFrame or None
+            the mapped gaze data (as written to gazeData_mapped.tsv), or None
+            if no gaze data could be mapped
+
+        """
+        # Create output directory
+        if not os.path.isdir(outputDir):
+            os.makedirs(outputDir)
+
+        logger, fileLogger = setupLogging(outputDir)
+        threadTuning.applyThreadSettings(self.threads)
+        try:
+            return self._mapRecording(gazeData, worldCameraVid, outputDir, nFrames, logger, progress)
+        finally:
+            closeLogging(fileLogger)
+
+    def _mapRecording(self, gazeData, worldCameraVid, outputDir, nFrames, logger, progress=None):
+        references = self.references
+        multiRef = len(references) > 1
+
+        # Log Inputs
+        if isinstance(gazeData, GazeData):
+            logger.info('Gaze Data: in memory ({} samples)'.format(len(gazeData)))
+        else:
+            logger.info('Gaze Data File: {}'.format(gazeData))
+        logger.info('World Camera Video: {}'.format(worldCameraVid))
+        for ref in references:
+            logger.info('Reference Image: {}'.format(ref.path))
+        logger.info('Output Directory: {}'.format(outputDir))
+        logger.info('OpenCV version: {}'.format(cv2.__version__))
+        logger.info(threadTuning.describeThreadSettings())
+        if self.threadPlan is not None:
+            logger.info('Thread plan (auto-tuned): {}'.format(threadTuning.describePlan(self.threadPlan)))
+            for trial in self.threadPlan['trials']:
+                logger.info('Thread plan trial: {}'.format(threadTuning.describeTrial(trial).strip()))
+        for ref in references:
+            logger.info('Reference Image {}: found {} keypoints'.format(ref.name, len(ref.kp)))
+
+        # Copy the reference stim into the output dir
+        for ref in references:
+            shutil.copy(ref.path, outputDir)
+
+        # Load gaze data
+        if isinstance(gazeData, GazeData):
+            gazeWorld = gazeData
+        else:
+            gazeWorld = GazeData.fromFile(gazeData)
+        gazeMapped = []         # mapped gaze data for each frame
+
+        ### Prep the video data #######################################
+        # Load the video, get parameters
+        vid = core.openVideo(worldCameraVid)
+        totalFrames, vidSize, fps = core.videoProperties(vid)
+
+        # preview videos (world_gaze, ref_gaze, ref2world_mapping, or mapping_qa)
+        videos = PreviewVideos(outputDir, references, vidSize, fps, self.videoSettings, self.projection)
+
+        ### Loop over video frames ###############################################
+        if nFrames and nFrames < totalFrames:
+            framesToUse = np.arange(0, nFrames, 1)
+        else:
+            framesToUse = np.arange(0, totalFrames, 1)
+
+        # world2ref homography for every frame and reference (nan if no match)
+        homographies = np.full((len(references), framesToUse.shape[0], 3, 3), np.nan)
+
+        # per-frame match and homography quality metrics, for every reference
+        metricCols = ['frame', 'refImage', 'foundGoodMatch', 'skipped', 'prefilterScore', 'reused', 'numMatches',
+                      'guided', 'numInliers', 'inlierRatio', 'reprojError', 'convex', 'areaRatio', 'rejectReason']
+        frameMetrics = []
+
+        # gaze density on every reference image
+        heatmaps = None
+        if self.heatmap is not None:
+            heatmaps = [gazeHeatmap.HeatmapAccumulator(ref.size, **self.heatmap) for ref in references]
+
+        # the decoded frame's buffer, reused from frame to frame
+        frameBuffer = None
+        # the previous frame's result, to guide the matching on the next
+        previousFrame = None
+
+        frameProcessing_startTime = time.time()
+        frameCounter = 0
+        nSkipped = 0            # frames the prefilter didn't find any reference on
+        nReused = 0             # frames that reused the last registered frame's result
+
+        while vid.isOpened():
+            # read the next frame of the video (into the previous frame's buffer)
+            if frameBuffer is None:
+                ret, frame = vid.read()
+            else:
+                ret, frame = vid.read(frameBuffer)
+
+            # check if it's a valid frame
+            if (ret is True) and (frameCounter < framesToUse.shape[0]):
+                frame_startTime = time.time()
+                frameBuffer = frame
+                videoFrame = {}
+
+                # process this frame
+                processedFrame = self.map_frame(frame, frameCounter, reuseBuffers=True, previous=previousFrame)
+                previousFrame = processedFrame
+                nSkipped += all(refFr.skipped for refFr in processedFrame['references'])
+                nReused += processedFrame['reused'] > 0
+                for i, refFr in enumerate(processedFrame['references']):
+                    frameMetrics.append([frameCounter, references[i].name] +
+                                        [refFr.get(col, np.nan) for col in metricCols[2:-1]] +
+                                        [refFr.get('rejectReason') or ''])
+
+                # if good match between a reference image and this frame
+                if processedFrame['foundGoodMatch']:
+                    matchedRefs = [i for i, refFr in enumerate(processedFrame['references'])
+                                   if refFr['foundGoodMatch']]
+                    for i in matchedRefs:
+                        homographies[i, frameCounter] = processedFrame['references'][i]['world2ref']
+
+                    # the reference images are projected back into the video as a way to check for good mapping
+                    videoFrame['ref2worlds'] = [(i, processedFrame['references'][i]['ref2world']) for i in matchedRefs]
+
+                    # grab the gaze data (world coords) for this frame
+                    samples = gazeWorld.frameSlice(frameCounter)
+                    nSamples = samples.stop - samples.start
+
+                    # translate normalized gaze data to world pixel coords
+                    world_gazeXs = gazeWorld.norm_pos_x[samples] * processedFrame['frame_gray'].shape[1]
+                    world_gazeYs = gazeWorld.norm_pos_y[samples] * processedFrame['frame_gray'].shape[0]
+                    worldCoords = np.stack([world_gazeXs, world_gazeYs], axis=1)
+
+                    # covert from world to reference image pixel coordinates. With
+                    # multiple references, each sample is assigned to the
+                    # reference it lands on (-1 if none)
+                    refCoords = np.full((nSamples, 2), np.nan)
+                    refLabels = np.full(nSamples, -1)
+                    if nSamples > 0:
+                        for i in matchedRefs:
+                            mapped = self.map_points(worldCoords, processedFrame['references'][i]['world2ref'])
+                            if multiRef:
+                                onRef = (refLabels == -1) & references[i].contains(mapped)
+                            else:
+                                onRef = np.ones(nSamples, dtype=bool)
+                            refCoords[onRef] = mapped[onRef]
+                            refLabels[onRef] = i
+
+                        thisFrame_df = pd.DataFrame({'gaze_ts': gazeWorld.timestamp[samples],
+                                                     'worldFrame': frameCounter,
+                                                     'confidence': gazeWorld.confidence[samples],
+                                                     'world_gazeX': world_gazeXs,
+                                                     'world_gazeY': world_gazeYs,
+                                                     'ref_gazeX': refCoords[:, 0],
+                                                     'ref_gazeY': refCoords[:, 1]})
+                        if multiRef:
+                            thisFrame_df['refImage'] = [references[i].name if i >= 0 else '' for i in refLabels]
+                        gazeMapped.append(thisFrame_df)
+
+                        if heatmaps is not None:
+                            for i in matchedRefs:
+                                onRef = refLabels == i
+                                heatmaps[i].add(refCoords[onRef], gazeWorld.confidence[samples][onRef])
+
+                    # draw the gaze on the different coordinate systems
+                    if nSamples > 0:
+                        videoFrame.update(worldCoords=worldCoords, refCoords=refCoords, refLabels=refLabels)
+
+                # write outputs to video
+                videos.write(frameCounter, frame, processedFrame['origFrame'], **videoFrame)
+
+                if progress is not None:
+                    progress({'frame': frameCounter,
+                              'nFrames': framesToUse.shape[0],
+                              'foundGoodMatch': processedFrame['foundGoodMatch'],
+                              'numMatches': sum(refFr.get('numMatches', 0) for refFr in processedFrame['references']),
+                              'frameTime': time.time() - frame_startTime})
+
+            # increment frame counter
+            frameCounter += 1
+            if frameCounter > np.max(framesToUse):
+                break
+
+        # release all videos
+        vid.release()
+        videos.release()
+
+        # write out the homographies
+        np.savez(join(outputDir, 'homographies.npz'),
+                 **{ref.name: homographies[i] for i, ref in enumerate(references)})
+
+        # smooth the homographies over time, and remap the gaze with them
+        if self.smoothing is not None:
+            homographySmoothing.smoothRecording(outputDir, gazeWorld, vidSize,
+                                                homographies={ref.name: homographies[i]
+                                                              for i, ref in enumerate(references)},
+                                                refSizes={ref.name: ref.size for ref in references},
+                                                **self.smoothing)
+
+        # write out the heatmaps
+        if heatmaps is not None:
+            for ref, heatmap in zip(references, heatmaps):
+                heatmap.write(outputDir, ref.color, gazeHeatmap.outputName(ref.name, multiRef))
+                logger.info('Heatmap {}: {} samples'.format(ref.name, heatmap.nSamples))
+
+        # write out the frame metrics
+        pd.DataFrame(frameMetrics, columns=metricCols).to_csv(join(outputDir, 'frameMetrics.tsv'),
+                                                               sep='\t',
+                                                               index=False,
+                                                               float_format='%.3f')
+
+        # write out gaze data
+        gazeMapped_df = None
+        try:
+            colOrder = ['worldFrame', 'gaze_ts', 'confidence',
+                        'world_gazeX', 'world_gazeY',
+                        'ref_gazeX', 'ref_gazeY']
+            if multiRef:
+                colOrder.append('refImage')
+            gazeMapped_df = pd.concat(gazeMapped, ignore_index=True)[colOrder]
+            gazeMapped_df.to_csv(join(outputDir, 'gazeData_mapped.tsv'),
+                                 sep='\t',
+                                 index=False,
+                                 float_format='%.3f')
+        except Exception as e:
+            logger.info(e)
+            logger.info('cound not write gazeData_mapped to csv')
+
+        endTime = time.time()
+        frameProcessing_time = endTime - frameProcessing_startTime
+        logger.info('Total time: %s seconds' % frameProcessing_time)
+        logger.info('Avg time/frame: %s seconds' % (frameProcessing_time / framesToUse.shape[0]))
+        if self.prefilter is not None:
+            logger.info('Prefilter skipped {} of {} frames'.format(nSkipped, framesToUse.shape[0]))
+        if self.dedup is not None:
+            logger.info('Reused the homographies of a duplicate frame on {} of {} frames'.format(
+                nReused, framesToUse.shape[0]))
+
+        return gazeMapped_df
+
+    def map_frame(self, frame, frameIdx=None, reuseBuffers=False, previous=None):
+        """ Find the mapping between a single world camera frame and the
+        reference image(s)
+
+        Parameters
+        ----------
+        frame : np.ndarray
+            frame from world camera video
+        frameIdx : int, optional
+            frame index (0-based), used for logging
+        reuseBuffers : bool, optional
+            write origFrame and frame_gray into buffers owned by the mapper
+            instead of allocating new ones. They are overwritten by the next
+            call that reuses buffers, so copy them if they need to be kept
+        previous : FrameResult, optional
+            result of the previous frame. With guided matching (see
+            getMatchSettings), the homographies of the references found on it
+            guide the matching on this frame. With dedup, a frame that repeats
+            the last registered frame reuses its result
+
+        Returns
+        -------
+        fr : FrameResult
+            entries storing all of the relevant output for this particular
+            frame (see processFrame); read them like dict items or
+            attributes. fr['references'] holds a ReferenceMatch for each
+            reference image with its own 'foundGoodMatch', 'ref2world', and
+            'world2ref' entries (and with the prefilter, 'prefilterScore' and
+            'skipped', which is True if it wasn't registered). The top level
+            'foundGoodMatch' is True if any reference matched, and the top
+            level 'ref2world' and 'world2ref' are those of the first
+            reference that matched. 'reused' (top level and on every
+            reference) counts the frames since the one whose result was
+            reused, and is 0 if the frame was registered itself
+
+        """
+        fr = FrameResult()
+        fr.references = [ReferenceMatch() for ref in self.references]
+
+        # copy of the original frame, and its grayscale version
+        if reuseBuffers:
+            if self._frameBuffers.get('color') is None or self._frameBuffers['color'].shape != frame.shape:
+                self._frameBuffers['color'] = np.empty_like(frame)
+            np.copyto(self._frameBuffers['color'], frame)
+            fr.origFrame = self._frameBuffers['color']
+            frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._frameBuffers.get('gray'))
+            self._frameBuffers['gray'] = frame_gray
+        else:
+            fr.origFrame = frame.copy()
+            frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        fr.frame_gray = frame_gray
+
+        # a frame repeating the last registered frame reuses its result
+        if self.dedup is not None:
+            fr.thumbnail = self.dedup.thumbnail(frame_gray)
+            if previous is not None and self.dedup.isDuplicate(fr.thumbnail, previous.get('thumbnail')):
+                fr.thumbnail = previous['thumbnail']
+                fr.reused = previous['reused'] + 1
+                fr.references = [refFr.copy() for refFr in previous['references']]
+                for refFr in fr.references:
+                    refFr.reused = fr.reused
+                fr.update({k: previous[k] for k in ['foundGoodMatch', 'ref2world', 'world2ref'] if k in previous})
+                self.logger.info('frame {} repeats the last registered frame; reused its homographies'.format(
+                    frameIdx))
+                return fr
+
+        # only register the references the prefilter finds on the frame
+        toSearch = list(range(len(self.references)))
+        if self.prefilter is not None:
+            scores = self.prefilter.scores(frame_gray)
+            for i, present in enumerate(self.prefilter.present(scores)):
+                fr.references[i].prefilterScore = scores[i]
+                fr.references[i].skipped = not present
+            toSearch = [i for i in toSearch if not fr.references[i].skipped]
+            if len(toSearch) == 0:
+                self.logger.info('skipped frame {}: no reference image found by the prefilter'.format(frameIdx))
+
+        # try to match the frame and the reference images
+        frame_kp, frame_des = [], None
+        try:
+            if len(toSearch) > 0:
+                frame_kp, frame_des = self.featureDetect.detectAndCompute(frame_gray, None)
+                self.logger.info('found {} features on frame {}'.format(len(frame_kp), frameIdx))
+                frame_pts = np.float32([kp.pt for kp in frame_kp]).reshape(-1, 2)
+
+            # guided matching, for each reference found on the previous frame
+            if self.matchSettings['guided'] and previous is not None and len(frame_kp) >= 2:
+                frameGrid = KeypointGrid(frame_pts, self.matchSettings['gridSize'])
+                for i in list(toSearch):
+                    ref = self.references[i]
+                    prevFr = previous['references'][i]
+                    if not prevFr['foundGoodMatch']:
+                        continue
+                    refIdx, kpIdx = guidedMatches(ref.pts, ref.des, prevFr['ref2world'], frameGrid, frame_des,
+                                                  self.matchSettings)
+                    refFr = fr['references'][i]
+                    refFr.guided = True
+                    registerMatches(refFr, ref.pts[refIdx] if len(refIdx) > 0 else None, frame_pts[kpIdx],
+                                    frameIdx, self.minMatches, settings=self.homographySettings,
+                                    refSize=ref.size, frameSize=frame_gray.shape)
+                    if refFr.foundGoodMatch:
+                        toSearch.remove(i)
+                    else:
+                        self.logger.info('guided matching failed on frame {}; matching all features'.format(frameIdx))
+                        fr['references'][i] = ReferenceMatch()
+                        fr['references'][i].update({k: refFr.get(k) for k in ['skipped', 'prefilterScore']
+                                                    if k in refFr})
+
+            goodMatches = []
+            if len(frame_kp) >= 2 and len(toSearch) > 0:
+                # match each frame feature to its 2 nearest reference features
+                matches = self.matcher.knnMatch(frame_des, k=2)
+                goodMatches = [m[0] for m in matches
+                               if len(m) == 2 and m[0].distance < self.distanceRatio * m[1].distance]
+
+            # register the frame with each reference using only its own matches
+            for i in toSearch:
+                ref = self.references[i]
+                refMatches = [m for m in goodMatches if m.imgIdx == i]
+                ref_matchPts, frame_matchPts = None, None
+                if len(refMatches) > 0:
+                    ref_matchPts = ref.pts[[m.trainIdx for m in refMatches]]
+                    frame_matchPts = frame_pts[[m.queryIdx for m in refMatches]]
+                registerMatches(fr['references'][i], ref_matchPts, frame_matchPts, frameIdx, self.minMatches,
+                                settings=self.homographySettings, refSize=ref.size, frameSize=frame_gray.shape)
+        except cv2.error as e:
+            self.logger.warning('could not register frame {}: {}'.format(frameIdx, e))
+
+        fr.foundGoodMatch = False
+        for refFr in fr.references:
+            if refFr.foundGoodMatch:
+                fr.foundGoodMatch = True
+                fr.ref2world = refFr.ref2world
+                fr.world2ref = refFr.world2ref
+                break
+
+        # return the processed frame
+        return fr
+
+    def map_points(self, points, world2ref, rounded=True):
+        """ Map points from world camera to reference image pixel coordinates
+
+        Parameters
+        ----------
+        points : array_like
+            (N, 2) array of (x, y) world camera pixel coordinates
+        world2ref : np.ndarray
+            2D transformation matrix from the world camera frame to the
+            reference image (e.g. the 'world2ref' entry returned by map_frame)
+        rounded : bool, optional
+            round the mapped coordinates to the nearest pixel
+
+        Returns
+        -------
+        np.ndarray
+            (N, 2) array of mapped (x, y) reference image coordinates
+
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        mappedPoints = cv2.perspectiveTransform(points, world2ref).reshape(-1, 2)
+        if rounded:
+            mappedPoints = np.round(mappedPoints)
+        return mappedPoints
+
+
+def processRecording(gazeData=None, worldCameraVid=None, referenceImage=None, outputDir=None, nFrames=None,
+                     homographySettings=None, smoothing=None, projection='image', videoSettings=None, heatmap=None,
+                     threads=None, matchSettings=None, prefilter=None, dedup=None, threadPlan=None):
+    """ Map the gaze across all frames of mobile eye-tracking session
+
+    This method will iterate over every frame of the supplied video recording.
+    On each frame, it will look for the matches with the specified
+    referenceImage, create a linear transformation matrix, and map the gaze
+    data from the world camera coordinate system to the reference image
+    coordinate system.
+
+    This parent method will take care of setting up all of the inputs, and at
+    the end, writing all of the output files. To map several recordings to the
+    same reference image, create a single GazeMapper and call its
+    map_recording method for each one instead.
+
+    Parameters
+    ----------
+    gazeData : string or GazeData
+        Path to the gazeData file, or a GazeData object already in memory (e.g.
+        as returned by the preprocessing routines). The file is expected to be
+        a .csv/.tsv file with columns for:
+            timestamp - timestamp (ms) corresponding to each sample
+            frame_idx - index (0-based) of the worldCameraVid frame
+                        corresponding to each sample
+            confidence - confidence of the validity of each sample (0-1)
+            norm_pos_x - normalized x position of gaze location (0-1).
+                         Normalized with respect to width of worldCameraVid
+            norm_pos_y - normalized y position of gaze location (0-1).
+                         Normalized with respect to height of worldCameraVid
+        It can also be a directory of the same columns as .npy arrays (see
+        gazeData.convertFile), which are memory-mapped so only the samples of
+        the frames being mapped are read into memory
+    worldCameraVid : string
+        Path to the video recording from the world camera (.mp4)
+    referenceImage : string or list of strings
+        Path to the 2D reference image. Supply a list of paths to map gaze to
+        several reference images in a single pass over the video
+    outputDir : string
+        Path to output directory where data will be saved
+    nFrames : int, optional
+        If specified, will only process given number of frames (default of
+        None means it will process ALL frames in the video). Useful for testing
+        on abbreviated number of frames
+    homographySettings : dict, optional
+        robust estimator and quality check settings for the homographies (see
+        getHomographySettings)
+    smoothing : dict, optional
+        if supplied, also smooth the homographies over time and remap the gaze
+        data with them (see GazeMapper)
+    projection : string, optional
+        'image' (default) or 'outline': how the reference image is shown in
+        ref2world_mapping.m4v (see GazeMapper)
+    videoSettings : dict, optional
+        scale and frame rate of each preview video, or a single side-by-side
+        QA video instead of the three separate ones (see getVideoSettings)
+    heatmap : dict, optional
+        if supplied, also write a gaze density heatmap for the reference
+        image(s), accumulated as the frames are mapped (see GazeMapper)
+    threads : dict, optional
+        OpenCV and NumPy thread settings for this process, e.g. to give each
+        of several concurrent jobs its share of the cores (see
+        threadTuning.getThreadSettings)
+    matchSettings : dict, optional
+        ratio test and FLANN search settings, and whether to guide the
+        matching on each frame with the previous frame's homography (see
+        getMatchSettings)
+    prefilter : dict, optional
+        if supplied, skip registering frames (with references) that a cheap,
+        low resolution search doesn't find the reference image(s) on (see
+        GazeMapper)
+    dedup : dict, optional
+        if supplied, frames that repeat the last registered frame reuse its
+        homographies instead of being registered again (see GazeMapper)
+    threadPlan : dict, optional
+        the threadTuning.autoTune plan the thread settings come from, recorded
+        in the log (see GazeMapper)
+
+    Output files
+    ------------
+    world_gaze.m4v : video
+        world video with original gaze points overlaid
+    ref_gaze.m4v : video
+         ref image with mapped gaze points overlaid (with multiple reference
+         images, one ref_gaze_<name>.m4v per reference)
+    ref2world_mapping.m4v : video
+        world video with reference image projected and inserted into it (or
+        only its outline drawn, with projection='outline')
+    mapping_qa.m4v : video
+        only with the 'qa' video layout, instead of the three videos above:
+        ref2world_mapping with the world gaze overlaid, side by side with the
+        reference image(s) with the mapped gaze overlaid
+    gazeData_mapped.tsv :  data file
+        gazeData represented in both coordinate systems, the world and
+        reference image. With multiple reference images, an additional
+        refImage column names the reference each sample landed on (blank,
+        with nan ref coordinates, if it didn't land on any of them)
+    homographies.npz : data file
+        world2ref homography for every processed frame, stored under the name
+        of each reference image (nan for frames without a match)
+    frameMetrics.tsv : data file
+        for every frame and reference image: the prefilter score and whether
+        the reference was skipped, how many frames ago the reused result was
+        registered (0 if it wasn't reused), the number of matches (and
+        whether they were found by guided matching), and the quality of the
+        homography (inlier count and ratio, mean reprojection error, whether
+        the reference corners project to a convex quadrilateral, and its area
+        as a fraction of the frame), along with the reason the homography was
+        rejected, if it was
+    homographies_smoothed.npz, gazeData_mapped_smoothed.tsv : data files
+        only if smoothing is supplied: the smoothed homographies, and all of
+        the gaze data mapped with them (see homographySmoothing.py)
+    heatmap.png, heatmap.npy : image, data file
+        only if heatmap is supplied: the reference image with the gaze density
+        overlaid, and the raw confidence-weighted density grid (with multiple
+        reference images, heatmap_<name> for each reference)
+    mapGazeLog.log : log file
+        processing log, including the thread settings in effect (and the
+        thread plan they came from, if any)
+
+    """
+    mapper = GazeMapper(referenceImage, homographySettings=homographySettings, smoothing=smoothing,
+                        projection=projection, videoSettings=videoSettings, heatmap=heatmap, threads=threads,
+                        matchSettings=matchSettings, prefilter=prefilter, dedup=dedup, threadPlan=threadPlan)
+    return mapper.map_recording(gazeData, worldCameraVid, outputDir, nFrames=nFrames)
+
+
+def registerMatches(fr, ref_matchPts, frame_matchPts, frameIdx, minMatches=10, settings=None,
+                    refSize=None, frameSize=None):
+    """ Compute the homographies between a frame and the reference image from
+    a set of matched points, and store them in the frame dict along with
+    their quality metrics (see homographyQuality) and, if the homography was
+    rejected, a 'rejectReason'
+
+    Parameters
+    ----------
+    fr : dict
+        frame dict to store the results in (see processFrame)
+    ref_matchPts, frame_matchPts : np.ndarray or None
+        matched keypoint locations on the reference image and the frame
+    frameIdx : int
+        frame index (0-based), used for logging
+    minMatches : int, optional
+        the frame needs more than this many matches to be registered
+    settings : dict, optional
+        homography settings (see getHomographySettings)
+    refSize : tuple, optional
+        (width, height) of the reference image, for the corner checks
+    frameSize : tuple, optional
+        (height, width) of the frame, for the area check
+
+    """
+    logger = logging.getLogger('mapGaze')
+    settings = getHomographySettings(settings)
+
+    # check if matches were found
+    fr['numMatches'] = 0
+    fr['rejectReason'] = None
+    if ref_matchPts is None:
+        logger.info('no matches found on frame {}'.format(frameIdx))
+        sufficientMatches = False
+    else:
+        numMatches = ref_matchPts.shape[0]
+        fr['numMatches'] = numMatches
+
+        # if sufficient number of matches....
+        if numMatches > minMatches:
+            logger.info('found {} matches on frame {}'.format(numMatches, frameIdx))
+            sufficientMatches = True
+        else:
+            logger.info('Insufficient matches ({} matches) on frame {}'.format(numMatches, frameIdx))
+            sufficientMatches = False
+
+    fr['foundGoodMatch'] = sufficientMatches
+
+    # figure out homographies between coordinate systems
+    if sufficientMatches:
+        ref2world_transform, mask = cv2.findHomography(ref_matchPts.reshape(-1, 1, 2),
+                                                       frame_matchPts.reshape(-1, 1, 2),
+                                                       homographyMethods()[settings['method']],
+                                                       settings['threshold'],
+                                                       maxIters=settings['maxIters'],
+                                                       confidence=settings['confidence'])
+        if ref2world_transform is None:
+            fr['rejectReason'] = 'no homography found'
+        else:
+            fr.update(homographyQuality(ref2world_transform, mask, ref_matchPts, frame_matchPts,
+                                        refSize, frameSize))
+            fr['rejectReason'] = checkHomography(fr, settings)
+
+        if fr['rejectReason'] is not None:
+            logger.info('Rejected homography on frame {}: {}'.format(frameIdx, fr['rejectReason']))
+            fr['foundGoodMatch'] = False
+            return
+        world2ref_transform = cv2.invert(ref2world_transform)
+
+        fr['ref2world'] = ref2world_transform
+        fr['world2ref'] = world2ref_transform[1]
+
+
+def processFrame(frame, frameIdx, ref_kp, ref_des, featureDetect):
+    """ Process single frame from the world camera to determine mapping to
+    ref image
+
+    Parameters
+    ---------
+    frame : np.ndarray
+        frame from world camera video
+    frameIdx : int
+        frame index (0-based)
+    ref_kp : list
+        identified keypoints on the reference image
+    ref_des : np.ndarray
+        descriptors for the reference image keypoints
+    featureDetect : object
+        instance of cv2 SIFT class
+
+    Returns
+    -------
+    fr : dict
+        dictionary with entries storing all of the relevant output for this
+        particular frame
+
+    """
+    logger = logging.getLogger('mapGaze')
+
+    fr = {}        # create dict to store info for this frame
+
+    # create copy of original frame
+    origFrame = frame.copy()
+    fr['origFrame'] = origFrame         # store
+
+    # convert to grayscale
+    frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    fr['frame_gray'] = frame_gray
+
+    # try to match the frame and the reference image
+    try:
+        frame_kp, frame_des = featureDetect.detectAndCompute(frame_gray, None)
+        logger.info('found {} features on frame {}'.format(len(frame_kp), frameIdx))
+
+        if len(frame_kp) < 2:
+            ref_matchPts, frame_matchPts = None, None
+        else:
+            ref_matchPts, frame_matchPts = findMatches(ref_kp,
+                                                       ref_des,
+                                                       frame_kp,
+                                                       frame_des)
+
+        registerMatches(fr, ref_matchPts, frame_matchPts, frameIdx)
+
+    except:
+        fr['foundGoodMatch'] = False
+
+    # return the processed frame
+    return fr
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # Parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('gazeData',
+                        help='path to gaze data file (or gaze arrays dir)')
+    parser.add_argument('worldCameraVid',
+                        help='path to world camera video file')
+    parser.add_argument('referenceImage', nargs='+',
+                        help='path to reference image file(s)')
+    parser.add_argument('-o', '--outputDir',
+                        help='output directory [default: create "mappedGazeOutput" dir in same directory as gazeData file]')
+    parser.add_argument('--homographyMethod', choices=sorted(HOMOGRAPHY_FLAGS),
+                        default=DEFAULT_HOMOGRAPHY_SETTINGS['method'],
+                        help='robust estimator used to compute the homographies [default: ransac]')
+    parser.add_argument('--ransacThreshold', type=float, default=DEFAULT_HOMOGRAPHY_SETTINGS['threshold'],
+                        help='max reprojection error (px) for a match to count as an inlier [default: 5.0]')
+    parser.add_argument('--minInlierRatio', type=float, default=DEFAULT_HOMOGRAPHY_SETTINGS['minInlierRatio'],
+                        help='reject homographies supported by a smaller fraction of the matches [default: 0.25]')
+    parser.add_argument('--smooth', action='store_true',
+                        help='smooth the homographies over time, fill short gaps, and remap the gaze with them')
+    parser.add_argument('--heatmap', action='store_true',
+                        help='write a gaze density heatmap of the reference image(s)')
+    parser.add_argument('--projection', choices=PROJECTION_MODES, default='image',
+                        help='show the reference image in ref2world_mapping.m4v by inserting it, or only drawing its outline [default: image]')
+    parser.add_argument('--videoLayout', choices=VIDEO_LAYOUTS, default='separate',
+                        help='write separate preview videos, a single side-by-side mapping_qa.m4v, or none [default: separate]')
+    parser.add_argument('--videoScale', nargs='+', default=[], metavar='[VIDEO=]SCALE',
+                        help='resize the preview videos by SCALE, or only VIDEO ({}) with VIDEO=SCALE [default: 1]'.format(
+                            ', '.join(VIDEO_NAMES)))
+    parser.add_argument('--videoEvery', nargs='+', default=[], metavar='[VIDEO=]N',
+                        help='only write every Nth frame to the preview videos, or only to VIDEO with VIDEO=N [default: 1]')
+    parser.add_argument('--guided', action='store_true',
+                        help='match each frame against the reference keypoints near where the previous frame\'s homography puts them')
+    parser.add_argument('--searchRadius', type=float, default=DEFAULT_MATCH_SETTINGS['searchRadius'],
+                        help='search radius (px) around each predicted keypoint in guided matching [default: {}]'.format(
+                            DEFAULT_MATCH_SETTINGS['searchRadius']))
+    parser.add_argument('--distanceRatio', type=float, default=DEFAULT_MATCH_SETTINGS['distanceRatio'],
+                        help='ratio test threshold (0-1) for feature matches [default: {}]'.format(
+                            DEFAULT_MATCH_SETTINGS['distanceRatio']))
+    parser.add_argument('--flannChecks', type=int, default=DEFAULT_MATCH_SETTINGS['checks'],
+                        help='FLANN leaves searched per feature; lower = faster, less accurate [default: {}]'.format(
+                            DEFAULT_MATCH_SETTINGS['checks']))
+    parser.add_argument('--flannTrees', type=int, default=DEFAULT_MATCH_SETTINGS['trees'],
+                        help='FLANN kd-trees [default: {}]'.format(DEFAULT_MATCH_SETTINGS['trees']))
+    parser.add_argument('--prefilter', action='store_true',
+                        help='skip frames where a quick low resolution search doesn\'t find the reference image(s)')
+    parser.add_argument('--prefilterMinInliers', type=int, default=stimulusPrefilter.DEFAULT_PREFILTER['minInliers'],
+                        help='min prefilter score for a reference to be registered on a frame [default: {}]'.format(
+                            stimulusPrefilter.DEFAULT_PREFILTER['minInliers']))
+    parser.add_argument('--dedup', action='store_true',
+                        help='reuse the homographies of the last registered frame on frames that repeat it')
+    parser.add_argument('--dedupThreshold', type=float, default=frameDedup.DEFAULT_DEDUP['threshold'],
+                        help='max difference (gray levels) of a frame from the last registered one to count as a '
+                             'repeat [default: {}]'.format(frameDedup.DEFAULT_DEDUP['threshold']))
+    threadTuning.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    # preview video settings
+    videoSettings = {'layout': args.videoLayout}
+    for option, key, cast in [(args.videoScale, 'scale', float), (args.videoEvery, 'every', int)]:
+        for value in option:
+            if '=' in value:
+                name, value = value.split('=', 1)
+                if name not in VIDEO_NAMES:
+                    parser.error('unknown video: {} (options: {})'.format(name, ', '.join(VIDEO_NAMES)))
+                videoSettings.setdefault(name, {})[key] = cast(value)
+            else:
+                videoSettings[key] = cast(value)
+
+    # Input error checking
+    badInputs = []
+    for arg in [args.gazeData, args.worldCameraVid] + args.referenceImage:
+        if not os.path.exists(arg):
+            badInputs.append(arg)
+    if len(badInputs) > 0:
+        [print('{} does not exist! Check your input file path'.format(x)) for x in badInputs]
+        sys.exit()
+
+    # Set output directory
+    if args.outputDir is None:
+        inputDir, tmp = os.path.split(args.gazeData)
+        outputDir = join(inputDir, 'mappedGazeOuput')
+    else:
+        outputDir = args.outputDir
+
+    ## process the recording
+    print('processing the recording...')
+    print('Output saved in: {}'.format(outputDir))
+    processRecording(gazeData=args.gazeData,
+                     worldCameraVid=args.worldCameraVid,
+                     referenceImage=args.referenceImage,
+                     outputDir=outputDir,
+                     homographySettings={'method': args.homographyMethod,
+                                         'threshold': args.ransacThreshold,
+                                         'minInlierRatio': args.minInlierRatio},
+                     smoothing={} if args.smooth else None,
+                     heatmap={} if args.heatmap else None,
+                     projection=args.projection,
+                     videoSettings=videoSettings,
+                     threads=threadTuning.settingsFromArgs(args),
+                     matchSettings={'guided': args.guided,
+                                    'searchRadius': args.searchRadius,
+                                    'distanceRatio': args.distanceRatio,
+                                    'checks': args.flannChecks,
+                                    'trees': args.flannTrees},
+                     prefilter={'minInliers': args.prefilterMinInliers} if args.prefilter else None,
+                     dedup={'threshold': args.dedupThreshold} if args.dedup else None,
+                     threadPlan=threadTuning.planFromArgs(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,401 @@
+""" Long-running local gaze mapping service
+
+Keeps mapGaze warmed up in a single process so that recordings can be
+submitted for mapping without paying for a fresh Python/OpenCV startup, or
+re-detecting reference image features, on every run. The service:
+    - caches GazeMapper objects (and so the reference image features and
+      trained matchers) for every set of reference images it has seen
+    - queues submitted jobs and runs them on a pool of worker threads
+    - records progress and per-frame metrics for every job, which clients can
+      stream back while the job runs
+    - writes exactly the same outputs as processRecording (see mapGaze.py)
+
+So that a long-running service doesn't grow without bound, only the last
+maxEvents events of a job are kept, and events are dropped once a client has
+read them. Finished jobs are forgotten jobTTL seconds after they finish, and
+only the last maxFinishedJobs of them are kept.
+
+Jobs can be submitted over a local HTTP API:
+    POST /jobs                  submit a job. JSON body with keys gazeData,
+                                worldCameraVid, referenceImage (path or list
+                                of paths), outputDir, and optionally nFrames.
+                                Returns {"id": <jobId>}
+    GET  /jobs                  status of all jobs
+    GET  /jobs/<id>             status of a job
+    GET  /jobs/<id>/events      progress events for a job. Use ?since=<n> to
+                                only get events after the first n, and
+                                ?wait=<seconds> to block until new events
+                                arrive (or the job finishes). "first" is the
+                                index of the first event returned, which is
+                                past `since` if older events were dropped
+
+HTTPClient wraps the HTTP API, and LocalClient offers the same interface by
+calling a MappingService in the same process (useful for testing, or for
+embedding the service in another program).
+
+Usage:
+    mobileGazeMapping serve [--host HOST] [--port PORT] [--workers N]
+                            [--preload REFIMAGE [REFIMAGE ...]] ...
+                            [--maxEvents N] [--maxFinishedJobs N] [--jobTTL S]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import traceback
+from collections import deque
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.request import Request, urlopen
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib2 import Request, urlopen
+    from urlparse import urlparse, parse_qs
+
+from . import mapGaze
+
+JOB_KEYS = ['gazeData', 'worldCameraVid', 'referenceImage', 'outputDir', 'nFrames']
+FINISHED = ['done', 'failed']
+
+
+class MappingService(object):
+    """ Queue of gaze mapping jobs, run on a pool of worker threads
+
+    Parameters
+    ----------
+    nWorkers : int, optional
+        number of jobs to run at once
+    mapperOptions : dict, optional
+        keyword arguments passed to every GazeMapper the service creates
+    maxEvents : int, optional
+        most events kept for a job; older ones are dropped
+    maxFinishedJobs : int, optional
+        most finished jobs kept; the ones that finished first are forgotten
+    jobTTL : float, optional
+        seconds a finished job is kept for
+
+    """
+    def __init__(self, nWorkers=1, mapperOptions=None, maxEvents=1000, maxFinishedJobs=100, jobTTL=3600):
+        self.mapperOptions = mapperOptions or {}
+        self.maxEvents = maxEvents
+        self.maxFinishedJobs = maxFinishedJobs
+        self.jobTTL = jobTTL
+        self.jobs = {}
+        self._queue = deque()
+        self._mappers = {}          # reference images -> list of idle GazeMappers
+        self._lock = threading.Condition()
+        self._running = True
+        self._workers = [threading.Thread(target=self._work, name='mapGazeWorker{}'.format(i))
+                         for i in range(nWorkers)]
+        for worker in self._workers:
+            worker.daemon = True
+            worker.start()
+
+    @staticmethod
+    def _refKey(referenceImage):
+        if isinstance(referenceImage, str):
+            referenceImage = [referenceImage]
+        return tuple(os.path.abspath(r) for r in referenceImage)
+
+    def preload(self, referenceImage):
+        """ Create (and cache) a GazeMapper for a reference image, or a set of
+        them, ahead of time """
+        self._releaseMapper(self._refKey(referenceImage), self._acquireMapper(referenceImage))
+
+    def _acquireMapper(self, referenceImage):
+        """ Take an idle cached mapper for these reference images, or create one """
+        key = self._refKey(referenceImage)
+        with self._lock:
+            idle = self._mappers.setdefault(key, [])
+            if len(idle) > 0:
+                return idle.pop()
+        return mapGaze.GazeMapper(list(key), **self.mapperOptions)
+
+    def _releaseMapper(self, key, mapper):
+        with self._lock:
+            self._mappers.setdefault(key, []).append(mapper)
+
+    def submit(self, gazeData, worldCameraVid, referenceImage, outputDir, nFrames=None):
+        """ Queue a recording for mapping. Returns the job id """
+        job = {'id': uuid.uuid4().hex,
+               'status': 'queued',
+               'params': {'gazeData': gazeData,
+                          'worldCameraVid': worldCameraVid,
+                          'referenceImage': referenceImage,
+                          'outputDir': outputDir,
+                          'nFrames': nFrames},
+               'submitted': time.time(),
+               'started': None,
+               'finished': None,
+               'error': None,
+               'firstEvent': 0,
+               'events': deque(maxlen=self.maxEvents)}
+        with self._lock:
+            self._forgetFinishedJobs()
+            self.jobs[job['id']] = job
+            self._queue.append(job['id'])
+            self._lock.notify_all()
+        return job['id']
+
+    def status(self, jobId):
+        """ Return the status of a job (everything except its events) """
+        with self._lock:
+            job = self.jobs[jobId]
+            summary = {k: v for k, v in job.items() if k not in ['events', 'firstEvent']}
+            summary['nEvents'] = job['firstEvent'] + len(job['events'])
+        return summary
+
+    def allStatus(self):
+        """ Return the status of every job the service still has """
+        with self._lock:
+            self._forgetFinishedJobs()
+            return [self.status(jobId) for jobId in self.jobs]
+
+    def events(self, jobId, since=0, wait=0):
+        """ Return the job's events after the first `since`, waiting up to
+        `wait` seconds for new ones if there aren't any yet
+
+        Events before `since` have been read, and are dropped. 'first' is the
+        index of the first event returned: past `since` if events were
+        dropped before they were read (see maxEvents)
+        """
+        deadline = time.time() + wait
+        with self._lock:
+            job = self.jobs[jobId]
+            while (job['firstEvent'] + len(job['events']) <= since and job['status'] not in FINISHED
+                   and time.time() < deadline):
+                self._lock.wait(deadline - time.time())
+            for i in range(min(since - job['firstEvent'], len(job['events']))):
+                job['events'].popleft()
+                job['firstEvent'] += 1
+            return {'status': job['status'], 'first': job['firstEvent'], 'events': list(job['events'])}
+
+    def _addEvent(self, job, event):
+        with self._lock:
+            if len(job['events']) == job['events'].maxlen:
+                job['firstEvent'] += 1      # the oldest event is about to be dropped
+            job['events'].append(event)
+            self._lock.notify_all()
+
+    def _forgetFinishedJobs(self):
+        """ Drop finished jobs past their TTL, and all but the last
+        maxFinishedJobs of the rest (call with the lock held) """
+        now = time.time()
+        finished = sorted((job for job in self.jobs.values() if job['status'] in FINISHED),
+                          key=lambda job: job['finished'])
+        for i, job in enumerate(finished):
+            if now - job['finished'] > self.jobTTL or i < len(finished) - self.maxFinishedJobs:
+                del self.jobs[job['id']]
+
+    def _setStatus(self, job, status, **kwargs):
+        with self._lock:
+            job['status'] = status
+            job.update(kwargs)
+            if status in FINISHED:
+                self._forgetFinishedJobs()
+            self._lock.notify_all()
+
+    def _work(self):
+        """ Worker thread loop: run queued jobs until the service is shut down """
+        while True:
+            with self._lock:
+                while self._running and len(self._queue) == 0:
+                    self._lock.wait()
+                if not self._running:
+                    return
+                job = self.jobs[self._queue.popleft()]
+            self._runJob(job)
+
+    def _runJob(self, job):
+        params = job['params']
+        self._setStatus(job, 'running', started=time.time())
+        try:
+            key = self._refKey(params['referenceImage'])
+            mapper = self._acquireMapper(params['referenceImage'])
+            try:
+                mapper.map_recording(params['gazeData'], params['worldCameraVid'], params['outputDir'],
+                                     nFrames=params['nFrames'],
+                                     progress=lambda event: self._addEvent(job, event))
+            finally:
+                self._releaseMapper(key, mapper)
+            self._setStatus(job, 'done', finished=time.time())
+        except Exception:
+            self._setStatus(job, 'failed', finished=time.time(), error=traceback.format_exc())
+
+    def shutdown(self):
+        """ Stop the worker threads once they finish their current jobs """
+        with self._lock:
+            self._running = False
+            self._lock.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+
+class _Client(object):
+    """ Methods shared by the local and HTTP clients """
+    def stream(self, jobId, poll=1.0):
+        """ Generator yielding the job's progress events as they arrive, until
+        the job finishes """
+        since = 0
+        while True:
+            result = self.events(jobId, since=since, wait=poll)
+            for event in result['events']:
+                yield event
+            since = result['first'] + len(result['events'])
+            if result['status'] not in ['queued', 'running'] and len(result['events']) == 0:
+                return
+
+    def wait(self, jobId, poll=1.0):
+        """ Block until the job finishes, and return its final status """
+        for event in self.stream(jobId, poll):
+            pass
+        return self.status(jobId)
+
+
+class LocalClient(_Client):
+    """ Client for a MappingService running in the same process """
+    def __init__(self, service):
+        self.service = service
+
+    def submit(self, gazeData, worldCameraVid, referenceImage, outputDir, nFrames=None):
+        return self.service.submit(gazeData, worldCameraVid, referenceImage, outputDir, nFrames)
+
+    def status(self, jobId):
+        return self.service.status(jobId)
+
+    def events(self, jobId, since=0, wait=0):
+        return self.service.events(jobId, since, wait)
+
+
+class HTTPClient(_Client):
+    """ Client for a MappingService served over HTTP (see makeServer) """
+    def __init__(self, url='http://127.0.0.1:8765'):
+        self.url = url.rstrip('/')
+
+    def _request(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        request = Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+        response = urlopen(request)
+        try:
+            return json.loads(response.read().decode())
+        finally:
+            response.close()
+
+    def submit(self, gazeData, worldCameraVid, referenceImage, outputDir, nFrames=None):
+        return self._request('/jobs', {'gazeData': gazeData,
+                                       'worldCameraVid': worldCameraVid,
+                                       'referenceImage': referenceImage,
+                                       'outputDir': outputDir,
+                                       'nFrames': nFrames})['id']
+
+    def status(self, jobId):
+        return self._request('/jobs/{}'.format(jobId))
+
+    def events(self, jobId, since=0, wait=0):
+        return self._request('/jobs/{}/events?since={}&wait={}'.format(jobId, since, wait))
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def makeServer(service, host='127.0.0.1', port=8765):
+    """ Create an HTTP server exposing the service's API. Call serve_forever()
+    on the returned server to start handling requests (port=0 picks a free
+    port; see server.server_address) """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [p for p in url.path.split('/') if p]
+            query = parse_qs(url.query)
+            try:
+                if parts == ['jobs']:
+                    self._send(200, service.allStatus())
+                elif len(parts) == 2 and parts[0] == 'jobs':
+                    self._send(200, service.status(parts[1]))
+                elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'events':
+                    since = int(query.get('since', ['0'])[0])
+                    wait = float(query.get('wait', ['0'])[0])
+                    self._send(200, service.events(parts[1], since, wait))
+                else:
+                    self._send(404, {'error': 'not found'})
+            except KeyError:
+                self._send(404, {'error': 'unknown job'})
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/jobs':
+                self._send(404, {'error': 'not found'})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
+                missing = [k for k in JOB_KEYS[:4] if k not in body]
+                if len(missing) > 0:
+                    raise ValueError('missing job parameters: {}'.format(missing))
+                jobId = service.submit(**{k: body.get(k) for k in JOB_KEYS})
+            except ValueError as e:
+                self._send(400, {'error': str(e)})
+                return
+            self._send(200, {'id': jobId})
+
+        def log_message(self, format, *args):
+            pass        # keep request logging out of the console
+
+    return _ThreadingHTTPServer((host, port), Handler)
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # Parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on [default: 127.0.0.1]')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on [default: 8765]')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of jobs to run at once [default: 1]')
+    parser.add_argument('--preload', nargs='+', action='append', default=[],
+                        help='set of reference image(s) to detect features on at startup (repeat for more sets)')
+    parser.add_argument('--maxEvents', type=int, default=1000, help='most events kept per job [default: 1000]')
+    parser.add_argument('--maxFinishedJobs', type=int, default=100,
+                        help='most finished jobs kept [default: 100]')
+    parser.add_argument('--jobTTL', type=float, default=3600,
+                        help='seconds a finished job is kept for [default: 3600]')
+    args = parser.parse_args(argv)
+
+    service = MappingService(nWorkers=args.workers, maxEvents=args.maxEvents, maxFinishedJobs=args.maxFinishedJobs,
+                             jobTTL=args.jobTTL)
+    for referenceImages in args.preload:
+        service.preload(referenceImages)
+
+    server = makeServer(service, args.host, args.port)
+    print('mapGaze service listening on http://{}:{}'.format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+        sys.exit()
+
+
+if __name__ == '__main__':
+    main()
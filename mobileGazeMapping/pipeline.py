@@ -0,0 +1,268 @@
+""" Preprocess (and optionally map) a batch of raw recordings concurrently
+
+Every session goes through the same stages:
+    copy      - create the output dir and bring the raw data over (see the
+                rawMode option in preprocessing/io_utils.py)
+    gaze      - format the gaze data
+    transcode - compress the world camera video with ffmpeg
+    map       - map the gaze to the reference image(s) (only if reference
+                images are supplied), reading frames from the raw movie
+    cleanup   - remove intermediate files
+
+The stages are driven by an asyncio event loop, and each kind of stage is
+limited to its own number of concurrent runs (see DEFAULT_LIMITS), so the
+disk, ffmpeg, and the CPU-bound mapping all stay busy at once: e.g. the next
+session is copied while the current one is transcoding and the previous one
+is being mapped. Within a session, the transcode starts as soon as the raw
+data is in place and runs alongside the gaze formatting and mapping.
+
+Copies, gaze formatting, and ffmpeg (which all spend most of their time
+waiting on the disk or a subprocess) run on a thread pool; mapping runs on a
+process pool. Each mapping process limits OpenCV and NumPy to its share of
+the cores (see threadTuning.py), so concurrent maps don't oversubscribe them.
+
+A summary manifest (pipelineManifest.json) is written to the output root with
+the status of every session, and how long each stage took and waited for a
+free slot.
+
+Usage:
+    mobileGazeMapping pipeline inputDirs [inputDirs ...] outputDir
+                               [-r REFIMAGE [REFIMAGE ...]] [--maxCopies N]
+                               [--maxGazes N] [--maxTranscodes N] [--maxMaps N]
+                               [--cvThreads N] [--numpyThreads N] [--openCL {on,off}]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import traceback
+from os.path import join
+from concurrent.futures import ThreadPoolExecutor
+
+from .preprocessing import batch_preprocessing
+from .preprocessing import transcode
+from .preprocessing import io_utils
+from . import mapGaze
+from . import threadTuning
+
+STAGES = ['copy', 'gaze', 'transcode', 'map']
+
+# maximum number of concurrent runs of each stage
+DEFAULT_LIMITS = {'copy': 2, 'gaze': 2, 'transcode': 1, 'map': os.cpu_count() or 1}
+
+MANIFEST_NAME = 'pipelineManifest.json'
+
+
+def mapSession(gazeData, worldCameraVid, referenceImage, outputDir, nFrames=None, threads=None, threadPlan=None):
+    """ Map a session's gaze (run in a mapping worker process) """
+    mapGaze.processRecording(gazeData=gazeData,
+                             worldCameraVid=worldCameraVid,
+                             referenceImage=referenceImage,
+                             outputDir=outputDir,
+                             nFrames=nFrames,
+                             threads=threads,
+                             threadPlan=threadPlan)
+    return outputDir
+
+
+class _Stages(object):
+    """ Runs blocking stage functions on the right executor, within the
+    stage's concurrency limit, recording how long each one waited and ran """
+    def __init__(self, loop, limits, threadPool, mapPool):
+        self.loop = loop
+        self.slots = {stage: asyncio.Semaphore(limits[stage]) for stage in STAGES}
+        self.threadPool = threadPool
+        self.mapPool = mapPool
+
+    async def run(self, stage, timings, func, *args):
+        waitStart = time.time()
+        async with self.slots[stage]:
+            startTime = time.time()
+            timings[stage + 'Wait'] = startTime - waitStart
+            executor = self.mapPool if stage == 'map' else self.threadPool
+            try:
+                return await self.loop.run_in_executor(executor, func, *args)
+            finally:
+                timings[stage] = time.time() - startTime
+
+
+async def processSession(stages, session, output_root, referenceImage=None, transcodeSettings=None,
+                         rawMode='copy', nFrames=None, threads=None, threadPlan=None):
+    """ Run every stage for a single session. Returns the session's manifest entry """
+    entry = dict(session)
+    entry.update({'outputDir': None, 'mappedDir': None, 'status': 'failed', 'error': None,
+                  'transcode': None, 'rawMode': rawMode, 'io': None, 'timings': {}})
+    timings = entry['timings']
+    ioStats = io_utils.IOStats()
+    startTime = time.time()
+
+    videoTask = None
+    try:
+        steps = await stages.run('copy', timings, batch_preprocessing.setupSession,
+                                 session, output_root, transcodeSettings, rawMode, ioStats)
+        entry['outputDir'] = steps['outputDir']
+
+        # compress the world video alongside everything else
+        videoTask = asyncio.ensure_future(stages.run('transcode', timings, steps['videoStep']))
+
+        gazeData = await stages.run('gaze', timings, steps['gazeStep'])
+
+        if referenceImage is not None:
+            entry['mappedDir'] = await stages.run('map', timings, mapSession,
+                                                  gazeData, steps['rawMovie'], referenceImage,
+                                                  join(steps['outputDir'], 'mappedGazeOutput'), nFrames, threads,
+                                                  threadPlan)
+
+        transcodeResult = await videoTask
+        if transcodeResult is not None:
+            entry['transcode'] = transcodeResult['mode']
+
+        # remove intermediate files
+        if hasattr(steps['module'], 'cleanup'):
+            cleanupStart = time.time()
+            steps['module'].cleanup(steps['outputDir'])
+            timings['cleanup'] = time.time() - cleanupStart
+
+        entry['status'] = 'ok'
+    except Exception:
+        entry['error'] = traceback.format_exc()
+        print('Pipeline failed for {}:\n{}'.format(session['inputDir'], entry['error']))
+        if videoTask is not None:
+            # don't leave the transcode running unobserved
+            await asyncio.wait([videoTask])
+
+    timings['total'] = time.time() - startTime
+    entry['io'] = ioStats.asDict()
+    print('{} I/O: {}'.format(entry['outputDir'] or session['inputDir'], ioStats))
+    return entry
+
+
+async def _runSessions(loop, sessions, output_root, limits, referenceImage, transcodeSettings, rawMode, nFrames,
+                       threads, threadPlan):
+    nThreads = limits['copy'] + limits['gaze'] + limits['transcode']
+    # mapping workers are started while the copy/transcode threads are
+    # running, so they can't be forked (a child can inherit locks held by
+    # those threads and deadlock); spawn them instead
+    with ThreadPoolExecutor(max_workers=nThreads) as threadPool, \
+            threadTuning.spawnExecutor(limits['map']) as mapPool:
+        stages = _Stages(loop, limits, threadPool, mapPool)
+        return await asyncio.gather(*[processSession(stages, s, output_root, referenceImage,
+                                                     transcodeSettings, rawMode, nFrames, threads, threadPlan)
+                                      for s in sessions])
+
+
+def runPipeline(inputDirs, output_root, referenceImage=None, limits=None, transcodeSettings=None,
+                rawMode='copy', nFrames=None, threads=None, threadPlan=None):
+    """ Preprocess, and optionally map, every session found in inputDirs
+
+    Parameters
+    ----------
+    inputDirs : list of strings
+        Raw recording dirs (any mix of supported devices, see
+        preprocessing/batch_preprocessing.py)
+    output_root : string
+        Output directory root. Data will be written to recording specific dirs
+        within this directory
+    referenceImage : string or list of strings, optional
+        Reference image(s) to map each session's gaze to. Mapped outputs are
+        written to a 'mappedGazeOutput' dir in each session's output dir. If
+        None, sessions are only preprocessed
+    limits : dict, optional
+        Maximum number of concurrent runs of each stage ('copy', 'gaze',
+        'transcode', 'map'); unspecified stages use DEFAULT_LIMITS
+    transcodeSettings : dict, optional
+        ffmpeg encoder settings (see preprocessing/transcode.py)
+    rawMode : string, optional
+        How raw data is brought into the output dir (see
+        preprocessing/io_utils.py)
+    nFrames : int, optional
+        If specified, only map the given number of frames of each session
+    threads : dict, optional
+        OpenCV and NumPy thread settings of each mapping process (see
+        threadTuning.getThreadSettings). Unspecified thread counts default to
+        an equal share of the cores for each of the concurrent maps
+    threadPlan : dict, optional
+        threadTuning.autoTune plan; its thread settings are used for any that
+        threads leaves unspecified, and it is recorded in each mapping log
+
+    Returns
+    -------
+    manifest : dict
+        The summary manifest, as written to pipelineManifest.json
+
+    """
+    if not os.path.isdir(output_root):
+        os.makedirs(output_root)
+    limits = dict(DEFAULT_LIMITS, **(limits or {}))
+    threads = threadTuning.getThreadSettings(threads)
+    if threadPlan is not None:
+        threads = threadTuning.withPlan(threads, threadPlan)
+    for key, value in threadTuning.splitCores(limits['map']).items():
+        if threads[key] is None:
+            threads[key] = value
+
+    sessions = batch_preprocessing.findSessions(inputDirs)
+    print('Found {} sessions'.format(len(sessions)))
+
+    # the pipeline already limits transcodes; don't queue them a second time
+    transcode.setTranscodeSlots(limits['transcode'])
+
+    startTime = time.time()
+    loop = asyncio.new_event_loop()
+    try:
+        entries = loop.run_until_complete(_runSessions(loop, sessions, output_root, limits, referenceImage,
+                                                       transcodeSettings, rawMode, nFrames, threads,
+                                                       threadPlan))
+    finally:
+        loop.close()
+
+    manifest = {'outputRoot': output_root,
+                'limits': limits,
+                'threads': threads,
+                'threadPlan': threadPlan,
+                'referenceImage': referenceImage,
+                'rawMode': rawMode,
+                'transcodeSettings': transcode.getSettings(transcodeSettings),
+                'totalTime': time.time() - startTime,
+                'sessions': list(entries)}
+    with open(join(output_root, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    nFailed = sum(e['status'] != 'ok' for e in entries)
+    print('Processed {} sessions ({} failed) in {:.1f} seconds'.format(len(entries), nFailed, manifest['totalTime']))
+    return manifest
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('inputDirs', nargs='+', help='paths to raw recording dirs (any mix of supported devices)')
+    parser.add_argument('outputDir', help='output directory root. Data will be written to recording specific dirs within this directory')
+    parser.add_argument('-r', '--referenceImage', nargs='+', default=None, help='reference image file(s) to map gaze to [default: preprocess only]')
+    for stage in STAGES:
+        parser.add_argument('--max{}s'.format(stage.capitalize()), type=int, default=DEFAULT_LIMITS[stage],
+                            help='max number of concurrent {} steps [default: {}]'.format(stage, DEFAULT_LIMITS[stage]))
+    transcode.addArguments(parser)
+    io_utils.addArguments(parser)
+    threadTuning.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    limits = {stage: getattr(args, 'max{}s'.format(stage.capitalize())) for stage in STAGES}
+    runPipeline(args.inputDirs, args.outputDir,
+                referenceImage=args.referenceImage,
+                limits=limits,
+                transcodeSettings=transcode.settingsFromArgs(args),
+                rawMode=args.rawMode,
+                threads=threadTuning.settingsFromArgs(args),
+                threadPlan=threadTuning.planFromArgs(args))
+
+
+if __name__ == '__main__':
+    main()
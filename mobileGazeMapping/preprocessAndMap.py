@@ -0,0 +1,123 @@
+""" Preprocess a raw mobile eye-tracking recording and map its gaze in one go
+
+Runs the device preprocessing (see the `preprocessing` dir) and mapGaze on a
+single raw recording within a single process. The formatted gaze data is handed
+to the mapper in memory rather than being written to gazeData_world.tsv and
+parsed back in, and mapping starts as soon as the gaze table is ready: frames
+are read from the raw world camera movie while the compressed worldCamera.mp4
+is still being transcoded in the background.
+
+The device is detected automatically from the contents of the input dir.
+
+Outputs are written to the same [date]/[time] output dir the preprocessing
+scripts use, with the mapGaze outputs in a 'mappedGazeOutput' dir within it.
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import argparse
+from os.path import join
+from concurrent.futures import ThreadPoolExecutor
+
+from .preprocessing import batch_preprocessing
+from .preprocessing import transcode
+from .preprocessing import io_utils
+from . import mapGaze
+
+
+def preprocessAndMap(inputDir, output_root, referenceImage, sessionNum=None,
+                     transcodeSettings=None, rawMode='copy', nFrames=None):
+    """ Preprocess the raw recording in inputDir and map its gaze data
+
+    Parameters
+    ----------
+    inputDir : string
+        Path to the raw recording dir
+    output_root : string
+        Output directory root. Data will be written to a recording specific
+        dir within this directory
+    referenceImage : string
+        Path to the 2D reference image
+    sessionNum : int, optional
+        Session number (required for SMI data)
+    transcodeSettings : dict, optional
+        ffmpeg encoder settings (see preprocessing/transcode.py)
+    rawMode : string, optional
+        How raw data is brought into the output dir (see
+        preprocessing/io_utils.py)
+    nFrames : int, optional
+        If specified, only map the given number of frames
+
+    Returns
+    -------
+    outputDir : string
+        Path to the recording specific output dir
+
+    """
+    device = batch_preprocessing.detectDevice(inputDir)
+    if device is None:
+        raise ValueError('Could not detect device for: {}'.format(inputDir))
+    if device == 'smi' and sessionNum is None:
+        raise ValueError('A session number is required for SMI data')
+
+    session = {'inputDir': inputDir, 'device': device, 'sessionNum': sessionNum}
+    ioStats = io_utils.IOStats()
+    steps = batch_preprocessing.setupSession(session, output_root, transcodeSettings, rawMode, ioStats)
+    outputDir = steps['outputDir']
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # start compressing the world video
+        videoFuture = executor.submit(steps['videoStep'])
+
+        # format the gaze data
+        gazeData = steps['gazeStep']()
+
+        # map from the raw movie while the transcode finishes
+        mapGaze.processRecording(gazeData=gazeData,
+                                 worldCameraVid=steps['rawMovie'],
+                                 referenceImage=referenceImage,
+                                 outputDir=join(outputDir, 'mappedGazeOutput'),
+                                 nFrames=nFrames)
+        videoFuture.result()
+
+    # remove intermediate files
+    if hasattr(steps['module'], 'cleanup'):
+        steps['module'].cleanup(outputDir)
+    print('I/O: {}'.format(ioStats))
+
+    return outputDir
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('inputDir', help='path to the raw recording dir')
+    parser.add_argument('outputDir', help='output directory root. Data will be written to recording specific dirs within this directory')
+    parser.add_argument('referenceImage', help='path to reference image file')
+    parser.add_argument('-s', '--sessionNum', type=int, default=None, help='session number (SMI data only)')
+    transcode.addArguments(parser)
+    io_utils.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    # Input error checking
+    if not os.path.isdir(args.inputDir):
+        print('Invalid input dir: {}'.format(args.inputDir))
+        sys.exit()
+    if not os.path.exists(args.referenceImage):
+        print('{} does not exist! Check your input file path'.format(args.referenceImage))
+        sys.exit()
+
+    outputDir = preprocessAndMap(args.inputDir, args.outputDir, args.referenceImage,
+                                 sessionNum=args.sessionNum,
+                                 transcodeSettings=transcode.settingsFromArgs(args),
+                                 rawMode=args.rawMode)
+    print('Output saved in: {}'.format(outputDir))
+
+
+if __name__ == '__main__':
+    main()
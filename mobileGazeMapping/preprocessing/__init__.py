@@ -0,0 +1,3 @@
+""" Preprocessing of raw recordings from each supported device (Pupil Labs,
+SMI, Tobii) into the gazeData_world.tsv, frame_timestamps.tsv, and
+worldCamera.mp4 inputs of mapGaze """
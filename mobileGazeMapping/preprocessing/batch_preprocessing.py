@@ -0,0 +1,292 @@
+"""
+Batch preprocess raw recordings from multiple devices.
+
+Takes a list of raw recording directories, auto-detects which device each one
+came from (Pupil Labs, SMI, or Tobii), and runs the matching preprocessing
+routine on every session across a pool of worker processes. Within each
+session, the world camera transcode runs in a background thread while the
+gaze data is being formatted, so the CPU-bound gaze formatting overlaps with
+the ffmpeg compression of the same recording.
+
+Device detection:
+    - Pupil Labs: directory contains 'info.csv' and 'pupil_data'
+    - Tobii: directory contains 'segment.json' and 'livedata.json.gz'
+    - SMI: directory contains '<...>-<sessionNum>-<...>.avi' movie files and
+      matching '<...>_<sessionNum>_<...>.txt' data files. Every session found
+      in the directory is preprocessed.
+
+Raw data is copied, linked, or read in place according to rawMode (see
+io_utils.py), and the bytes read/written for each session are logged.
+
+World camera transcodes are limited to maxTranscodes at a time across all
+worker processes (default: one per worker), and use the supplied encoder
+settings (see transcode.py).
+
+In addition to the per-session outputs written by each device preprocessor,
+a summary manifest (preprocessingManifest.json) is written to the output root
+with the status and per-step timings of every session.
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import importlib
+import traceback
+import multiprocessing
+from os.path import join
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import transcode
+from . import io_utils
+
+# preprocessing module for each supported device
+DEVICE_MODULES = {'pl': 'pl_preprocessing',
+                  'smi': 'smi_preprocessing',
+                  'tobii': 'tobii_preprocessing'}
+
+MANIFEST_NAME = 'preprocessingManifest.json'
+
+
+def detectDevice(inputDir):
+    """
+    Return the device ('pl', 'smi', 'tobii') that produced the raw recording
+    in inputDir, or None if it can't be determined
+    """
+    files = os.listdir(inputDir)
+    if 'info.csv' in files and 'pupil_data' in files:
+        return 'pl'
+    if 'segment.json' in files and 'livedata.json.gz' in files:
+        return 'tobii'
+    if len(findSMIsessions(inputDir)) > 0:
+        return 'smi'
+    return None
+
+
+def findSMIsessions(inputDir):
+    """
+    Return a sorted list of the session numbers in a raw SMI export directory.
+    A session is only included if both its movie and its data file are present
+    """
+    files = os.listdir(inputDir)
+    movieSessions = set()
+    for f in files:
+        match = re.search(r'-(\d+)-', f)
+        if match and f.lower().endswith('.avi'):
+            movieSessions.add(int(match.group(1)))
+
+    sessions = []
+    for sessionNum in sorted(movieSessions):
+        dataTag = '_' + str(sessionNum).zfill(3) + '_'
+        if any((dataTag in f) and f.lower().endswith('.txt') for f in files):
+            sessions.append(sessionNum)
+    return sessions
+
+
+def findSessions(inputDirs):
+    """
+    Build the list of sessions to preprocess from the supplied input dirs.
+    Each session is a dict with keys 'inputDir', 'device', and 'sessionNum'
+    (None for devices that store one session per directory)
+    """
+    sessions = []
+    for inputDir in inputDirs:
+        if not os.path.isdir(inputDir):
+            print('Invalid input dir: {}'.format(inputDir))
+            continue
+
+        device = detectDevice(inputDir)
+        if device is None:
+            print('Could not detect device for: {}'.format(inputDir))
+            continue
+
+        if device == 'smi':
+            for sessionNum in findSMIsessions(inputDir):
+                sessions.append({'inputDir': inputDir, 'device': device, 'sessionNum': sessionNum})
+        else:
+            sessions.append({'inputDir': inputDir, 'device': device, 'sessionNum': None})
+    return sessions
+
+
+def runOverlapped(videoStep, gazeStep, timings):
+    """
+    Run the video step in a background thread while running the gaze step in
+    this one. The time each step took is written to the timings dict. Returns
+    the value returned by the video step
+    """
+    def timed(name, step):
+        startTime = time.time()
+        result = step()
+        timings[name] = time.time() - startTime
+        return result
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        videoFuture = executor.submit(timed, 'video', videoStep)
+        timed('gaze', gazeStep)
+        return videoFuture.result()        # re-raises any error from the video step
+
+
+def setupSession(session, output_root, transcodeSettings=None, rawMode='copy', ioStats=None):
+    """
+    Create the output dir for a session (copying/linking the raw data for
+    devices that need it), and return a dict describing the remaining work:
+        module - the device preprocessing module
+        outputDir - the session output dir
+        rawMovie - path to the raw world camera movie
+        videoStep - function that transcodes the world camera movie
+        gazeStep - function that formats the gaze data (returns a GazeData)
+    """
+    module = importlib.import_module('.' + DEVICE_MODULES[session['device']], __package__)
+    inputDir = session['inputDir']
+
+    if session['device'] == 'pl':
+        # pupil labs raw data is always read in place
+        outputDir = module.makeOutputDir(inputDir, output_root)
+        rawMovie = join(inputDir, 'world.mp4')
+        videoStep = lambda: module.prepWorldVideo(inputDir, outputDir, transcodeSettings, ioStats)
+        gazeStep = lambda: module.prepGazeData(inputDir, outputDir, ioStats)
+    else:
+        if session['device'] == 'smi':
+            sessionNum = session['sessionNum']
+            outputDir = module.copySMI_recording(inputDir, sessionNum, output_root, rawMode, ioStats)
+            rawFiles = module.getRawFiles(inputDir, sessionNum, outputDir, rawMode)
+        else:
+            outputDir = module.copyTobiiRecording(inputDir, output_root, rawMode, ioStats)
+            rawFiles = module.getRawFiles(inputDir, outputDir, rawMode)
+        rawMovie = rawFiles['movie']
+        videoStep = lambda: module.prepWorldVideo(outputDir, transcodeSettings, rawFiles, ioStats)
+        gazeStep = lambda: module.prepGazeData(outputDir, rawFiles, ioStats)
+
+    return {'module': module, 'outputDir': outputDir, 'rawMovie': rawMovie,
+            'videoStep': videoStep, 'gazeStep': gazeStep}
+
+
+def preprocessSession(session, output_root, transcodeSettings=None, rawMode='copy'):
+    """
+    Preprocess a single session. Returns a manifest entry for the session with
+    the output dir, status, transcode mode, bytes read/written, and per-step
+    timings (seconds)
+    """
+    entry = dict(session)
+    entry.update({'outputDir': None, 'status': 'failed', 'error': None,
+                  'transcode': None, 'rawMode': rawMode, 'io': None, 'timings': {}})
+    timings = entry['timings']
+    ioStats = io_utils.IOStats()
+    startTime = time.time()
+
+    try:
+        # set up the output dir (copying raw data for devices that need it)
+        stepStart = time.time()
+        steps = setupSession(session, output_root, transcodeSettings, rawMode, ioStats)
+        timings['setup'] = time.time() - stepStart
+        entry['outputDir'] = steps['outputDir']
+
+        # format gaze while the world video compresses
+        transcodeResult = runOverlapped(steps['videoStep'], steps['gazeStep'], timings)
+        if transcodeResult is not None:
+            entry['transcode'] = transcodeResult['mode']
+
+        # remove intermediate files
+        if hasattr(steps['module'], 'cleanup'):
+            stepStart = time.time()
+            steps['module'].cleanup(steps['outputDir'])
+            timings['cleanup'] = time.time() - stepStart
+
+        entry['status'] = 'ok'
+    except Exception:
+        entry['error'] = traceback.format_exc()
+        print('Preprocessing failed for {}:\n{}'.format(session['inputDir'], entry['error']))
+
+    timings['total'] = time.time() - startTime
+    entry['io'] = ioStats.asDict()
+    print('{} I/O: {}'.format(entry['outputDir'] or session['inputDir'], ioStats))
+    return entry
+
+
+def preprocessBatch(inputDirs, output_root, nWorkers=None, transcodeSettings=None, maxTranscodes=None, rawMode='copy'):
+    """
+    Detect and preprocess every session found in inputDirs, running sessions in
+    parallel across nWorkers processes (default: number of CPUs), with at most
+    maxTranscodes ffmpeg transcodes running at once (default: nWorkers). rawMode
+    sets how raw data is brought into the output dirs (see io_utils.py).
+    Writes the summary manifest to the output root and returns it
+    """
+    if not os.path.isdir(output_root):
+        os.makedirs(output_root)
+
+    sessions = findSessions(inputDirs)
+    print('Found {} sessions to preprocess'.format(len(sessions)))
+
+    nWorkers = nWorkers or os.cpu_count()
+    maxTranscodes = maxTranscodes or nWorkers
+
+    batchStart = time.time()
+    if nWorkers == 1:
+        transcode.setTranscodeSlots(maxTranscodes)
+        entries = [preprocessSession(s, output_root, transcodeSettings, rawMode) for s in sessions]
+    else:
+        # share one transcode limit across all of the worker processes
+        slots = multiprocessing.BoundedSemaphore(maxTranscodes)
+        if sys.version_info >= (3, 7):
+            with ProcessPoolExecutor(max_workers=nWorkers,
+                                     initializer=transcode.setTranscodeSlots,
+                                     initargs=(slots,)) as executor:
+                futures = [executor.submit(preprocessSession, s, output_root, transcodeSettings, rawMode)
+                           for s in sessions]
+                entries = [f.result() for f in futures]
+        else:
+            # ProcessPoolExecutor only takes an initializer from python 3.7 on
+            pool = multiprocessing.Pool(nWorkers,
+                                        initializer=transcode.setTranscodeSlots,
+                                        initargs=(slots,))
+            try:
+                results = [pool.apply_async(preprocessSession, (s, output_root, transcodeSettings, rawMode))
+                           for s in sessions]
+                entries = [r.get() for r in results]
+            finally:
+                pool.close()
+                pool.join()
+
+    manifest = {'outputRoot': output_root,
+                'nWorkers': nWorkers,
+                'maxTranscodes': maxTranscodes,
+                'rawMode': rawMode,
+                'transcodeSettings': transcode.getSettings(transcodeSettings),
+                'totalTime': time.time() - batchStart,
+                'sessions': entries}
+    with open(join(output_root, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    nFailed = sum(e['status'] != 'ok' for e in entries)
+    print('Preprocessed {} sessions ({} failed) in {:.1f} seconds'.format(len(entries), nFailed, manifest['totalTime']))
+    return manifest
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('inputDirs', nargs='+', help='paths to raw recording dirs (any mix of supported devices)')
+    parser.add_argument('outputDir', help='output directory root. Raw data will be written to recording specific dirs within this directory')
+    parser.add_argument('-n', '--nWorkers', type=int, default=None, help='number of worker processes [default: number of CPUs]')
+    parser.add_argument('--maxTranscodes', type=int, default=None, help='max number of concurrent ffmpeg transcodes [default: nWorkers]')
+    transcode.addArguments(parser)
+    io_utils.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    # run preprocessing on all sessions
+    preprocessBatch(args.inputDirs, args.outputDir,
+                    nWorkers=args.nWorkers,
+                    transcodeSettings=transcode.settingsFromArgs(args),
+                    maxTranscodes=args.maxTranscodes,
+                    rawMode=args.rawMode)
+
+
+if __name__ == '__main__':
+    main()
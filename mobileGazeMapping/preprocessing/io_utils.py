@@ -0,0 +1,147 @@
+"""
+File transfer helpers and I/O accounting for the preprocessing routines.
+
+Raw recordings can be brought into the output directory in one of 3 ways
+(rawMode):
+    copy - copy the raw files into the output dir (original behavior)
+    link - hard-link the raw files into the output dir, or reflink (copy-on-write
+           clone) them if hard-linking fails. Falls back to copying if the
+           output dir is on a different filesystem
+    inplace - don't bring the raw files over at all; read them directly from
+              the input dir, and only write the final outputs
+
+IOStats keeps a running total of the bytes read and written for a session so
+the cost of each mode can be logged.
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import gzip
+import shutil
+import threading
+
+RAW_MODES = ['copy', 'link', 'inplace']
+
+FICLONE = 0x40049409        # linux ioctl to reflink one file to another
+
+
+class IOStats(object):
+    """
+    Thread-safe running total of the bytes read and written for a session
+    """
+    def __init__(self):
+        self.bytesRead = 0
+        self.bytesWritten = 0
+        self._lock = threading.Lock()
+
+    def addRead(self, nBytes):
+        with self._lock:
+            self.bytesRead += nBytes
+
+    def addWritten(self, nBytes):
+        with self._lock:
+            self.bytesWritten += nBytes
+
+    def asDict(self):
+        return {'bytesRead': self.bytesRead, 'bytesWritten': self.bytesWritten}
+
+    def __str__(self):
+        return 'read {:.1f} MB, wrote {:.1f} MB'.format(self.bytesRead / 1e6, self.bytesWritten / 1e6)
+
+
+def countRead(ioStats, path):
+    """ add the size of the file at path to the bytes read (no-op if ioStats is None) """
+    if ioStats is not None and os.path.exists(path):
+        ioStats.addRead(os.path.getsize(path))
+
+
+def countWritten(ioStats, path):
+    """ add the size of the file at path to the bytes written (no-op if ioStats is None) """
+    if ioStats is not None and os.path.exists(path):
+        ioStats.addWritten(os.path.getsize(path))
+
+
+def reflink(src, dst):
+    """
+    Make dst a copy-on-write clone of src. Only works on filesystems that
+    support it (e.g. btrfs, xfs); raises OSError otherwise
+    """
+    import fcntl
+    with open(src, 'rb') as srcFile:
+        with open(dst, 'wb') as dstFile:
+            try:
+                fcntl.ioctl(dstFile.fileno(), FICLONE, srcFile.fileno())
+            except (OSError, IOError):
+                dstFile.close()
+                os.remove(dst)
+                raise
+
+
+def linkOrCopy(src, dst, ioStats=None):
+    """
+    Hard-link src to dst, falling back on a reflink, and then on a regular copy.
+    Returns the method used ('hardlink', 'reflink', or 'copy')
+    """
+    if os.path.exists(dst):
+        os.remove(dst)
+
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except (OSError, AttributeError):
+        pass
+
+    try:
+        reflink(src, dst)
+        return 'reflink'
+    except (OSError, IOError, ImportError):
+        pass
+
+    copyFile(src, dst, ioStats)
+    return 'copy'
+
+
+def copyFile(src, dst, ioStats=None):
+    """ copy src to dst, counting the bytes moved """
+    shutil.copyfile(src, dst)
+    countRead(ioStats, src)
+    countWritten(ioStats, dst)
+
+
+def transferFile(src, dst, rawMode='copy', ioStats=None):
+    """
+    Bring the raw file src over to dst according to rawMode. Returns the path the
+    raw file should be read from: dst for 'copy' and 'link', src for 'inplace'
+    """
+    if rawMode not in RAW_MODES:
+        raise ValueError('rawMode must be one of {}, not {}'.format(RAW_MODES, rawMode))
+
+    if rawMode == 'inplace':
+        return src
+    elif rawMode == 'link':
+        linkOrCopy(src, dst, ioStats)
+    else:
+        copyFile(src, dst, ioStats)
+    return dst
+
+
+def openRaw(path, ioStats=None):
+    """
+    Open a raw data file for binary reading. Gzipped files (.gz) are
+    decompressed in-stream rather than being unzipped to disk first
+    """
+    countRead(ioStats, path)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def addArguments(parser):
+    """
+    Add the rawMode option to an argparse parser
+    """
+    parser.add_argument('--rawMode', choices=RAW_MODES, default='copy',
+                        help='how raw data is brought into the output dir: copy it, link it (hard-link/reflink), or read it in place [default: copy]')
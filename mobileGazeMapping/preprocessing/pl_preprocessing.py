@@ -0,0 +1,223 @@
+""" Format raw Pupil Labs data
+
+Tested with Python 3.6, open CV 3.2
+
+The output directory will be created within the output root path specified by the user, and be named according to [mo-day-yr]/[hr-min-sec] of the original creation time.
+
+The output directory will contain:
+    - worldCamera.mp4: the video from the point-of-view scene camera on the glasses
+    - frame_timestamps.tsv: table of timestamps for each frame in the world
+    - gazeData_world.tsv: gaze data, where all gaze coordinates are represented w/r/t the world camera
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import argparse
+from datetime import datetime
+from os.path import join
+import csv
+from itertools import chain
+
+import gc
+
+from . import transcode
+from . import io_utils
+from ..lazyImport import lazyImport
+from ..gazeData import GazeData
+
+np = lazyImport('numpy')
+pd = lazyImport('pandas')
+msgpack = lazyImport('msgpack')
+
+def preprocessData(inputDir, output_root, transcodeSettings=None):
+    """ Run all preprocessing steps for pupil lab data
+
+    Returns the output dir, and the formatted gaze data as a GazeData object
+    """
+    ioStats = io_utils.IOStats()
+
+    ### Prep output directory
+    outputDir = makeOutputDir(inputDir, output_root)
+
+    ### Format the gaze data
+    gazeData = prepGazeData(inputDir, outputDir, ioStats)
+
+    ### Compress the world camera movie into the output
+    prepWorldVideo(inputDir, outputDir, transcodeSettings, ioStats)
+    print('I/O: {}'.format(ioStats))
+
+    return outputDir, gazeData
+
+
+def makeOutputDir(inputDir, output_root):
+    """ Create the [date]/[time] output directory for this recording """
+    info_file = join(inputDir, 'info.csv')      # get the timestamp from the info.csv file
+    with open(info_file, 'r') as f:
+        for line in f:
+            if 'Start Date' in line:
+                startDate = datetime.strptime(line.split(',')[1].strip('\n'), '%d.%m.%Y')
+                date_dir = startDate.strftime('%Y_%m_%d')
+            if 'Start Time' in line:
+                startTime = datetime.strptime(line.split(',')[1].strip('\n'), '%H:%M:%S')
+                time_dir = startTime.strftime('%H-%M-%S')
+
+    # create the output directory (if necessary)
+    outputDir = join(output_root, date_dir, time_dir)
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+
+    return outputDir
+
+
+def prepGazeData(inputDir, outputDir, ioStats=None):
+    """ Format the gaze data, write gazeData_world.tsv and frame_timestamps.tsv
+
+    Returns the formatted gaze data as a GazeData object
+    """
+    print('formatting gaze data...')
+    gazeData_world, frame_timestamps = formatGazeData(inputDir)
+    for f in ['pupil_data', 'world_timestamps.npy']:
+        io_utils.countRead(ioStats, join(inputDir, f))
+
+    # write the gazeData to to a csv file
+    print('writing file to csv...')
+    csv_file = join(outputDir, 'gazeData_world.tsv')
+    export_range = slice(0, len(gazeData_world))
+    with open(csv_file, 'w', encoding='utf-8', newline='') as csvfile:
+        csv_writer = csv.writer(csvfile, quoting=csv.QUOTE_NONE)
+        csv_writer.writerow(['{}\t{}\t{}\t{}\t{}'.format("timestamp",
+                            "frame_idx",
+                            "confidence",
+                            "norm_pos_x",
+                            "norm_pos_y")])
+        for g in list(chain(*gazeData_world[export_range])):
+            data = ['{:.3f}\t{:d}\t{:.1f}\t{:.3f}\t{:.3f}'.format(g["timestamp"]*1000,
+                                g["frame_idx"],
+                                g["confidence"],
+                                g["norm_pos"][0],
+                                1-g["norm_pos"][1])]  # translate y coord to origin in top-left
+            csv_writer.writerow(data)
+
+    # write the frametimestamps to a csv file
+    frameNum = np.arange(1, frame_timestamps.shape[0]+1)
+    frame_ts_df = pd.DataFrame({'frameNum': frameNum, 'timestamp': frame_timestamps})
+    frame_ts_df.to_csv(join(outputDir, 'frame_timestamps.tsv'), sep='\t', float_format='%.3f', index=False)
+
+    for f in ['gazeData_world.tsv', 'frame_timestamps.tsv']:
+        io_utils.countWritten(ioStats, join(outputDir, f))
+
+    gazeList = list(chain(*gazeData_world[export_range]))
+    return GazeData(timestamp=[g["timestamp"]*1000 for g in gazeList],
+                    frame_idx=[g["frame_idx"] for g in gazeList],
+                    confidence=[g["confidence"] for g in gazeList],
+                    norm_pos_x=[g["norm_pos"][0] for g in gazeList],
+                    norm_pos_y=[1-g["norm_pos"][1] for g in gazeList],
+                    frame_timestamps=frame_timestamps)
+
+
+def prepWorldVideo(inputDir, outputDir, transcodeSettings=None, ioStats=None):
+    """ Compress the world camera movie straight into the output dir """
+    if 'worldCamera.mp4' not in os.listdir(outputDir):
+        print('compressing world camera video')
+        result = transcode.transcode(join(inputDir, 'world.mp4'),
+                                     join(outputDir, 'worldCamera.mp4'),
+                                     transcodeSettings)
+        io_utils.countRead(ioStats, join(inputDir, 'world.mp4'))
+        io_utils.countWritten(ioStats, join(outputDir, 'worldCamera.mp4'))
+        return result
+
+
+def formatGazeData(inputDir):
+	"""
+	- load the pupil_data and timestamps
+	- get the "gaze" fields from pupil data (i.e. the gaze lcoation w/r/t world camera)
+	- sync gaze data with the world_timestamps array
+	"""
+
+	# load pupil data
+	pupil_data_path = join(inputDir, 'pupil_data')
+	with open(pupil_data_path, 'rb') as fh:
+		try:
+			gc.disable()
+			pupil_data = msgpack.unpack(fh, encoding='utf-8')
+		except Exception as e:
+			print(e)
+		finally:
+			gc.enable()
+	gaze_list = pupil_data['gaze_positions']   # gaze posiiton (world camera)
+
+	# load timestamps
+	timestamps_path = join(inputDir, 'world_timestamps.npy')
+	frame_timestamps = np.load(timestamps_path)
+
+	# align gaze with world camera timestamps
+	gaze_by_frame = correlate_data(gaze_list, frame_timestamps)
+
+	# make frame_timestamps relative to the first data timestamp
+	start_timeStamp = gaze_by_frame[0][0]['timestamp']
+	frame_timestamps = (frame_timestamps - start_timeStamp) * 1000 # convert to ms
+
+	return gaze_by_frame, frame_timestamps
+
+
+def correlate_data(data,timestamps):
+	'''
+	data:  list of data :
+		each datum is a dict with at least:
+			timestamp: float
+
+	timestamps: timestamps list to correlate  data to
+
+	this takes a data list and a timestamps list and makes a new list
+	with the length of the number of timestamps.
+	Each slot contains a list that will have 0, 1 or more associated data points.
+
+	Finally we add an index field to the datum with the associated index
+	'''
+	timestamps = np.asarray(timestamps, dtype=np.float64)
+	data_by_frame = [[] for i in range(len(timestamps))]
+
+	data.sort(key=lambda d: d['timestamp'])
+
+	# each datum belongs to the first frame whose boundary with the next frame is at or after it.
+	# we can take the midpoint between two frames in time: More appropriate for SW timestamps
+	boundaries = (timestamps[:-1] + timestamps[1:]) / 2.
+	# or the time of the next frame: More appropriate for Sart Of Exposure Timestamps (HW timestamps).
+	# boundaries = timestamps[1:]
+	frame_idxs = np.searchsorted(boundaries, [datum['timestamp'] for datum in data], side='left')
+
+	for datum, frame_idx in zip(data, frame_idxs):
+		if frame_idx == len(boundaries):
+			# we might loose a data point at the end but we dont care
+			break
+		datum['frame_idx'] = int(frame_idx)
+		data_by_frame[frame_idx].append(datum)
+
+	return data_by_frame
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('inputDir', help='path to the raw pupil labs recording dir')
+    parser.add_argument('outputDir', help='output directory root. Raw data will be written to recording specific dirs within this directory')
+    transcode.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    # check if input directory is valid
+    if not os.path.isdir(args.inputDir):
+        print('Invalid input dir: {}'.format(args.inputDir))
+        sys.exit()
+    else:
+
+        # run preprocessing on this data
+        preprocessData(args.inputDir, args.outputDir, transcode.settingsFromArgs(args))
+
+
+if __name__ == '__main__':
+    main()
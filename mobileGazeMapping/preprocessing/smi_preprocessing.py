@@ -0,0 +1,253 @@
+"""
+Format raw SMI data.
+
+Tested with Python 3.6, open CV 3.2
+
+The output directory will contain:
+    - worldCamera.mp4: the video from the point-of-view scene camera on the glasses
+    - frame_timestamps.tsv: table of timestamps for each frame in the world
+    - gazeData_world.tsv: gaze data, where all gaze coordinates are represented w/r/t the world camera
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import argparse
+from os.path import join
+
+from . import transcode
+from . import io_utils
+from .. import core
+from ..lazyImport import lazyImport
+from ..gazeData import GazeData
+
+np = lazyImport('numpy')
+pd = lazyImport('pandas')
+
+def preprocessData(inputDir, sessionNum, output_root, transcodeSettings=None, rawMode='copy'):
+    """
+    Run all preprocessing steps for SMI data
+
+    Returns the output dir, and the formatted gaze data as a GazeData object
+    """
+    ioStats = io_utils.IOStats()
+
+    ### create output directory
+    print('Copying raw data...')
+    newDataDir = copySMI_recording(inputDir, sessionNum, output_root, rawMode, ioStats)
+    rawFiles = getRawFiles(inputDir, sessionNum, newDataDir, rawMode)
+    print('Input data copied to: {}'.format(newDataDir))
+
+    ### Format the gaze data
+    gazeData = prepGazeData(newDataDir, rawFiles, ioStats)
+
+    ### convert and compress the movie
+    prepWorldVideo(newDataDir, transcodeSettings, rawFiles, ioStats)
+
+    ### clean up
+    cleanup(newDataDir)
+    print('I/O: {}'.format(ioStats))
+
+    return newDataDir, gazeData
+
+
+def findSMIfiles(inputDir, sessionNum):
+    """
+    Return the paths to the raw movie and data files for this session in the
+    SMI export dir
+    """
+    rawFiles = {}
+    for f in os.listdir(inputDir):
+        # movie file
+        if ('-' + str(sessionNum) + '-') in f:
+            rawFiles['movie'] = join(inputDir, f)
+
+        # data file
+        if ('_' + str(sessionNum).zfill(3) + '_') in f:
+            rawFiles['data'] = join(inputDir, f)
+    return rawFiles
+
+
+def getRawFiles(inputDir, sessionNum, newDataDir, rawMode='copy'):
+    """
+    Return the paths to read the raw movie and gaze data from. These are the
+    original files in the export dir if reading in place, otherwise the copies
+    in the new data dir
+    """
+    if rawMode == 'inplace':
+        return findSMIfiles(inputDir, sessionNum)
+    return {'movie': join(newDataDir, 'SMI_worldCamera.avi'),
+            'data': join(newDataDir, 'SMI_raw.txt')}
+
+
+def prepGazeData(newDataDir, rawFiles=None, ioStats=None):
+    """
+    Format the gaze data, write gazeData_world.tsv and frame_timestamps.tsv
+
+    Returns the formatted gaze data as a GazeData object
+    """
+    print('Prepping the gaze data...')
+    gazeWorld_df, frame_timestamps = formatGazeData(newDataDir, rawFiles, ioStats)
+    gazeWorld_df.to_csv(join(newDataDir, 'gazeData_world.tsv'), sep='\t', index=False, float_format='%.3f')
+
+    ### convert the frame_timestamps to dataframe
+    print('Formatting timestamps...')
+    frameNum = np.arange(1, frame_timestamps.shape[0]+1)
+    frame_ts_df = pd.DataFrame({'frameNum': frameNum, 'timestamp': frame_timestamps})
+    frame_ts_df.to_csv(join(newDataDir, 'frame_timestamps.tsv'), sep='\t', index=False, float_format='%.3f')
+
+    for f in ['gazeData_world.tsv', 'frame_timestamps.tsv']:
+        io_utils.countWritten(ioStats, join(newDataDir, f))
+
+    return GazeData.fromDataFrame(gazeWorld_df, frame_timestamps)
+
+
+def prepWorldVideo(newDataDir, transcodeSettings=None, rawFiles=None, ioStats=None):
+    """
+    Convert the movie from avi to a compressed mp4 (in a single encoding pass)
+    """
+    if rawFiles is None:
+        rawFiles = getRawFiles(None, None, newDataDir)
+
+    print('Converting movie file...')
+    result = transcode.transcode(rawFiles['movie'],
+                                 join(newDataDir, 'worldCamera.mp4'),
+                                 transcodeSettings)
+    io_utils.countRead(ioStats, rawFiles['movie'])
+    io_utils.countWritten(ioStats, join(newDataDir, 'worldCamera.mp4'))
+    return result
+
+
+def cleanup(newDataDir):
+    """
+    Remove the intermediate raw files from the output dir
+    """
+    for f in ['SMI_worldCamera.avi', 'SMI_raw.txt']:
+        try:
+            os.remove(join(newDataDir, f))
+        except:
+            pass
+
+
+def copySMI_recording(inputDir, sessionNum, output_root, rawMode='copy', ioStats=None):
+    """
+    The SMI data is timestamped according to when it was exported, not when it was
+    recorded. If you export multiple sessions at once, they have the same timestamp.
+    Thus, instead of saving each session with a directory structure like the Tobii and PL data (i.e. data/time), the SMI data will get saved with a structure like
+    <num-num>/<sessionNum>, where num-num is the id that gets assigned in the SMI software. This way, subsequent analyses steps can still access these directories as though they followed the same naming conventions as the Tobii and PL glasses
+
+    Depending on rawMode, the raw files are copied, linked, or left in place (see io_utils.py)
+    """
+
+    date_dir = os.path.split(inputDir)[-1]        # last field of the input dir path
+    time_dir = str(sessionNum).zfill(3)            # session number filled to 3 places
+
+    # create the output directory:
+    outputDir = join(output_root, date_dir, time_dir)
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+
+    # copy the relevant data to the new directory
+    rawFiles = findSMIfiles(inputDir, sessionNum)
+    newFiles = getRawFiles(inputDir, sessionNum, outputDir)
+    for f in ['movie', 'data']:
+        if f in rawFiles:
+            io_utils.transferFile(rawFiles[f], newFiles[f], rawMode, ioStats)
+    return outputDir
+
+def formatGazeData(input_dir, rawFiles=None, ioStats=None):
+    """
+    load the raw SMI gaze data.
+    Convert timestamps from microseconds, to ms
+    normalize gaze coordinates to frame size
+    reformat frame column
+    set confidence based on event info
+    """
+
+    if rawFiles is None:
+        rawFiles = getRawFiles(None, None, input_dir)
+
+    # open the raw gaze data as dataframe
+    raw_df = pd.read_table(rawFiles['data'])
+    io_utils.countRead(ioStats, rawFiles['data'])
+
+    # convert timestamps from microseconds to ms
+    ts = raw_df['Time']/1000
+
+    ### normalize gaze coords to frame size
+    # get vid size
+    vidSize = core.videoSize(rawFiles['movie'])
+
+    # normalize gaze position
+    norm_pos_x = raw_df['B POR X [px]'] / vidSize[0]
+    norm_pos_y = raw_df['B POR Y [px]'] / vidSize[1]
+
+    ### reformat frame index column
+    frameIndices = np.zeros(shape=raw_df.shape[0])
+
+    # starting values
+    frameCounter = 0
+    prevLabel = raw_df.Frame.iloc[0]
+
+    # loop over all frames
+    for i, frame in enumerate(raw_df.Frame):
+        # if this frame lable is different than the previous one, update the frame counter
+        if frame != prevLabel:
+            frameCounter += 1
+
+        # assign the frameCounter value on this frame to the frame_indices array
+        frameIndices[i] = frameCounter
+
+        # update the previous frame label var
+        prevLabel = frame
+
+    # create a Series object of the frame indices
+    frame_idx = pd.Series(frameIndices.astype(int), name='frame_idx')
+
+    ### Set confidence based on event labels
+    conf = np.zeros(shape=raw_df.shape[0])
+    for i, eventLabel in enumerate(raw_df['B Event Info']):
+        if eventLabel == 'Blink':
+            conf[i] = 0
+        else:
+            conf[i] = 1
+
+    ### build the dataframe
+    gaze_df = pd.DataFrame({'timestamp': ts, 'frame_idx': frame_idx,
+                            'norm_pos_x': norm_pos_x, 'norm_pos_y': norm_pos_y,
+                            'confidence': conf})
+    colOrder = ['timestamp', 'frame_idx', 'confidence', 'norm_pos_x', 'norm_pos_y']
+
+    ### Figure out the frame timestamps
+    frame_timestamps = core.getVidFrameTimestamps(rawFiles['movie'])
+    io_utils.countRead(ioStats, rawFiles['movie'])
+
+    return gaze_df[colOrder], frame_timestamps
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    # parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('inputDir', help='path to the raw SMI recording dir')
+    parser.add_argument('sessionNum', help='session number of SMI data')
+    parser.add_argument('outputDir', help='output directory root. Raw data will be written to recording specific dirs within this directory')
+    transcode.addArguments(parser)
+    io_utils.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    # check if input directory is valid
+    if not os.path.isdir(args.inputDir):
+        print('Invalid input dir: {}'.format(args.inputDir))
+        sys.exit()
+    else:
+
+        # run preprocessing on this data
+        preprocessData(args.inputDir, args.sessionNum, args.outputDir, transcode.settingsFromArgs(args), args.rawMode)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Managed ffmpeg transcoding for the world camera videos.
+
+All of the preprocessing routines funnel their world camera video through
+transcode(), which:
+    - runs ffmpeg via subprocess (no shell) and raises an error if it fails
+    - uses configurable encoder settings (CRF, preset, thread count)
+    - stream-copies the video instead of re-encoding it when the source is
+      already H.264/yuv420p
+    - limits how many transcodes run at once. The limit is shared by all of the
+      sessions in a process, and can be shared across worker processes by
+      passing a multiprocessing semaphore to setTranscodeSlots()
+
+Encoder settings are a dict; any keys not supplied fall back to DEFAULT_SETTINGS:
+    ffmpeg - path to the ffmpeg executable
+    ffprobe - path to the ffprobe executable (used to check if a source can be
+              stream-copied)
+    codec - video encoder
+    crf - constant rate factor (0-51; lower = higher quality, larger files)
+    preset - encoder speed/compression preset (e.g. ultrafast...veryslow)
+    threads - encoder threads (0 lets ffmpeg decide)
+    streamCopy - stream-copy sources that are already H.264/yuv420p
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import re
+import json
+import time
+import threading
+import subprocess
+
+DEFAULT_SETTINGS = {'ffmpeg': 'ffmpeg',
+                    'ffprobe': 'ffprobe',
+                    'codec': 'libx264',
+                    'crf': 23,
+                    'preset': 'medium',
+                    'threads': 0,
+                    'streamCopy': True}
+
+# limits the number of concurrent transcodes (replace w/ setTranscodeSlots)
+_transcodeSlots = threading.BoundedSemaphore(1)
+
+
+def setTranscodeSlots(slots):
+    """
+    Set the limit on concurrent transcodes. slots is either an int, or a
+    semaphore (e.g. multiprocessing.BoundedSemaphore) shared with other
+    processes. Can be used as a process pool initializer
+    """
+    global _transcodeSlots
+    if isinstance(slots, int):
+        slots = threading.BoundedSemaphore(slots)
+    _transcodeSlots = slots
+
+
+def getSettings(settings=None):
+    """
+    Return a complete settings dict, filling in defaults for any missing keys
+    """
+    fullSettings = dict(DEFAULT_SETTINGS)
+    if settings is not None:
+        fullSettings.update({k: v for k, v in settings.items() if v is not None})
+    return fullSettings
+
+
+def probeVideo(src, settings=None):
+    """
+    Return a dict with the 'codec' and 'pix_fmt' of the first video stream in
+    src, or None if it can't be determined
+    """
+    settings = getSettings(settings)
+
+    # ask ffprobe
+    cmd = [settings['ffprobe'], '-v', 'error', '-select_streams', 'v:0',
+           '-show_entries', 'stream=codec_name,pix_fmt', '-of', 'json', src]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode == 0:
+            stream = json.loads(result.stdout.decode())['streams'][0]
+            return {'codec': stream.get('codec_name'), 'pix_fmt': stream.get('pix_fmt')}
+    except (OSError, ValueError, IndexError, KeyError):
+        pass
+
+    # fall back on parsing the stream info that ffmpeg prints for an input
+    try:
+        result = subprocess.run([settings['ffmpeg'], '-hide_banner', '-i', src],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError:
+        return None
+    match = re.search(r'Video: (\w+)[^,]*, (\w+)', result.stderr.decode(errors='replace'))
+    if match:
+        return {'codec': match.group(1), 'pix_fmt': match.group(2)}
+    return None
+
+
+def canStreamCopy(src, settings=None):
+    """
+    Check if src is already H.264/yuv420p, and can be stream-copied as is
+    """
+    info = probeVideo(src, settings)
+    return info is not None and info['codec'] == 'h264' and info['pix_fmt'] == 'yuv420p'
+
+
+def buildCommand(src, dst, settings=None, inputOptions=None, streamCopy=False):
+    """
+    Build the ffmpeg argument list to transcode src to dst. inputOptions is an
+    optional list of ffmpeg options that apply to the input (e.g. ['-r', '25'])
+    """
+    settings = getSettings(settings)
+    cmd = [settings['ffmpeg'], '-y', '-nostdin', '-loglevel', 'error']
+    cmd += list(inputOptions or [])
+    cmd += ['-i', src]
+    if streamCopy:
+        cmd += ['-c:v', 'copy']
+    else:
+        cmd += ['-c:v', settings['codec'],
+                '-crf', str(settings['crf']),
+                '-preset', settings['preset'],
+                '-pix_fmt', 'yuv420p',
+                '-threads', str(settings['threads'])]
+    cmd += ['-an', dst]
+    return cmd
+
+
+def transcode(src, dst, settings=None, inputOptions=None):
+    """
+    Transcode the video src to an H.264/yuv420p mp4 at dst. Blocks until a
+    transcode slot is free. Sources that are already H.264/yuv420p are
+    stream-copied (unless inputOptions are supplied, since those require
+    re-encoding). Raises RuntimeError if ffmpeg fails
+
+    Returns a dict with the 'mode' ('copy' or 'encode') and 'time' (seconds)
+    """
+    settings = getSettings(settings)
+    streamCopy = (settings['streamCopy'] and not inputOptions
+                  and canStreamCopy(src, settings))
+    cmd = buildCommand(src, dst, settings, inputOptions=inputOptions, streamCopy=streamCopy)
+
+    with _transcodeSlots:
+        startTime = time.time()
+        try:
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as e:
+            raise RuntimeError('could not run ffmpeg ({}): {}'.format(settings['ffmpeg'], e))
+        elapsed = time.time() - startTime
+
+    if result.returncode != 0:
+        raise RuntimeError('ffmpeg failed transcoding {} (exit code {}):\n{}'.format(
+            src, result.returncode, result.stderr.decode(errors='replace')))
+
+    return {'mode': 'copy' if streamCopy else 'encode', 'time': elapsed}
+
+
+def addArguments(parser):
+    """
+    Add the transcode settings as options to an argparse parser
+    """
+    parser.add_argument('--crf', type=int, default=None,
+                        help='x264 constant rate factor [default: {}]'.format(DEFAULT_SETTINGS['crf']))
+    parser.add_argument('--preset', default=None,
+                        help='x264 preset [default: {}]'.format(DEFAULT_SETTINGS['preset']))
+    parser.add_argument('--threads', type=int, default=None,
+                        help='encoder threads, 0 = auto [default: {}]'.format(DEFAULT_SETTINGS['threads']))
+    parser.add_argument('--noStreamCopy', action='store_true',
+                        help='always re-encode, even if the source is already H.264/yuv420p')
+
+
+def settingsFromArgs(args):
+    """
+    Build a settings dict from argparse args created by addArguments()
+    """
+    return getSettings({'crf': args.crf,
+                        'preset': args.preset,
+                        'threads': args.threads,
+                        'streamCopy': not args.noStreamCopy})
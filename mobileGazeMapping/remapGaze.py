@@ -0,0 +1,235 @@
+""" Remap gaze data with stored homographies, many points at a time
+
+Feature detection and matching are by far the most expensive part of mapping,
+and they only depend on the world camera video and the reference image(s).
+When only the gaze data changes (e.g. re-preprocessed with a different
+calibration or synchronization), it can be remapped with the world2ref
+homographies from an earlier run (homographies.npz) in well under a second,
+without touching the video.
+
+perspectiveTransform maps any number of points with per-frame homographies
+in one vectorized pass: each point is paired with its frame's homography by
+index, so there is no loop over frames or points, and no OpenCV call per
+point (mapGaze.mapCoords2D maps a single point).
+
+Outputs (written to the mapGaze output dir):
+    gazeData_remapped.tsv - every gaze sample of the mapped frames, with the
+        same columns as gazeData_mapped.tsv (ref coordinates are nan on frames
+        without a homography)
+
+Usage:
+    mobileGazeMapping remap mappedGazeDir gazeData worldCameraVid
+                            [--homographies FILE] [--referenceImage IMG ...]
+                            [--float] [-o OUTPUTFILE]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import argparse
+from os.path import join
+
+from .lazyImport import lazyImport
+from .gazeData import GazeData
+from . import core
+
+np = lazyImport('numpy')
+pd = lazyImport('pandas')
+cv2 = lazyImport('cv2')
+
+
+def perspectiveTransform(points, homographies, frameIdx=None, rounded=False):
+    """ Map points with per-frame homographies, all in one pass
+
+    Parameters
+    ----------
+    points : array_like
+        (N, 2) array of (x, y) coordinates
+    homographies : array_like
+        a single (3, 3) homography applied to every point, or (nFrames, 3, 3)
+        homographies indexed by frame (nan for frames without one)
+    frameIdx : array_like, optional
+        (N,) frame index of each point, selecting its homography. Required
+        with per-frame homographies
+    rounded : bool, optional
+        round the mapped coordinates to the nearest pixel (as mapGaze does)
+
+    Returns
+    -------
+    np.ndarray
+        (N, 2) array of mapped (x, y) coordinates; nan for points whose frame
+        has no homography or is out of range
+
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    homographies = np.asarray(homographies, dtype=np.float64)
+    if homographies.ndim == 2:
+        homographies = homographies[None]
+        frameIdx = np.zeros(points.shape[0], dtype=np.int64)
+    elif frameIdx is None:
+        raise ValueError('frameIdx is required with per-frame homographies')
+    frameIdx = np.asarray(frameIdx).astype(np.int64)
+    if frameIdx.shape != (points.shape[0],):
+        raise ValueError('frameIdx needs one frame index per point ({} != {})'.format(frameIdx.shape[0],
+                                                                                     points.shape[0]))
+
+    mapped = np.full(points.shape, np.nan)
+    inRange = (frameIdx >= 0) & (frameIdx < homographies.shape[0])
+    H = homographies[frameIdx[inRange]]
+    p = points[inRange]
+    # (x, y, 1) @ H.T for every point, without building the homogeneous points
+    xyw = np.einsum('nij,nj->ni', H[:, :, :2], p) + H[:, :, 2]
+    mapped[inRange] = xyw[:, :2] / xyw[:, 2:]
+    if rounded:
+        mapped = np.round(mapped)
+    return mapped
+
+
+def readHomographies(homographiesFile):
+    """ {reference name: (nFrames, 3, 3) world2ref homographies} stored in a
+    homographies.npz file """
+    with np.load(homographiesFile) as f:
+        return {name: f[name] for name in f.files}
+
+
+def remapGazeData(gazeData, homographies, frameSize, refSizes=None, rounded=True):
+    """ Map every gaze sample with the stored homographies of its frame
+
+    Parameters
+    ----------
+    gazeData : GazeData
+        gaze data in normalized world camera coordinates
+    homographies : dict
+        (nFrames, 3, 3) world2ref homographies of each reference image, by
+        name (see readHomographies)
+    frameSize : tuple
+        (width, height) of the world camera frames
+    refSizes : dict, optional
+        (width, height) of each reference image, by name. With multiple
+        reference images, a sample is assigned to the first reference it
+        lands on (as mapGaze does); without refSizes, to the first one with a
+        homography
+    rounded : bool, optional
+        round the reference image coordinates to the nearest pixel
+
+    Returns
+    -------
+    pd.DataFrame
+        the samples of every frame covered by the homographies, with the
+        gazeData_mapped.tsv columns (ref coordinates are nan where the frame
+        has no homography)
+
+    """
+    names = list(homographies)
+    multiRef = len(names) > 1
+    nFrames = homographies[names[0]].shape[0]
+
+    # only the frames covered by the homographies (the frames that were mapped)
+    samples = slice(gazeData.frameOffsets[0], gazeData.frameOffsets[min(nFrames, gazeData.nFrames)])
+    frameIdx = gazeData.frame_idx[samples]
+    worldCoords = np.stack([gazeData.norm_pos_x[samples] * frameSize[0],
+                            gazeData.norm_pos_y[samples] * frameSize[1]], axis=1)
+
+    refCoords = np.full(worldCoords.shape, np.nan)
+    refLabels = np.full(worldCoords.shape[0], -1)
+    for i, name in enumerate(names):
+        mapped = perspectiveTransform(worldCoords, homographies[name], frameIdx, rounded=rounded)
+        onRef = (refLabels == -1) & ~np.isnan(mapped).any(axis=1)
+        if multiRef and refSizes is not None:
+            w, h = refSizes[name]
+            onRef &= (mapped[:, 0] >= 0) & (mapped[:, 0] < w) & (mapped[:, 1] >= 0) & (mapped[:, 1] < h)
+        refCoords[onRef] = mapped[onRef]
+        refLabels[onRef] = i
+
+    remapped_df = pd.DataFrame({'worldFrame': frameIdx,
+                                'gaze_ts': gazeData.timestamp[samples],
+                                'confidence': gazeData.confidence[samples],
+                                'world_gazeX': worldCoords[:, 0],
+                                'world_gazeY': worldCoords[:, 1],
+                                'ref_gazeX': refCoords[:, 0],
+                                'ref_gazeY': refCoords[:, 1]})
+    colOrder = ['worldFrame', 'gaze_ts', 'confidence', 'world_gazeX', 'world_gazeY', 'ref_gazeX', 'ref_gazeY']
+    if multiRef:
+        remapped_df['refImage'] = np.array([''] + names, dtype=object)[refLabels + 1]
+        colOrder.append('refImage')
+    return remapped_df[colOrder]
+
+
+def remapRecording(mappedGazeDir, gazeData, frameSize, homographiesFile=None, referenceImages=None,
+                   outputFile=None, rounded=True):
+    """ Remap a recording's gaze data with the homographies of an earlier
+    mapping, and write it to gazeData_remapped.tsv
+
+    Parameters
+    ----------
+    mappedGazeDir : string
+        mapGaze output dir
+    gazeData : string or GazeData
+        the gaze data to map (path to gazeData_world.tsv or a gaze arrays
+        dir, or a GazeData)
+    frameSize : tuple
+        (width, height) of the world camera frames
+    homographiesFile : string, optional
+        homographies to map with (default: homographies.npz in mappedGazeDir;
+        homographies_smoothed.npz works as well)
+    referenceImages : list of strings, optional
+        paths of the reference images, to assign each sample to the one it
+        lands on when there are several (see remapGazeData)
+    outputFile : string, optional
+        where to write the remapped gaze data (default:
+        gazeData_remapped.tsv in mappedGazeDir)
+    rounded : bool, optional
+        round the reference image coordinates to the nearest pixel
+
+    Returns
+    -------
+    pd.DataFrame
+        the remapped gaze data, as written to outputFile
+
+    """
+    if not isinstance(gazeData, GazeData):
+        gazeData = GazeData.fromFile(gazeData)
+    homographies = readHomographies(homographiesFile or join(mappedGazeDir, 'homographies.npz'))
+
+    refSizes = None
+    if referenceImages:
+        refSizes = {}
+        for path in referenceImages:
+            img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                raise IOError('could not read reference image {}'.format(path))
+            refSizes[os.path.splitext(os.path.basename(path))[0]] = (img.shape[1], img.shape[0])
+
+    remapped_df = remapGazeData(gazeData, homographies, frameSize, refSizes, rounded)
+    remapped_df.to_csv(outputFile or join(mappedGazeDir, 'gazeData_remapped.tsv'),
+                       sep='\t',
+                       index=False,
+                       float_format='%.3f')
+    return remapped_df
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('mappedGazeDir', help='mapGaze output dir (containing homographies.npz)')
+    parser.add_argument('gazeData', help='path to gaze data file (or gaze arrays dir)')
+    parser.add_argument('worldCameraVid', help='path to world camera video file (to get the frame size)')
+    parser.add_argument('--homographies', default=None,
+                        help='homographies to map with [default: homographies.npz in mappedGazeDir]')
+    parser.add_argument('--referenceImage', nargs='+', default=None,
+                        help='reference image(s), to assign samples to the one they land on')
+    parser.add_argument('--float', action='store_true', help='don\'t round the mapped gaze to whole pixels')
+    parser.add_argument('-o', '--outputFile', default=None,
+                        help='output file [default: gazeData_remapped.tsv in mappedGazeDir]')
+    args = parser.parse_args(argv)
+
+    remapped_df = remapRecording(args.mappedGazeDir, args.gazeData, core.videoSize(args.worldCameraVid),
+                                 homographiesFile=args.homographies, referenceImages=args.referenceImage,
+                                 outputFile=args.outputFile, rounded=not args.float)
+    print('Mapped {} of {} samples'.format(remapped_df['ref_gazeX'].notna().sum(), remapped_df.shape[0]))
+
+
+if __name__ == '__main__':
+    main()
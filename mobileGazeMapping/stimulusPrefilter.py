@@ -0,0 +1,116 @@
+""" Cheap check for whether a reference image could be on a world camera frame
+
+Full registration (SIFT features on the full resolution frame, matched against
+every reference descriptor) is by far the most expensive step of mapping a
+frame, and it is wasted on the long stretches of a recording where the
+stimulus isn't in view (e.g. the participant walking between rooms).
+
+The prefilter looks for each reference image on a small copy of the frame
+first: ORB features (binary, and much faster to find and match than SIFT) on
+the frame scaled down to frameWidth pixels are matched against ORB features
+of each reference image scaled down to refWidth, and a homography is fit to
+the matches with RANSAC. Its inlier count is the reference's score on the
+frame. Geometrically consistent matches are rare unless the stimulus is there,
+so frames without it score near 0, and frames with it score in the tens to
+hundreds. References scoring below minInliers are skipped on that frame, and
+the frame isn't registered at all if every reference is skipped.
+
+Settings (see DEFAULT_PREFILTER):
+    frameWidth - width (px) the frame is scaled down to
+    refWidth - width (px) the reference images are scaled down to. ORB
+               searches a pyramid of scales, so the stimulus is found over a
+               range of sizes on the frame around this
+    nFeatures - max number of ORB features on the frame and each reference
+    ratio - ratio test threshold for the ORB matches
+    minInliers - references with fewer RANSAC inliers are skipped
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+from .lazyImport import lazyImport
+
+np = lazyImport('numpy')
+cv2 = lazyImport('cv2')
+
+DEFAULT_PREFILTER = {'frameWidth': 480,
+                     'refWidth': 300,
+                     'nFeatures': 500,
+                     'ratio': 0.8,
+                     'minInliers': 10}
+
+
+def getPrefilterSettings(settings=None):
+    """ Return a complete prefilter settings dict, filling in defaults for any
+    missing keys """
+    fullSettings = dict(DEFAULT_PREFILTER)
+    if settings is not None:
+        unknown = set(settings) - set(fullSettings)
+        if len(unknown) > 0:
+            raise ValueError('unknown prefilter settings: {}'.format(sorted(unknown)))
+        fullSettings.update(settings)
+    for key in ['frameWidth', 'refWidth', 'nFeatures']:
+        if int(fullSettings[key]) != fullSettings[key] or fullSettings[key] < 1:
+            raise ValueError('{} must be a positive integer (got {})'.format(key, fullSettings[key]))
+    if not 0 < fullSettings['ratio'] <= 1:
+        raise ValueError('ratio must be between 0 and 1 (got {})'.format(fullSettings['ratio']))
+    return fullSettings
+
+
+def _shrink(image, width):
+    """ image scaled down to width (or left as is if it's narrower) """
+    if image.shape[1] <= width:
+        return image
+    height = max(1, int(round(image.shape[0] * width / image.shape[1])))
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class StimulusPrefilter(object):
+    """ Scores how likely each of a set of reference images is to be on a frame
+
+    Parameters
+    ----------
+    references : list of np.ndarray
+        grayscale reference images
+    settings : dict, optional
+        prefilter settings (see DEFAULT_PREFILTER)
+
+    """
+    def __init__(self, references, settings=None):
+        self.settings = getPrefilterSettings(settings)
+        self.orb = cv2.ORB_create(nfeatures=self.settings['nFeatures'])
+        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+        self.references = []
+        for ref in references:
+            kp, des = self.orb.detectAndCompute(_shrink(ref, self.settings['refWidth']), None)
+            pts = np.float32([k.pt for k in kp]).reshape(-1, 2)
+            self.references.append((pts, des))
+
+    def scores(self, frame_gray):
+        """ Array of the RANSAC inlier count of each reference on a grayscale
+        frame """
+        scores = np.zeros(len(self.references), dtype=int)
+        kp, des = self.orb.detectAndCompute(_shrink(frame_gray, self.settings['frameWidth']), None)
+        if des is None or len(kp) < 2:
+            return scores
+        frame_pts = np.float32([k.pt for k in kp])
+
+        for i, (ref_pts, ref_des) in enumerate(self.references):
+            if ref_des is None or len(ref_pts) < 2:
+                continue
+            matches = self.matcher.knnMatch(des, ref_des, k=2)
+            good = [m[0] for m in matches if len(m) == 2 and m[0].distance < self.settings['ratio'] * m[1].distance]
+            if len(good) < 4:
+                continue
+            H, mask = cv2.findHomography(ref_pts[[m.trainIdx for m in good]].reshape(-1, 1, 2),
+                                         frame_pts[[m.queryIdx for m in good]].reshape(-1, 1, 2),
+                                         cv2.RANSAC, 3.0)
+            if mask is not None:
+                scores[i] = int(mask.sum())
+        return scores
+
+    def present(self, scores):
+        """ Boolean array; True for the references whose score is high enough
+        to try registering them """
+        return np.asarray(scores) >= self.settings['minInliers']
@@ -0,0 +1,375 @@
+""" Control OpenCV and NumPy threading when several mapping jobs share a machine
+
+OpenCV parallelizes feature detection, matching, and warping over all of the
+cores by default, and NumPy's BLAS library does the same, so running one
+mapping job per core (e.g. pipeline.py, or several processRecording calls)
+puts N jobs x N threads on N cores and throughput collapses. The thread
+settings let each job use its share of the cores instead:
+    cvThreads    - threads OpenCV may use (cv2.setNumThreads; 0 runs its
+                   parallel loops sequentially)
+    openCL       - whether OpenCV may offload to an OpenCL device
+    numpyThreads - threads the BLAS/OpenMP libraries behind NumPy may use
+None leaves a setting as it is. All of them apply to the whole process.
+
+NumPy's thread count is set with threadpoolctl if it's installed. Otherwise
+it can only be set through the OMP_NUM_THREADS etc. environment variables
+before NumPy is first imported, which is the case in freshly started worker
+processes (NumPy is imported on first use; see lazyImport).
+
+autoTune finds the best way to split the cores between jobs: it maps a few
+frames of a recording in 1, 2, 4, ... concurrent processes, each with its
+share of the cores, and picks the split with the most frames/sec overall.
+The plan can be saved (tune -o plan.json) and passed to mapping jobs
+(--threadPlan plan.json), which use its thread settings and record the plan
+and its trials in their mapGazeLog.log.
+
+Usage:
+    mobileGazeMapping tune referenceImage worldCameraVid [--jobs N]
+                           [--cores N] [--frames N] [-o PLANFILE]
+"""
+
+# python 2/3 compatibility
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+
+from .lazyImport import lazyImport
+from . import core
+
+cv2 = lazyImport('cv2')
+
+DEFAULT_THREAD_SETTINGS = {'cvThreads': None, 'openCL': None, 'numpyThreads': None}
+
+# environment variables read by the BLAS/OpenMP libraries NumPy may use
+NUMPY_THREAD_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                     'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+
+def getThreadSettings(settings=None):
+    """ Return a complete thread settings dict, filling in defaults for any
+    missing keys
+
+    Settings
+    --------
+    cvThreads : int or None
+        number of threads OpenCV may use (0 = run sequentially)
+    openCL : bool or None
+        allow OpenCV to use OpenCL
+    numpyThreads : int or None
+        number of threads the libraries behind NumPy may use
+
+    """
+    fullSettings = dict(DEFAULT_THREAD_SETTINGS)
+    if settings is not None:
+        unknown = set(settings) - set(fullSettings)
+        if unknown:
+            raise ValueError('unknown thread settings: {}'.format(sorted(unknown)))
+        fullSettings.update(settings)
+    for key, minimum in [('cvThreads', 0), ('numpyThreads', 1)]:
+        value = fullSettings[key]
+        if value is not None and (int(value) != value or value < minimum):
+            raise ValueError('{} must be an integer >= {}, or None (got {})'.format(key, minimum, value))
+    return fullSettings
+
+
+def splitCores(nJobs, nCores=None):
+    """ Thread settings giving each of nJobs concurrent jobs an equal share of
+    nCores (default: all of them) """
+    nCores = nCores or os.cpu_count() or 1
+    nThreads = max(1, nCores // max(1, nJobs))
+    return getThreadSettings({'cvThreads': nThreads, 'numpyThreads': nThreads})
+
+
+def _numpyImported():
+    return 'numpy' in sys.modules
+
+
+def setNumpyThreads(n):
+    """ Limit the threads of the libraries behind NumPy to n. Returns False if
+    that isn't possible in this process (NumPy is already imported and
+    threadpoolctl isn't installed) """
+    try:
+        import threadpoolctl
+    except ImportError:
+        threadpoolctl = None
+    if threadpoolctl is not None:
+        threadpoolctl.threadpool_limits(n)
+        return True
+    if _numpyImported():
+        return False
+    for var in NUMPY_THREAD_VARS:
+        os.environ[var] = str(n)
+    return True
+
+
+def numpyThreads():
+    """ Threads the libraries behind NumPy use, as far as can be told (None if
+    unknown) """
+    try:
+        import threadpoolctl
+    except ImportError:
+        threadpoolctl = None
+    if threadpoolctl is not None and _numpyImported():
+        counts = [info['num_threads'] for info in threadpoolctl.threadpool_info()]
+        return max(counts) if counts else None
+    value = os.environ.get('OMP_NUM_THREADS')
+    return int(value) if value and value.isdigit() else None
+
+
+def currentThreadSettings():
+    """ The thread settings in effect in this process """
+    return {'cvThreads': cv2.getNumThreads(),
+            'openCL': cv2.ocl.useOpenCL(),
+            'numpyThreads': numpyThreads()}
+
+
+def applyThreadSettings(settings):
+    """ Apply thread settings to this process
+
+    Returns the settings that were in effect before, which can be passed back
+    in to restore them.
+
+    """
+    settings = getThreadSettings(settings)
+    # NumPy first: importing OpenCV imports NumPy
+    previousNumpyThreads = numpyThreads()
+    if settings['numpyThreads'] is not None:
+        if not setNumpyThreads(settings['numpyThreads']):
+            print('numpyThreads not applied: NumPy is already imported (install threadpoolctl to set it anyway)')
+    previous = dict(currentThreadSettings(), numpyThreads=previousNumpyThreads)
+    if settings['cvThreads'] is not None:
+        cv2.setNumThreads(settings['cvThreads'])
+    if settings['openCL'] is not None:
+        cv2.ocl.setUseOpenCL(settings['openCL'])
+    return previous
+
+
+def describeThreadSettings(settings=None):
+    """ One line summary of the thread settings (default: the ones in effect) """
+    settings = currentThreadSettings() if settings is None else settings
+    haveOpenCL = cv2.ocl.haveOpenCL()
+    return 'OpenCV threads: {}, OpenCL: {}, NumPy threads: {}'.format(
+        settings['cvThreads'],
+        ('on' if settings['openCL'] else 'off') if haveOpenCL else 'unavailable',
+        settings['numpyThreads'] if settings['numpyThreads'] is not None else 'default')
+
+
+def describeTrial(trial):
+    """ One line summary of a split timed by autoTune """
+    return '{processes:3d} processes x {cvThreads:2d} threads: {framesPerSec:7.1f} frames/sec'.format(**trial)
+
+
+def describePlan(plan):
+    """ One line summary of the split picked by autoTune """
+    return '{} concurrent jobs with --cvThreads {} --numpyThreads {} ({:.1f} frames/sec)'.format(
+        plan['processes'], plan['threads']['cvThreads'], plan['threads']['numpyThreads'], plan['framesPerSec'])
+
+
+def savePlan(plan, planFile):
+    """ Write an autoTune plan to a JSON file """
+    with open(planFile, 'w') as f:
+        json.dump(plan, f, indent=2)
+
+
+def loadPlan(planFile):
+    """ Read an autoTune plan written by savePlan """
+    with open(planFile) as f:
+        plan = json.load(f)
+    plan['threads'] = getThreadSettings(plan['threads'])
+    return plan
+
+
+def withPlan(settings, plan):
+    """ Thread settings with any that are None taken from an autoTune plan """
+    settings = getThreadSettings(settings)
+    return {key: plan['threads'][key] if value is None else value for key, value in settings.items()}
+
+
+def addArguments(parser):
+    """ Add the thread settings as options to an argparse parser """
+    parser.add_argument('--cvThreads', type=int, default=None,
+                        help='threads OpenCV may use, 0 = sequential [default: all cores]')
+    parser.add_argument('--openCL', choices=['on', 'off'], default=None,
+                        help='allow OpenCV to use OpenCL [default: OpenCV\'s choice]')
+    parser.add_argument('--numpyThreads', type=int, default=None,
+                        help='threads the libraries behind NumPy may use [default: all cores]')
+    parser.add_argument('--threadPlan', default=None,
+                        help='plan saved by the tune command; its thread settings are used for any not given above, '
+                             'and it is recorded in mapGazeLog.log')
+
+
+def planFromArgs(args):
+    """ The autoTune plan named by argparse args created by addArguments(),
+    or None """
+    return None if args.threadPlan is None else loadPlan(args.threadPlan)
+
+
+def settingsFromArgs(args):
+    """ Build a thread settings dict from argparse args created by
+    addArguments(), filling in any that aren't given from the thread plan """
+    settings = getThreadSettings({'cvThreads': args.cvThreads,
+                                  'openCL': None if args.openCL is None else args.openCL == 'on',
+                                  'numpyThreads': args.numpyThreads})
+    plan = planFromArgs(args)
+    if plan is not None:
+        settings = withPlan(settings, plan)
+    return settings
+
+
+class _PoolExecutor(Executor):
+    """ Executor running calls on a multiprocessing.Pool (for python < 3.7,
+    where ProcessPoolExecutor takes no mp_context) """
+    def __init__(self, pool):
+        self._pool = pool
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self._pool.apply_async(fn, args, kwargs, callback=future.set_result, error_callback=future.set_exception)
+        return future
+
+    def shutdown(self, wait=True):
+        self._pool.close()
+        if wait:
+            self._pool.join()
+
+
+def spawnExecutor(maxWorkers):
+    """ Executor running calls in spawned (not forked) worker processes
+
+    Spawned workers start with NumPy unimported (so its thread count can be
+    set), and don't inherit locks held by other threads of this process.
+    ProcessPoolExecutor only takes a start method from python 3.7 on; before
+    that, a spawn-context multiprocessing.Pool runs the calls instead.
+    """
+    context = multiprocessing.get_context('spawn')
+    if sys.version_info >= (3, 7):
+        return ProcessPoolExecutor(max_workers=maxWorkers, mp_context=context)
+    return _PoolExecutor(context.Pool(maxWorkers))
+
+
+def candidateSplits(nJobs, nCores):
+    """ (processes, threads per process) splits of nCores to try for nJobs
+    concurrent jobs: 1, 2, 4, ... processes, and one per job (or core) """
+    maxProcesses = max(1, min(nJobs, nCores))
+    processes = set([maxProcesses])
+    p = 1
+    while p < maxProcesses:
+        processes.add(p)
+        p *= 2
+    return [(p, max(1, nCores // p)) for p in sorted(processes)]
+
+
+def _calibrationWorker(referenceImage, worldCameraVid, nFrames, threads, barrier):
+    """ Map nFrames frames of a video with the given thread settings, starting
+    together with the other workers. Returns frames/sec """
+    applyThreadSettings(threads)
+    from . import mapGaze
+
+    mapper = mapGaze.GazeMapper(referenceImage)
+    vid = core.openVideo(worldCameraVid)
+    frames = []
+    while len(frames) < nFrames:
+        ret, frame = vid.read()
+        if not ret:
+            break
+        frames.append(frame)
+    vid.release()
+    if len(frames) == 0:
+        raise IOError('no frames could be read from {}'.format(worldCameraVid))
+
+    # warm up, then wait for the other workers so they're all timed together
+    mapper.map_frame(frames[0], reuseBuffers=True)
+    barrier.wait()
+    startTime = time.time()
+    for i, frame in enumerate(frames):
+        mapper.map_frame(frame, i, reuseBuffers=True)
+    return len(frames) / (time.time() - startTime)
+
+
+def autoTune(referenceImage, worldCameraVid, nJobs, nCores=None, nFrames=20, openCL=None):
+    """ Find the process/thread split of the cores with the highest aggregate
+    mapping throughput for nJobs jobs
+
+    Every candidate split (see candidateSplits) is timed by mapping the first
+    nFrames frames of worldCameraVid in that many concurrent worker processes,
+    each with its share of the cores.
+
+    Parameters
+    ----------
+    referenceImage : string or list of strings
+        reference image(s) to map to
+    worldCameraVid : string
+        a world camera video typical of the jobs
+    nJobs : int
+        number of mapping jobs to run
+    nCores : int, optional
+        number of cores to use (default: all of them)
+    nFrames : int, optional
+        number of frames each worker maps
+    openCL : bool, optional
+        OpenCL setting of every worker (default: OpenCV's choice)
+
+    Returns
+    -------
+    plan : dict
+        'processes': number of jobs to run at once, 'threads': the thread
+        settings for each of them, 'framesPerSec': their combined throughput,
+        and 'trials': processes, cvThreads, and framesPerSec of every split
+        that was tried
+
+    """
+    nCores = nCores or os.cpu_count() or 1
+    # spawned (not forked) workers start with NumPy unimported, so its thread
+    # count can always be set
+    trials = []
+    with multiprocessing.Manager() as manager:
+        for nProcesses, nThreads in candidateSplits(nJobs, nCores):
+            threads = getThreadSettings({'cvThreads': nThreads, 'openCL': openCL, 'numpyThreads': nThreads})
+            barrier = manager.Barrier(nProcesses)
+            with spawnExecutor(nProcesses) as pool:
+                workers = [pool.submit(_calibrationWorker, referenceImage, worldCameraVid, nFrames, threads, barrier)
+                           for i in range(nProcesses)]
+                rates = [worker.result() for worker in workers]
+            trials.append({'processes': nProcesses, 'cvThreads': nThreads, 'framesPerSec': sum(rates)})
+
+    best = max(trials, key=lambda trial: trial['framesPerSec'])
+    return {'processes': best['processes'],
+            'threads': getThreadSettings({'cvThreads': best['cvThreads'], 'openCL': openCL,
+                                          'numpyThreads': best['cvThreads']}),
+            'framesPerSec': best['framesPerSec'],
+            'trials': trials}
+
+
+def main(argv=None, prog=None):
+    """ Run from the command line, with argv in place of sys.argv[1:] """
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('referenceImage', help='path to reference image file')
+    parser.add_argument('worldCameraVid', help='path to a typical world camera video file')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of mapping jobs to run [default: number of CPUs]')
+    parser.add_argument('--cores', type=int, default=None, help='number of cores to use [default: all]')
+    parser.add_argument('--frames', type=int, default=20, help='frames mapped by each worker [default: 20]')
+    parser.add_argument('-o', '--outputFile', default=None,
+                        help='save the plan to this JSON file, to pass to mapping jobs with --threadPlan')
+    args = parser.parse_args(argv)
+
+    plan = autoTune(args.referenceImage, args.worldCameraVid, args.jobs, nCores=args.cores, nFrames=args.frames)
+    for trial in plan['trials']:
+        print(describeTrial(trial))
+    print('best: {}'.format(describePlan(plan)))
+    if args.outputFile is not None:
+        savePlan(plan, args.outputFile)
+        print('Plan saved in: {}'.format(args.outputFile))
+    return plan
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+from setuptools import setup, find_packages
+
+setup(name='mobileGazeMapping',
+      version='2018.11.19',
+      description='Map mobile gaze data to a fixed target stimulus',
+      url='https://github.com/jeffmacinnes/mobileGazeMapping',
+      author='Jeff J MacInnes',
+      license='BSD-3-Clause',
+      packages=find_packages(include=['mobileGazeMapping', 'mobileGazeMapping.*']),
+      python_requires='>=3.6',
+      install_requires=['numpy>=1.13.2',
+                        'pandas>=0.19.2',
+                        'opencv-contrib-python>=3.4.2.17'],
+      extras_require={'pupil': ['msgpack'],
+                      'threads': ['threadpoolctl'],
+                      'test': ['pytest>=3.8.0']},
+      entry_points={'console_scripts': ['mobileGazeMapping=mobileGazeMapping.cli:main',
+                                        'mapGaze=mobileGazeMapping.mapGaze:main']})
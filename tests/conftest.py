@@ -0,0 +1,38 @@
+import os
+from os.path import join
+
+import cv2
+import pytest
+
+
+def writeSMIrecording(inputDir, sessionNum, frame, nFrames, samplesPerFrame=1, gazePos=(0, 0), blinkSample=None):
+    """ write a synthetic SMI export (movie + raw data) for one session
+
+    Every frame of the movie is a copy of frame, and the gaze data has
+    samplesPerFrame samples per frame, all at gazePos (px). The sample at
+    index blinkSample (if any) is a blink
+    """
+    if not os.path.isdir(inputDir):
+        os.makedirs(inputDir)
+
+    # movie
+    frameSize = (frame.shape[1], frame.shape[0])
+    vidOut = cv2.VideoWriter(join(inputDir, 'rec-{}-recording.avi'.format(sessionNum)),
+                             cv2.VideoWriter_fourcc(*'MJPG'), 25, frameSize, True)
+    for i in range(nFrames):
+        vidOut.write(frame)
+    vidOut.release()
+
+    # raw gaze data
+    with open(join(inputDir, 'rec_{}_Samples.txt'.format(str(sessionNum).zfill(3))), 'w') as f:
+        f.write('Time\tFrame\tB POR X [px]\tB POR Y [px]\tB Event Info\n')
+        for i in range(nFrames * samplesPerFrame):
+            event = 'Blink' if i == blinkSample else 'Fixation'
+            f.write('{}\t00:00:{:02d}\t{}\t{}\t{}\n'.format(i * 40000 // samplesPerFrame, i // samplesPerFrame,
+                                                            gazePos[0], gazePos[1], event))
+
+
+@pytest.fixture
+def makeSMIrecording():
+    """ function writing a synthetic SMI export for one session (see writeSMIrecording) """
+    return writeSMIrecording
@@ -0,0 +1,86 @@
+import os
+import json
+import shutil
+from os.path import join
+
+import numpy as np
+import pytest
+
+from mobileGazeMapping.preprocessing import batch_preprocessing
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def makeSMIsessions(makeSMIrecording, inputDir, sessionNums):
+    """ write small synthetic SMI sessions: 10 frames, 2 samples per frame, one blink """
+    for sessionNum in sessionNums:
+        makeSMIrecording(inputDir, sessionNum, np.zeros((48, 64, 3), dtype=np.uint8), 10,
+                         samplesPerFrame=2, gazePos=(32, 24), blinkSample=3)
+
+
+def test_detectDevice(tmpdir, makeSMIrecording):
+    """ confirm each raw recording layout is detected as the right device """
+    plDir = tmpdir.mkdir('pl')
+    for f in ['info.csv', 'pupil_data', 'world.mp4', 'world_timestamps.npy']:
+        plDir.join(f).write('')
+    tobiiDir = tmpdir.mkdir('tobii')
+    for f in ['segment.json', 'livedata.json.gz', 'fullstream.mp4']:
+        tobiiDir.join(f).write('')
+    smiDir = str(tmpdir.join('smi'))
+    makeSMIsessions(makeSMIrecording, smiDir, [1, 2])
+    unknownDir = tmpdir.mkdir('unknown')
+
+    assert batch_preprocessing.detectDevice(str(plDir)) == 'pl'
+    assert batch_preprocessing.detectDevice(str(tobiiDir)) == 'tobii'
+    assert batch_preprocessing.detectDevice(smiDir) == 'smi'
+    assert batch_preprocessing.detectDevice(str(unknownDir)) is None
+    assert batch_preprocessing.findSMIsessions(smiDir) == [1, 2]
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg not installed')
+@pytest.mark.parametrize('rawMode', ['copy', 'link', 'inplace'])
+def test_preprocessBatch(tmpdir, rawMode, makeSMIrecording):
+    """ confirm a batch of synthetic sessions is preprocessed and summarized in the manifest """
+    smiDir = str(tmpdir.join('smi_export'))
+    makeSMIsessions(makeSMIrecording, smiDir, [1, 2])
+    outputRoot = str(tmpdir.join('output'))
+
+    manifest = batch_preprocessing.preprocessBatch([smiDir, str(tmpdir.join('missing'))], outputRoot,
+                                                   nWorkers=2,
+                                                   transcodeSettings={'preset': 'ultrafast'},
+                                                   maxTranscodes=1,
+                                                   rawMode=rawMode)
+
+    # manifest written to disk and matches returned value
+    with open(join(outputRoot, batch_preprocessing.MANIFEST_NAME)) as f:
+        assert json.load(f) == manifest
+
+    assert len(manifest['sessions']) == 2
+    for entry in manifest['sessions']:
+        assert entry['device'] == 'smi'
+        assert entry['status'] == 'ok', entry['error']
+        for step in ['setup', 'gaze', 'video', 'total']:
+            assert entry['timings'][step] >= 0
+
+        # gaze data formatted
+        gazeData = np.genfromtxt(join(entry['outputDir'], 'gazeData_world.tsv'), skip_header=1)
+        assert gazeData.shape == (20, 5)
+        np.testing.assert_array_equal(gazeData[:, 1], np.repeat(np.arange(10), 2))
+        assert gazeData[3, 2] == 0          # blink sample has 0 confidence
+        assert os.path.exists(join(entry['outputDir'], 'frame_timestamps.tsv'))
+
+        # movie converted in a single pass, intermediate files cleaned up
+        assert entry['transcode'] == 'encode'
+        outputFiles = sorted(os.listdir(entry['outputDir']))
+        assert outputFiles == ['frame_timestamps.tsv', 'gazeData_world.tsv', 'worldCamera.mp4']
+
+        # I/O accounting: only copy mode writes anything besides the final outputs
+        outputBytes = sum(os.path.getsize(join(entry['outputDir'], f)) for f in outputFiles)
+        assert entry['io']['bytesRead'] > 0
+        if rawMode == 'copy':
+            assert entry['io']['bytesWritten'] > outputBytes
+        else:
+            assert entry['io']['bytesWritten'] == outputBytes
+
+    # raw data left untouched
+    assert len(os.listdir(smiDir)) == 4
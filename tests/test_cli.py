@@ -0,0 +1,47 @@
+import sys
+import os
+import subprocess
+from os.path import join
+
+import pytest
+
+from mobileGazeMapping import cli
+from mobileGazeMapping.benchmarks import importTime
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+repoDir = os.path.dirname(testDataDir)
+
+
+def test_commands(capsys):
+    """ confirm subcommands run their script's command line, and bad commands are reported """
+    with pytest.raises(SystemExit) as e:
+        cli.main(['map', '--help'], prog='cli.py')
+    assert e.value.code == 0
+    out = capsys.readouterr().out
+    assert out.startswith('usage: cli.py map') and '--homographyMethod' in out
+
+    with pytest.raises(SystemExit):
+        cli.main(['preprocess', 'pl', join(testDataDir, 'missing'), 'out'], prog='cli.py')
+    assert 'Invalid input dir' in capsys.readouterr().out
+
+    for argv in [[], ['unmap'], ['preprocess'], ['preprocess', 'eyelink']]:
+        with pytest.raises(SystemExit) as e:
+            cli.main(argv, prog='cli.py')
+        assert e.value.code == 2
+    assert "invalid choice: 'eyelink'" in capsys.readouterr().err
+
+    # the package runs as a module, and the old scripts still run on their own
+    for argv in [['-m', 'mobileGazeMapping', 'map', '--help'], [join(repoDir, 'mapGaze.py'), '--help'],
+                 [join(repoDir, 'preprocessing', 'smi_preprocessing.py'), '--help']]:
+        assert subprocess.call([sys.executable] + argv, cwd=repoDir, stdout=subprocess.DEVNULL) == 0, argv
+
+
+def test_importTime():
+    """ confirm no subcommand imports the heavy dependencies just to show its help, and that starting
+    one takes less time than importing them """
+    eager = importTime.timeStartup(setup='import numpy, pandas, cv2')
+    assert eager['heavy'] == ['numpy', 'pandas', 'cv2']
+    for name, argv in importTime.entries():
+        result = importTime.timeStartup(argv)
+        assert result['heavy'] == [], name
+        assert result['seconds'] < eager['seconds'], name
@@ -0,0 +1,41 @@
+import os
+from os.path import join
+
+import numpy as np
+import cv2
+import pytest
+
+from mobileGazeMapping import core
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_video(tmpdir):
+    """ confirm video properties and frame timestamps are read, and written videos can be read back """
+    vid = core.openVideo(join(testDataDir, 'worldCamera.mp4'))
+    nFrames, size, fps = core.videoProperties(vid)
+    vid.release()
+    assert size == core.videoSize(join(testDataDir, 'worldCamera.mp4'))
+
+    frameTimestamps = core.getVidFrameTimestamps(join(testDataDir, 'worldCamera.mp4'))
+    assert len(frameTimestamps) == nFrames
+    np.testing.assert_allclose(np.diff(frameTimestamps[:10]), 1000 / fps, rtol=0.01)
+
+    outFile = str(tmpdir.join('out.m4v'))
+    writer = core.openVideoWriter(outFile, 10, (64, 48))
+    for i in range(3):
+        writer.write(np.full((48, 64, 3), i * 50, dtype=np.uint8))
+    writer.release()
+    assert core.videoSize(outFile) == (64, 48)
+    assert len(core.getVidFrameTimestamps(outFile)) == 3
+
+    with pytest.raises(IOError):
+        core.openVideo(str(tmpdir.join('missing.mp4')))
+
+
+def test_featureDetector():
+    """ confirm a SIFT detector is created for the installed OpenCV """
+    assert core.opencvVersion() >= (3, 0)
+    refImg = cv2.imread(join(testDataDir, 'referenceImage.jpg'), cv2.IMREAD_GRAYSCALE)
+    kp, des = core.createFeatureDetector().detectAndCompute(refImg, None)
+    assert len(kp) > 100 and des.shape == (len(kp), 128)
@@ -0,0 +1,62 @@
+import os
+from os.path import join
+
+import numpy as np
+import cv2
+import pandas as pd
+import pytest
+
+from mobileGazeMapping import mapGaze
+from mobileGazeMapping import frameDedup
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def readFrames(path, nFrames):
+    vid = cv2.VideoCapture(path)
+    frames = [vid.read()[1] for i in range(nFrames)]
+    vid.release()
+    return frames
+
+
+def test_isDuplicate():
+    """ confirm re-encoded repeats of a frame count as duplicates, and consecutive frames don't """
+    dedup = frameDedup.FrameDeduplicator()
+    thumbs = [dedup.thumbnail(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+              for frame in readFrames(join(testDataDir, 'worldCamera.mp4'), 5)]
+    assert thumbs[0].shape == (36, 64)
+    assert not dedup.isDuplicate(thumbs[0], None)
+    assert dedup.isDuplicate(thumbs[0], thumbs[0].copy())
+    assert not any(dedup.isDuplicate(thumbs[i], thumbs[i - 1]) for i in range(1, len(thumbs)))
+
+    with pytest.raises(ValueError):
+        frameDedup.getDedupSettings({'maxDiff': 3})
+
+
+def test_reuseHomographies(tmpdir):
+    """ confirm repeated frames reuse the homographies of the last registered frame """
+    # every frame written 3 times, as a camera repeating frames would
+    videoPath = str(tmpdir.join('repeatedFrames.mp4'))
+    writer = cv2.VideoWriter(videoPath, cv2.VideoWriter_fourcc(*'mp4v'), 30, (1920, 1080))
+    for frame in readFrames(join(testDataDir, 'worldCamera.mp4'), 3):
+        for i in range(3):
+            writer.write(frame)
+    writer.release()
+
+    outputs = {}
+    for name, dedup in [('dedup', {}), ('noDedup', None)]:
+        outputDir = str(tmpdir.join(name))
+        mapGaze.processRecording(join(testDataDir, 'gazeData_world.tsv'), videoPath,
+                                 join(testDataDir, 'referenceImage.jpg'), outputDir, nFrames=9, dedup=dedup,
+                                 videoSettings={'layout': 'none'})
+        outputs[name] = (np.load(join(outputDir, 'homographies.npz'))['referenceImage'],
+                         pd.read_table(join(outputDir, 'frameMetrics.tsv')))
+
+    homographies, metrics = outputs['dedup']
+    assert metrics['reused'].tolist() == [0, 1, 2] * 3
+    assert metrics['numMatches'].tolist() == np.repeat(metrics['numMatches'][::3], 3).tolist()
+    np.testing.assert_array_equal(homographies, np.repeat(homographies[::3], 3, axis=0))
+    np.testing.assert_allclose(homographies[::3], outputs['noDedup'][0][::3])
+    assert (outputs['noDedup'][1]['reused'] == 0).all()
+    with open(join(str(tmpdir.join('dedup')), 'mapGazeLog.log')) as f:
+        assert 'Reused the homographies of a duplicate frame on 6 of 9 frames' in f.read()
@@ -0,0 +1,138 @@
+import os
+from os.path import join
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mobileGazeMapping import mapGaze
+from mobileGazeMapping import gazeAnalysis
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def syntheticGaze():
+    """ 100 Hz gaze with fixations at (100, 100) for 0-200 ms, (400, 300) for 300-500 ms (with a missing
+    sample at 400 ms), and (700, 100) for 600-640 ms (too short), joined by fast saccades """
+    ts = np.arange(0, 700, 10, dtype=np.float64)
+    x = np.interp(ts, [0, 200, 300, 500, 600, 640, 690], [100, 100, 400, 400, 700, 700, 1000])
+    y = np.interp(ts, [0, 200, 300, 500, 600, 640, 690], [100, 100, 300, 300, 100, 100, 100])
+    x[ts == 400] = np.nan
+    y[ts == 400] = np.nan
+    return pd.DataFrame({'gaze_ts': ts, 'confidence': 1.0, 'ref_gazeX': x, 'ref_gazeY': y})
+
+
+def test_ivt():
+    """ confirm I-VT finds the fixations of synthetic gaze, split at missing samples """
+    fixations = gazeAnalysis.detectFixations(syntheticGaze(), method='ivt', minDuration=60)
+    assert list(fixations.columns) == gazeAnalysis.FIXATION_COLUMNS
+    np.testing.assert_allclose(fixations[['start_ts', 'end_ts']].values, [[0, 200], [300, 390], [410, 500]])
+    np.testing.assert_allclose(fixations[['x', 'y']].values, [[100, 100], [400, 300], [400, 300]])
+
+    # a longer minDuration drops the split fixation, and a recording change splits the first
+    gaze = syntheticGaze()
+    gaze['recording'] = np.where(gaze.gaze_ts < 100, 'a', 'b')
+    fixations = gazeAnalysis.detectFixations(gaze, method='ivt', minDuration=95)
+    np.testing.assert_allclose(fixations[['start_ts', 'end_ts']].values, [[100, 200]])
+    assert fixations.recording.tolist() == ['b']
+
+    with pytest.raises(ValueError):
+        gazeAnalysis.getFixationSettings({'method': 'hmm'})
+
+
+def idtReference(ts, x, y, maxDispersion, minDuration):
+    """ textbook sample-by-sample I-DT """
+    def dispersion(i, j):
+        sx, sy = x[i:j + 1], y[i:j + 1]
+        return sx.max() - sx.min() + sy.max() - sy.min()
+
+    starts, ends = [], []
+    i, n = 0, len(ts)
+    while i < n:
+        j = np.searchsorted(ts, ts[i] + minDuration)
+        if j >= n or not dispersion(i, j) <= maxDispersion:
+            i += 1
+            continue
+        while j + 1 < n and dispersion(i, j + 1) <= maxDispersion:
+            j += 1
+        starts.append(i)
+        ends.append(j)
+        i = j + 1
+    return starts, ends
+
+
+def test_idt():
+    """ confirm I-DT matches a sample-by-sample implementation on noisy gaze, incl. windows longer than
+    the lookahead """
+    rng = np.random.RandomState(0)
+    ts = np.cumsum(rng.uniform(3, 5, 5000))
+    centers = np.repeat(rng.uniform(0, 1000, (50, 2)), rng.multinomial(5000, np.ones(50) / 50), axis=0)
+    x, y = (centers + rng.normal(0, 4, centers.shape)).T
+    x[rng.rand(5000) < 0.005] = np.nan
+
+    for minDuration in [40.0, 100.0]:
+        starts, ends = gazeAnalysis.idt(ts, x, y, maxDispersion=30, minDuration=minDuration, chunkSize=1000)
+        refStarts, refEnds = idtReference(ts, x, y, 30, minDuration)
+        assert starts.tolist() == refStarts
+        assert ends.tolist() == refEnds
+
+    fixations = gazeAnalysis.detectFixations(syntheticGaze(), method='idt', maxDispersion=20, minDuration=60)
+    np.testing.assert_allclose(fixations[['start_ts', 'end_ts']].values, [[0, 200], [300, 390], [410, 500]])
+
+
+def test_aoiIndex():
+    """ confirm points are assigned to every (overlapping) AOI they're in """
+    index = gazeAnalysis.AOIIndex({'left': [0, 0, 50, 100],
+                                   'triangle': [[40, 0], [100, 0], [100, 60]]}, (100, 100))
+    hits = index.lookup([10, 45, 90, 90, 60, -5, np.nan], [50, 5, 5, 90, 50, 5, 5])
+    np.testing.assert_array_equal(hits, [[1, 0], [1, 1], [0, 1], [0, 0], [0, 0], [0, 0], [0, 0]])
+
+    # more than 64 AOIs span several bit planes
+    aois = {'aoi{}'.format(k): [k, 0, 1, 1] for k in range(70)}
+    hits = gazeAnalysis.AOIIndex(aois, (100, 10)).lookup([0.5, 66.5], [0.5, 0.5])
+    assert hits.shape == (2, 70)
+    assert np.flatnonzero(hits[0]).tolist() == [0] and np.flatnonzero(hits[1]).tolist() == [66]
+
+
+def test_aoiStats():
+    """ confirm the per-AOI sample, dwell, and fixation stats of two recordings """
+    gaze = pd.concat([syntheticGaze().assign(recording='a'),
+                      syntheticGaze().assign(recording='b', gaze_ts=lambda df: df.gaze_ts + 1000)],
+                     ignore_index=True)
+    fixations = gazeAnalysis.detectFixations(gaze, method='ivt')
+    aois = {'first': [50, 50, 100, 100], 'second': [350, 250, 100, 100]}
+    stats = gazeAnalysis.aoiStats(gaze, fixations, aois, (1000, 1000)).set_index(['recording', 'aoi'])
+
+    for recording in ['a', 'b']:
+        first, second = stats.loc[(recording, 'first')], stats.loc[(recording, 'second')]
+        # 21 samples on the first fixation and one on the way out; 20 on the second and one on the way in
+        # and out, each counting the 10 ms to the next sample
+        assert first.nSamples == 22 and second.nSamples == 22
+        assert first.dwellTime == pytest.approx(220) and second.dwellTime == pytest.approx(220)
+        assert first.nFixations == 1 and second.nFixations == 2
+        assert first.fixationTime == 200 and second.fixationTime == 90 + 90
+        assert first.timeToFirstFixation == 0 and second.timeToFirstFixation == 300
+        assert second.firstFixationDuration == 90
+
+    labelled = gazeAnalysis.labelFixations(fixations, aois, (1000, 1000))
+    assert labelled.aoi.tolist() == ['first', 'second', 'second'] * 2
+
+
+def test_analyzeMapped(tmpdir):
+    """ confirm the mapped gaze of a recording loads and is analyzed """
+    outputDir = str(tmpdir.join('output'))
+    mapper = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'))
+    mapper.map_recording(join(testDataDir, 'gazeData_world.tsv'), join(testDataDir, 'worldCamera.mp4'),
+                         outputDir, nFrames=5)
+
+    gaze = gazeAnalysis.loadMapped(outputDir)
+    assert gaze.refImage.unique().tolist() == ['']
+    assert (np.diff(gaze.gaze_ts) >= 0).all()
+    fixations = gazeAnalysis.detectFixations(gaze, method='idt')
+    assert (fixations.duration >= gazeAnalysis.DEFAULT_FIXATION_SETTINGS['minDuration']).all()
+
+    refSizes = gazeAnalysis._refSizes(outputDir, [''])
+    width, height = refSizes['']
+    stats = gazeAnalysis.aoiStats(gaze, fixations, {'all': [0, 0, width, height]}, refSizes)
+    onRef = ((gaze.ref_gazeX >= 0) & (gaze.ref_gazeX < width) & (gaze.ref_gazeY >= 0) & (gaze.ref_gazeY < height))
+    assert stats.nSamples.tolist() == [onRef.sum()]
@@ -0,0 +1,98 @@
+import os
+from os.path import join
+
+import numpy as np
+import pandas as pd
+
+from mobileGazeMapping import gazeData as gazeDataModule
+from mobileGazeMapping.gazeData import GazeData
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_fromFile():
+    """ confirm the gaze data file is loaded into columns with a per-frame index """
+    gazeData = GazeData.fromFile(join(testDataDir, 'gazeData_world.tsv'))
+    raw = np.genfromtxt(join(testDataDir, 'gazeData_world.tsv'), skip_header=1)
+
+    assert len(gazeData) == raw.shape[0]
+    np.testing.assert_allclose(gazeData.norm_pos_x, raw[:, 3])
+
+    # every sample lands in the slice for its own frame
+    for frameIdx in range(gazeData.nFrames):
+        samples = gazeData.frameSlice(frameIdx)
+        np.testing.assert_array_equal(gazeData.frame_idx[samples], frameIdx)
+        assert samples.stop - samples.start == np.sum(raw[:, 1] == frameIdx)
+    assert gazeData.frameSlice(gazeData.nFrames + 10) == slice(0, 0)
+
+
+def test_unsortedFrames():
+    """ confirm samples are grouped by frame, keeping their order within a frame """
+    gazeData = GazeData(timestamp=[3, 1, 2, 4], frame_idx=[1, 0, 1, 0],
+                        confidence=[1, 1, 1, 1], norm_pos_x=[.3, .1, .2, .4], norm_pos_y=[0, 0, 0, 0],
+                        frame_timestamps=[0, 33, 66])
+
+    assert gazeData.nFrames == 3
+    np.testing.assert_array_equal(gazeData.timestamp[gazeData.frameSlice(0)], [1, 4])
+    np.testing.assert_array_equal(gazeData.timestamp[gazeData.frameSlice(1)], [3, 2])
+    assert len(gazeData.timestamp[gazeData.frameSlice(2)]) == 0
+    assert list(gazeData.toDataFrame().columns) == ['timestamp', 'frame_idx', 'confidence', 'norm_pos_x', 'norm_pos_y']
+
+
+def test_arrays(tmpdir):
+    """ confirm a gaze data file converted to arrays (in chunks) memory-maps back to the same gaze data """
+    gazeFile = join(testDataDir, 'gazeData_world.tsv')
+    timestampsFile = str(tmpdir.join('frame_timestamps.tsv'))
+    pd.DataFrame({'frameNum': np.arange(1, 61), 'timestamp': np.arange(60) * 33.3}).to_csv(
+        timestampsFile, sep='\t', index=False)
+    expected = GazeData.fromFile(gazeFile, timestampsFile)
+
+    gazeData = gazeDataModule.convertFile(gazeFile, str(tmpdir.join('arrays')), timestampsFile, chunkSize=7)
+    assert isinstance(gazeData.norm_pos_x, np.memmap)
+    assert len(gazeData) == len(expected) and gazeData.nFrames == expected.nFrames == 60
+    for col in gazeDataModule.COLUMNS + ['frameOffsets', 'frame_timestamps']:
+        np.testing.assert_array_equal(getattr(gazeData, col), getattr(expected, col))
+    assert gazeData.frameSlice(3) == expected.frameSlice(3)
+
+    # loaded by path, like a gaze data file
+    np.testing.assert_array_equal(GazeData.fromFile(str(tmpdir.join('arrays'))).timestamp, expected.timestamp)
+
+    # samples out of frame order are sorted, as when loaded from the file
+    shuffled = str(tmpdir.join('shuffled.tsv'))
+    expected.toDataFrame().iloc[::-1].to_csv(shuffled, sep='\t', index=False)
+    gazeData = gazeDataModule.convertFile(shuffled, str(tmpdir.join('shuffled')), chunkSize=5)
+    reference = GazeData.fromFile(shuffled)
+    for col in gazeDataModule.COLUMNS + ['frameOffsets']:
+        np.testing.assert_array_equal(getattr(gazeData, col), getattr(reference, col))
+
+    # blank lines (e.g. trailing ones) aren't converted into extra samples
+    blankLines = str(tmpdir.join('blankLines.tsv'))
+    with open(gazeFile) as f:
+        lines = f.read().splitlines()
+    with open(blankLines, 'w') as f:
+        f.write('\n'.join(lines[:10] + [''] + lines[10:]) + '\n\n\n')
+    gazeData = gazeDataModule.convertFile(blankLines, str(tmpdir.join('blankLines')), chunkSize=7)
+    assert len(gazeData) == len(expected)
+    for col in gazeDataModule.COLUMNS + ['frameOffsets']:
+        np.testing.assert_array_equal(getattr(gazeData, col), getattr(GazeData.fromFile(gazeFile), col))
+
+    # save() and load() round trip
+    expected.save(str(tmpdir.join('saved')))
+    loaded = GazeData.load(str(tmpdir.join('saved')), mmap=False)
+    assert not isinstance(loaded.timestamp, np.memmap)
+    np.testing.assert_array_equal(loaded.frame_timestamps, expected.frame_timestamps)
+
+
+def test_mapArrays(tmpdir):
+    """ confirm mapping from memory-mapped arrays gives the same result as from the file """
+    from mobileGazeMapping import mapGaze
+
+    gazeFile = join(testDataDir, 'gazeData_world.tsv')
+    arrayDir = str(tmpdir.join('arrays'))
+    gazeDataModule.main([gazeFile, '-o', arrayDir])
+    mapper = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'), videoSettings={'layout': 'none'})
+    fromFile = mapper.map_recording(gazeFile, join(testDataDir, 'worldCamera.mp4'), str(tmpdir.join('file')),
+                                    nFrames=3)
+    fromArrays = mapper.map_recording(arrayDir, join(testDataDir, 'worldCamera.mp4'), str(tmpdir.join('arrays_out')),
+                                      nFrames=3)
+    pd.testing.assert_frame_equal(fromFile, fromArrays)
@@ -0,0 +1,49 @@
+import os
+from os.path import join
+
+import numpy as np
+import cv2
+import pytest
+
+from mobileGazeMapping import mapGaze
+from mobileGazeMapping import gazeHeatmap
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_accumulate():
+    """ confirm samples are binned by confidence, and off-image or low confidence samples are left out """
+    heatmap = gazeHeatmap.HeatmapAccumulator((10, 6), binSize=4, minConfidence=0.5)
+    assert heatmap.shape == (2, 3)
+    heatmap.add([[0, 0], [3.9, 3.9], [9, 5], [-1, 0], [10, 0], [np.nan, 1], [5, 1]],
+                [1.0, 0.5, 0.8, 1.0, 1.0, 1.0, 0.2])
+    np.testing.assert_allclose(heatmap.grid, [[1.5, 0, 0], [0, 0, 0.8]])
+    assert heatmap.nSamples == 3
+
+    density = heatmap.density()
+    assert density.shape == (2, 3) and density.max() == pytest.approx(1)
+    with pytest.raises(ValueError):
+        gazeHeatmap.getHeatmapSettings({'radius': 5})
+
+
+def test_heatmapOutputs(tmpdir):
+    """ confirm the heatmap accumulated while mapping matches one made from the mapped gaze file """
+    outputDir = str(tmpdir.join('output'))
+    mapper = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'), heatmap={'binSize': 8})
+    gazeMapped = mapper.map_recording(join(testDataDir, 'gazeData_world.tsv'),
+                                      join(testDataDir, 'worldCamera.mp4'),
+                                      outputDir,
+                                      nFrames=5)
+
+    refShape = cv2.imread(join(testDataDir, 'referenceImage.jpg')).shape
+    grid = np.load(join(outputDir, 'heatmap.npy'))
+    assert grid.shape == (-(-refShape[0] // 8), -(-refShape[1] // 8))
+    onRef = ((gazeMapped.ref_gazeX >= 0) & (gazeMapped.ref_gazeX < refShape[1]) &
+             (gazeMapped.ref_gazeY >= 0) & (gazeMapped.ref_gazeY < refShape[0]))
+    assert grid.sum() == pytest.approx(gazeMapped.confidence[onRef].sum())
+    assert cv2.imread(join(outputDir, 'heatmap.png')).shape == refShape
+
+    # same grid from the written file, read in chunks (ref coords are rounded in the file)
+    heatmaps = gazeHeatmap.heatmapsFromFile(outputDir, join(testDataDir, 'referenceImage.jpg'),
+                                            chunkSize=100, binSize=8)
+    assert heatmaps['referenceImage'].grid.sum() == pytest.approx(grid.sum(), rel=0.01)
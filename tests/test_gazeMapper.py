@@ -0,0 +1,291 @@
+import os
+import logging
+from os.path import join
+
+import numpy as np
+import cv2
+import pandas as pd
+import pytest
+
+from mobileGazeMapping import mapGaze
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_mapFrame():
+    """ confirm a single frame and points can be mapped with a reusable mapper """
+    mapper = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'))
+
+    vid = cv2.VideoCapture(join(testDataDir, 'worldCamera.mp4'))
+    ret, frame = vid.read()
+    vid.release()
+
+    fr = mapper.map_frame(frame, 0)
+    assert fr['foundGoodMatch']
+
+    # first two gaze samples of the test data (see test_mapGaze.py)
+    refCoords = mapper.map_points([[978.816, 57.132], [979.968, 57.564]], fr['world2ref'])
+    np.testing.assert_allclose(refCoords, [[1032, 165], [1034, 166]], atol=1)
+
+
+def test_mapMultipleRecordings(tmpdir):
+    """ confirm one mapper can map several recordings without piling up log handlers """
+    mapper = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'))
+    logger = logging.getLogger('mapGaze')
+
+    nHandlers = None
+    for run in ['run1', 'run2']:
+        outputDir = str(tmpdir.join(run))
+        gazeMapped = mapper.map_recording(join(testDataDir, 'gazeData_world.tsv'),
+                                          join(testDataDir, 'worldCamera.mp4'),
+                                          outputDir,
+                                          nFrames=2)
+        assert gazeMapped.shape[0] > 0
+        assert os.path.exists(join(outputDir, 'mapGazeLog.log'))
+        assert os.path.exists(join(outputDir, 'gazeData_mapped.tsv'))
+
+        if nHandlers is None:
+            nHandlers = len(logger.handlers)
+        assert len(logger.handlers) == nHandlers
+
+
+def test_multipleReferences(tmpdir):
+    """ confirm gaze is mapped to the right one of several reference images in a single pass """
+    # a second stimulus that never appears in the world camera video
+    noiseRef = str(tmpdir.join('noiseImage.jpg'))
+    rng = np.random.RandomState(0)
+    cv2.imwrite(noiseRef, cv2.resize(rng.randint(0, 255, (60, 80, 3)).astype(np.uint8), (800, 600),
+                                     interpolation=cv2.INTER_NEAREST))
+
+    outputDir = str(tmpdir.join('output'))
+    mapper = mapGaze.GazeMapper([join(testDataDir, 'referenceImage.jpg'), noiseRef])
+    gazeMapped = mapper.map_recording(join(testDataDir, 'gazeData_world.tsv'),
+                                      join(testDataDir, 'worldCamera.mp4'),
+                                      outputDir,
+                                      nFrames=5)
+
+    # same mapping as the single reference case (see test_mapGaze.py)
+    assert list(gazeMapped['refImage'][:10]) == ['referenceImage'] * 10
+    np.testing.assert_allclose(gazeMapped['ref_gazeX'][:10],
+                               [1032, 1034, 1033, 977, 893, 857, 842, 838, 833, 832], atol=1)
+    for f in ['ref_gaze_referenceImage.m4v', 'ref_gaze_noiseImage.m4v', 'noiseImage.jpg']:
+        assert os.path.exists(join(outputDir, f))
+
+    # per-reference homographies; the absent stimulus never matches
+    homographies = np.load(join(outputDir, 'homographies.npz'))
+    assert homographies['referenceImage'].shape == (5, 3, 3)
+    assert not np.isnan(homographies['referenceImage']).any()
+    assert np.isnan(homographies['noiseImage']).all()
+
+
+def test_homographyMethods(tmpdir):
+    """ confirm each available robust estimator maps the test frames, with quality metrics recorded """
+    for method in ['ransac', 'rho', 'magsac']:
+        if method not in mapGaze.homographyMethods():
+            continue
+        outputDir = str(tmpdir.join(method))
+        mapper = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'),
+                                    homographySettings={'method': method, 'maxIters': 500})
+        gazeMapped = mapper.map_recording(join(testDataDir, 'gazeData_world.tsv'),
+                                          join(testDataDir, 'worldCamera.mp4'),
+                                          outputDir,
+                                          nFrames=3)
+        np.testing.assert_allclose(gazeMapped['ref_gazeX'][:6], [1032, 1034, 1033, 977, 893, 857], atol=2)
+
+        metrics = pd.read_table(join(outputDir, 'frameMetrics.tsv'))
+        assert list(metrics['frame']) == [0, 1, 2]
+        assert metrics['foundGoodMatch'].all()
+        assert (metrics['inlierRatio'] > 0.5).all()
+        assert (metrics['reprojError'] < 3).all()
+        assert metrics['convex'].all()
+
+
+def test_rejectDegenerateHomography():
+    """ confirm homographies that mirror, fold, or shrink the reference image are rejected """
+    settings = mapGaze.getHomographySettings()
+    refPts = np.float32([[x, y] for x in range(0, 100, 10) for y in range(0, 100, 10)])
+    mask = np.ones(len(refPts), dtype=np.uint8)
+
+    def quality(H):
+        framePts = cv2.perspectiveTransform(refPts.reshape(-1, 1, 2), H).reshape(-1, 2)
+        return mapGaze.homographyQuality(H, mask, refPts, framePts, refSize=(100, 100), frameSize=(480, 640))
+
+    good = np.array([[2, 0, 50], [0, 2, 40], [0, 0, 1]], dtype=np.float64)
+    assert mapGaze.checkHomography(quality(good), settings) is None
+
+    mirrored = np.array([[-2, 0, 300], [0, 2, 40], [0, 0, 1]], dtype=np.float64)
+    assert 'mirrored' in mapGaze.checkHomography(quality(mirrored), settings)
+
+    folded = np.array([[1, 0, 0], [0, 1, 0], [-0.015, 0, 1]], dtype=np.float64)  # plane crosses the camera
+    assert 'convex' in mapGaze.checkHomography(quality(folded), settings)
+
+    tiny = np.array([[0.01, 0, 50], [0, 0.01, 40], [0, 0, 1]], dtype=np.float64)
+    assert 'area' in mapGaze.checkHomography(quality(tiny), settings)
+
+    with pytest.raises(ValueError):
+        mapGaze.getHomographySettings({'method': 'bogus'})
+
+
+def test_reuseBuffers():
+    """ confirm reusing frame buffers gives the same results without allocating new frames """
+    mapper = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'))
+    vid = cv2.VideoCapture(join(testDataDir, 'worldCamera.mp4'))
+    frames = [vid.read()[1] for i in range(2)]
+    vid.release()
+
+    fresh = mapper.map_frame(frames[0], 0)
+    reused = [mapper.map_frame(frame, i, reuseBuffers=True) for i, frame in enumerate(frames)]
+    assert reused[0]['origFrame'] is reused[1]['origFrame']
+    assert reused[0]['frame_gray'] is reused[1]['frame_gray']
+    np.testing.assert_array_equal(reused[1]['origFrame'], frames[1])
+    np.testing.assert_allclose(reused[0].world2ref, fresh['world2ref'], atol=1e-3)
+    assert 'world2ref' in fresh and fresh.get('rejectReason') is None
+    assert isinstance(fresh['references'][0], mapGaze.ReferenceMatch)
+
+    # projecting in place into reused buffers matches projecting into a copy
+    buffers = {}
+    projected = mapGaze.projectImage2D(frames[0], fresh['ref2world'], mapper.refImgColor)
+    inPlace = frames[0].copy()
+    for i in range(2):
+        result = mapGaze.projectImage2D(inPlace, fresh['ref2world'], mapper.refImgColor, buffers=buffers)
+    assert result is inPlace
+    np.testing.assert_array_equal(inPlace, projected)
+    assert sorted(buffers) == ['mask', 'warped']
+
+
+def test_projectImage2D():
+    """ confirm projecting only the covered region matches warping the whole image """
+    rng = np.random.RandomState(0)
+    frame = rng.randint(0, 256, (480, 640, 3)).astype(np.uint8)
+    newImage = rng.randint(0, 256, (200, 300, 3)).astype(np.uint8)
+    newImage[50:100, 50:100] = 0            # black pixels are copied too
+    H = np.array([[0.8, 0.1, 120], [-0.05, 0.9, 80], [1e-4, 2e-4, 1]])
+
+    # composite of the full-frame warp, masked by warping a constant image
+    warped = cv2.warpPerspective(newImage, H, (640, 480))
+    covered = cv2.warpPerspective(np.full((200, 300), 255, np.uint8), H, (640, 480), flags=cv2.INTER_NEAREST) > 0
+    expected = frame.copy()
+    expected[covered] = warped[covered]
+
+    projected = mapGaze.projectImage2D(frame, H, newImage)
+    # (interpolation of the shifted warp can round differently by 1)
+    differs = (np.abs(projected.astype(int) - expected).max(axis=2) > 1)
+    kernel = np.ones((3, 3), np.uint8)
+    edges = cv2.dilate(covered.astype(np.uint8), kernel) > cv2.erode(covered.astype(np.uint8), kernel)
+    assert not (differs & ~edges).any()                 # only along the edges
+    np.testing.assert_array_equal(projected[~covered & ~edges], frame[~covered & ~edges])
+    center = tuple(np.round(cv2.perspectiveTransform(np.float64([[[75, 75]]]), H)).astype(int).ravel())
+    assert (projected[center[1], center[0]] == 0).all()
+
+    # transparent pixels are left out
+    rgba = np.dstack([newImage, np.full((200, 300), 255, np.uint8)])
+    rgba[:, 150:, 3] = 0
+    projected = mapGaze.projectImage2D(frame, H, rgba)
+    right = tuple(np.round(cv2.perspectiveTransform(np.float64([[[250, 100]]]), H)).astype(int).ravel())
+    np.testing.assert_array_equal(projected[right[1], right[0]], frame[right[1], right[0]])
+
+    # nothing happens when the image lands outside of the frame
+    offFrame = H.copy()
+    offFrame[0, 2] = 5000
+    np.testing.assert_array_equal(mapGaze.projectImage2D(frame, offFrame, newImage), frame)
+
+    # outline mode only draws the projected quadrilateral
+    outlined = mapGaze.projectImage2D(frame, H, newImage, mode='outline')
+    changed = (outlined != frame).any(axis=2)
+    assert changed.any() and not changed[center[1], center[0]]
+    assert changed.sum() < 0.2 * covered.sum()
+    with pytest.raises(ValueError):
+        mapGaze.projectImage2D(frame, H, newImage, mode='blend')
+
+
+def test_previewVideos(tmpdir):
+    """ confirm the preview videos can be resized, decimated, or combined into a QA video """
+    def vidInfo(path):
+        vid = cv2.VideoCapture(path)
+        info = (int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)), int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                int(vid.get(cv2.CAP_PROP_FRAME_COUNT)))
+        vid.release()
+        return info
+
+    mapper = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'),
+                                videoSettings={'scale': 0.5, 'every': 2, 'ref': {'scale': 0.25, 'every': 1}})
+    outputDir = str(tmpdir.join('scaled'))
+    mapper.map_recording(join(testDataDir, 'gazeData_world.tsv'), join(testDataDir, 'worldCamera.mp4'),
+                         outputDir, nFrames=4)
+    assert vidInfo(join(outputDir, 'world_gaze.m4v')) == (960, 540, 2)
+    assert vidInfo(join(outputDir, 'ref2world_mapping.m4v')) == (960, 540, 2)
+    assert vidInfo(join(outputDir, 'ref_gaze.m4v')) == (342, 370, 4)
+
+    # a single side-by-side video: world frame, then the reference image at the same height
+    mapper = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'), videoSettings={'layout': 'qa', 'scale': 0.25})
+    outputDir = str(tmpdir.join('qa'))
+    mapper.map_recording(join(testDataDir, 'gazeData_world.tsv'), join(testDataDir, 'worldCamera.mp4'),
+                         outputDir, nFrames=2)
+    assert sorted(f for f in os.listdir(outputDir) if f.endswith('.m4v')) == ['mapping_qa.m4v']
+    assert vidInfo(join(outputDir, 'mapping_qa.m4v')) == (480 + 250, 270, 2)
+
+    mapper = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'), videoSettings={'layout': 'none'})
+    outputDir = str(tmpdir.join('none'))
+    mapper.map_recording(join(testDataDir, 'gazeData_world.tsv'), join(testDataDir, 'worldCamera.mp4'),
+                         outputDir, nFrames=1)
+    assert not any(f.endswith('.m4v') for f in os.listdir(outputDir))
+    assert os.path.exists(join(outputDir, 'gazeData_mapped.tsv'))
+
+    with pytest.raises(ValueError):
+        mapGaze.getVideoSettings({'world': {'every': 0}})
+    with pytest.raises(ValueError):
+        mapGaze.getVideoSettings({'layout': 'grid'})
+
+
+def test_keypointGrid():
+    """ confirm the grid finds exactly the points within the radius of every query """
+    rng = np.random.RandomState(0)
+    points = rng.uniform(-50, 650, (500, 2))
+    queries = rng.uniform(0, 600, (200, 2))
+    grid = mapGaze.KeypointGrid(points, cellSize=32)
+    queryIdx, pointIdx = grid.query(queries, 25)
+
+    distances = np.linalg.norm(queries[:, None] - points[None], axis=2)
+    expected = np.argwhere(distances < 25)
+    assert sorted(zip(queryIdx, pointIdx)) == sorted(map(tuple, expected))
+
+    assert len(mapGaze.KeypointGrid(np.zeros((0, 2)), 32).query(queries, 25)[0]) == 0
+
+
+def test_guidedMatching(tmpdir):
+    """ confirm guided matching follows the previous frame's homography, and agrees with full matching """
+    vid = cv2.VideoCapture(join(testDataDir, 'worldCamera.mp4'))
+    frames = [vid.read()[1] for i in range(3)]
+    vid.release()
+
+    full = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'))
+    guided = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'), matchSettings={'guided': True})
+    corners = np.float64([[0, 0], [1280, 0], [1280, 720], [0, 720]]).reshape(-1, 1, 2)
+    previous = None
+    for i, frame in enumerate(frames):
+        expected = full.map_frame(frame, i)
+        fr = guided.map_frame(frame, i, previous=previous)
+        previous = fr
+        assert fr['foundGoodMatch'] and fr['references'][0]['guided'] == (i > 0)
+        if i > 0:
+            assert fr['references'][0]['numInliers'] > expected['references'][0]['numInliers']
+            np.testing.assert_allclose(cv2.perspectiveTransform(corners, fr['world2ref']),
+                                       cv2.perspectiveTransform(corners, expected['world2ref']), atol=5)
+
+    # a bad prediction falls back to matching all of the features
+    lost = mapGaze.FrameResult()
+    lost.references = [mapGaze.ReferenceMatch()]
+    lost.references[0].update({'foundGoodMatch': True, 'ref2world': np.float64([[1, 0, 5000], [0, 1, 0], [0, 0, 1]])})
+    fr = guided.map_frame(frames[1], 1, previous=lost)
+    assert fr['foundGoodMatch'] and not fr['references'][0]['guided']
+
+    # recorded per frame in the metrics
+    guided.map_recording(join(testDataDir, 'gazeData_world.tsv'), join(testDataDir, 'worldCamera.mp4'),
+                         str(tmpdir), nFrames=3)
+    metrics = pd.read_table(join(str(tmpdir), 'frameMetrics.tsv'))
+    assert metrics['guided'].tolist() == [False, True, True]
+
+    with pytest.raises(ValueError):
+        mapGaze.getMatchSettings({'guidedRatio': 1.5})
+    with pytest.raises(ValueError):
+        mapGaze.getMatchSettings({'radius': 10})
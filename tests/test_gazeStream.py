@@ -0,0 +1,72 @@
+import os
+from os.path import join
+
+import numpy as np
+
+from mobileGazeMapping import gazeStream
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_streamMatchesOffline():
+    """ confirm a stream replayed without drops maps gaze like processRecording does """
+    streamMapper = gazeStream.StreamingMapper(join(testDataDir, 'referenceImage.jpg'), maxQueue=100)
+    stream = gazeStream.replayRecording(join(testDataDir, 'worldCamera.mp4'),
+                                        join(testDataDir, 'gazeData_world.tsv'),
+                                        speed=None, nFrames=5)
+    results = list(streamMapper.map_stream(stream))
+
+    # same values as test_mapGaze.py
+    assert [r['status'] for r in results] == ['mapped'] * 10
+    assert [r['frame_idx'] for r in results] == list(np.repeat(np.arange(5), 2))
+    np.testing.assert_allclose([r['ref_gazeX'] for r in results],
+                               [1032, 1034, 1033, 977, 893, 857, 842, 838, 833, 832], atol=1)
+
+    stats = streamMapper.latencyStats()
+    assert stats['nSamples'] == 10
+    assert stats['processed'] == 5 and stats['dropped'] == 0
+    assert 0 <= stats['p50'] <= stats['p99'] <= stats['max']
+
+
+def test_streamDropsAndCoasts():
+    """ confirm frames are dropped when the detector can't keep up, and their gaze is still reported """
+    streamMapper = gazeStream.StreamingMapper(join(testDataDir, 'referenceImage.jpg'), maxQueue=1)
+
+    # a fast live source: every frame arrives before the previous one is mapped
+    def source():
+        for item in gazeStream.replayRecording(join(testDataDir, 'worldCamera.mp4'),
+                                               join(testDataDir, 'gazeData_world.tsv'),
+                                               speed=None, nFrames=6):
+            yield item
+
+    results = list(streamMapper.map_stream(source()))
+    # every sample reported exactly once
+    assert sorted(r['timestamp'] for r in results) == sorted(set(r['timestamp'] for r in results))
+    assert len(results) == 12
+
+    stats = streamMapper.latencyStats()
+    assert stats['dropped'] > 0
+    assert stats['processed'] + stats['dropped'] == 6
+    assert stats['coasted'] + stats['lost'] > 0
+    for r in results:
+        if r['status'] in ['mapped', 'coasted']:
+            assert not np.isnan(r['ref_gazeX'])
+
+
+def test_streamForgetsOldFrames():
+    """ confirm the homographies of frames no waiting sample needs are dropped as the stream goes on """
+    streamMapper = gazeStream.StreamingMapper(join(testDataDir, 'referenceImage.jpg'), maxQueue=100)
+    blank = np.full((48, 64, 3), 128, dtype=np.uint8)
+
+    def source():
+        for i in range(50):
+            yield gazeStream.Frame(i, blank)
+            yield gazeStream.GazeSample(i * 33.3, i, 1.0, 0.5, 0.5)
+
+    stream = streamMapper.map_stream(source())
+    results = []
+    for result in stream:
+        results.append(result)
+        assert len(stream.gi_frame.f_locals['homographies']) <= 2
+    assert [r['frame_idx'] for r in results] == list(range(50))
+    assert all(r['status'] == 'nomatch' for r in results)
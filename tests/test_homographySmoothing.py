@@ -0,0 +1,99 @@
+import os
+from os.path import join
+
+import numpy as np
+import pandas as pd
+import cv2
+
+from mobileGazeMapping import mapGaze
+from mobileGazeMapping import homographySmoothing
+from mobileGazeMapping.gazeData import GazeData
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_homographiesFromCorners():
+    """ confirm the vectorized corner solver agrees with OpenCV """
+    src = np.float64([[0, 0], [640, 0], [640, 480], [0, 480]])
+    dst = np.float64([[[10, 20], [600, 40], [620, 470], [5, 450]],
+                      [[0, 0], [320, 0], [320, 240], [0, 240]]])
+    H = homographySmoothing.homographiesFromCorners(np.broadcast_to(src, (2, 4, 2)), dst)
+    for i in range(2):
+        expected = cv2.getPerspectiveTransform(src.astype(np.float32), dst[i].astype(np.float32))
+        np.testing.assert_allclose(H[i], expected, atol=1e-6)
+
+
+def test_homographiesFromCorners_degenerate():
+    """ confirm a frame with degenerate corners is left nan without failing the others """
+    src = np.float64([[0, 0], [640, 0], [640, 480], [0, 480]])
+    dst = np.float64([[[10, 20], [600, 40], [620, 470], [5, 450]],
+                      [[0, 0], [0, 0], [0, 0], [0, 0]]])
+    H = homographySmoothing.homographiesFromCorners(np.broadcast_to(src, (2, 4, 2)), dst)
+    expected = cv2.getPerspectiveTransform(src.astype(np.float32), dst[0].astype(np.float32))
+    np.testing.assert_allclose(H[0], expected, atol=1e-6)
+    assert np.isnan(H[1]).all()
+
+
+def test_gapLengths():
+    """ confirm gaps are measured, and only gaps inside the sequence are flagged as fillable """
+    missing = np.array([1, 0, 0, 1, 1, 0, 1, 0, 1, 1], dtype=bool)
+    lengths, inside = homographySmoothing.gapLengths(missing)
+    np.testing.assert_array_equal(lengths, [1, 0, 0, 2, 2, 0, 1, 0, 2, 2])
+    np.testing.assert_array_equal(inside, [0, 0, 0, 1, 1, 0, 1, 0, 0, 0])
+
+
+def test_smoothHomographies():
+    """ confirm only interior gaps up to maxGap frames are filled, by interpolating across them """
+    nFrames = 20
+    shifts = np.arange(nFrames) * 4.0
+    homographies = np.tile(np.eye(3), (nFrames, 1, 1))
+    homographies[:, 0, 2] = shifts          # steady pan to the right
+    missing = np.zeros(nFrames, dtype=bool)
+    missing[[0, 5, 6, 10, 11, 12, 13, 19]] = True
+    homographies[missing] = np.nan
+
+    smoothed, filled = homographySmoothing.smoothHomographies(homographies, (640, 480), window=1, maxGap=3)
+    np.testing.assert_array_equal(np.flatnonzero(filled), [5, 6])
+    np.testing.assert_array_equal(np.flatnonzero(np.isnan(smoothed).any(axis=(1, 2))), [0, 10, 11, 12, 13, 19])
+    valid = ~np.isnan(smoothed).any(axis=(1, 2))
+    np.testing.assert_allclose(smoothed[valid, 0, 2], shifts[valid], atol=1e-6)
+
+
+def test_smoothRecording(tmpdir):
+    """ confirm gaze on frames without a homography is recovered by filling the gap """
+    outputDir = str(tmpdir.join('output'))
+    mapper = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'), smoothing={'window': 3, 'maxGap': 3})
+    mapper.map_recording(join(testDataDir, 'gazeData_world.tsv'),
+                         join(testDataDir, 'worldCamera.mp4'),
+                         outputDir,
+                         nFrames=10)
+    measured = pd.read_table(join(outputDir, 'gazeData_mapped.tsv'))
+    smoothed = pd.read_table(join(outputDir, 'gazeData_mapped_smoothed.tsv'))
+    assert (smoothed['homography'] == 'smoothed').all()
+    np.testing.assert_allclose(smoothed['ref_gazeX'], measured['ref_gazeX'], atol=5)
+    np.testing.assert_allclose(smoothed['ref_gazeY'], measured['ref_gazeY'], atol=5)
+
+    # drop frames 4-6 and confirm their gaze is filled in from the neighboring frames
+    with np.load(join(outputDir, 'homographies.npz')) as f:
+        homographies = f['referenceImage'].copy()
+    homographies[4:7] = np.nan
+    vid = cv2.VideoCapture(join(testDataDir, 'worldCamera.mp4'))
+    frameSize = (int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)), int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    vid.release()
+
+    filled = homographySmoothing.smoothRecording(outputDir,
+                                                 GazeData.fromFile(join(testDataDir, 'gazeData_world.tsv')),
+                                                 frameSize,
+                                                 homographies={'referenceImage': homographies},
+                                                 window=1, maxGap=3)
+    gap = filled['worldFrame'].isin([4, 5, 6]).values
+    assert (filled['homography'][gap] == 'filled').all()
+    assert (filled['homography'][~gap] == 'smoothed').all()
+    np.testing.assert_allclose(filled['ref_gazeX'][gap], measured['ref_gazeX'][gap], atol=15)
+
+    # a gap longer than maxGap stays unmapped
+    unfilled = homographySmoothing.smoothRecording(outputDir, join(testDataDir, 'gazeData_world.tsv'), frameSize,
+                                                   homographies={'referenceImage': homographies},
+                                                   window=1, maxGap=2)
+    assert (unfilled['homography'][gap] == 'none').all()
+    assert unfilled['ref_gazeX'][gap].isnull().all()
@@ -0,0 +1,53 @@
+import os
+import gzip
+
+import pytest
+
+from mobileGazeMapping.preprocessing import io_utils
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_transferFile(tmpdir):
+    """ confirm each raw mode brings the file over and counts the bytes moved """
+    src = str(tmpdir.join('raw.bin'))
+    with open(src, 'wb') as f:
+        f.write(b'x' * 1000)
+
+    # copy: full read + write
+    ioStats = io_utils.IOStats()
+    dst = io_utils.transferFile(src, str(tmpdir.join('copied.bin')), 'copy', ioStats)
+    assert open(dst, 'rb').read() == b'x' * 1000
+    assert ioStats.asDict() == {'bytesRead': 1000, 'bytesWritten': 1000}
+
+    # link: same filesystem, so no bytes moved
+    ioStats = io_utils.IOStats()
+    dst = io_utils.transferFile(src, str(tmpdir.join('linked.bin')), 'link', ioStats)
+    assert open(dst, 'rb').read() == b'x' * 1000
+    assert ioStats.asDict() == {'bytesRead': 0, 'bytesWritten': 0}
+    os.remove(dst)
+    assert os.path.exists(src)
+
+    # inplace: nothing transferred, read from the source
+    ioStats = io_utils.IOStats()
+    dst = io_utils.transferFile(src, str(tmpdir.join('unused.bin')), 'inplace', ioStats)
+    assert dst == src
+    assert not os.path.exists(str(tmpdir.join('unused.bin')))
+    assert ioStats.asDict() == {'bytesRead': 0, 'bytesWritten': 0}
+
+    with pytest.raises(ValueError):
+        io_utils.transferFile(src, str(tmpdir.join('bad.bin')), 'move')
+
+
+def test_openRaw(tmpdir):
+    """ confirm gzipped files are decompressed in-stream """
+    lines = [b'{"ts": 1, "gp": [0.5, 0.5]}\n', b'{"ts": 2, "gp": [0.6, 0.4]}\n']
+    gzFile = str(tmpdir.join('livedata.json.gz'))
+    with gzip.open(gzFile, 'wb') as f:
+        f.writelines(lines)
+
+    ioStats = io_utils.IOStats()
+    with io_utils.openRaw(gzFile, ioStats) as f:
+        assert list(f) == lines
+    assert ioStats.bytesRead == os.path.getsize(gzFile)
+    assert not os.path.exists(str(tmpdir.join('livedata.json')))
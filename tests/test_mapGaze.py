@@ -1,24 +1,23 @@
-import sys
 import os
-import shutil
 from os.path import join
 
 import numpy as np
 import cv2
+import pytest
 
 testDataDir = os.path.dirname(os.path.abspath(__file__))
 
-def test_mapGaze():
-    # root dir to import mapgaze
-    mapGazeDir = os.path.dirname(testDataDir)
-    sys.path.insert(0, mapGazeDir)
-    import mapGaze
+
+@pytest.fixture(scope='module')
+def outputDir(tmpdir_factory):
+    """ run the test data through map gaze once, into a temporary dir """
+    from mobileGazeMapping import mapGaze
 
     # inputs for test
     gazeData = join(testDataDir, 'gazeData_world.tsv')
     worldCameraVid = join(testDataDir, 'worldCamera.mp4')
     referenceImage = join(testDataDir, 'referenceImage.jpg')
-    outputDir = join(testDataDir, 'test_output')
+    outputDir = str(tmpdir_factory.mktemp('test_output'))
     nFrames = 5  # only test on small number of frames from testData sample
 
     # run test data through map gaze
@@ -27,16 +26,17 @@ def test_mapGaze():
                              referenceImage=referenceImage,
                              outputDir=outputDir,
                              nFrames=nFrames)
+    return outputDir
 
-def test_outputFiles():
+def test_outputFiles(outputDir):
     """ confirm that all of the expected output files get created """
 
     expectedFiles = ['gazeData_mapped.tsv', 'mapGazeLog.log', 'ref_gaze.m4v', 'ref2world_mapping.m4v', 'referenceImage.jpg', 'world_gaze.m4v']
 
     for f in expectedFiles:
-        assert os.path.exists(join(testDataDir, 'test_output', f))
+        assert os.path.exists(join(outputDir, f))
 
-def test_mappedGaze():
+def test_mappedGaze(outputDir):
     """ confirm the that output mapped gaze data is what it is supposed to be """
     # expected values
     worldGazeX = np.array([978.816, 979.968, 981.312, 939.264, 877.248, 849.408,
@@ -48,7 +48,7 @@ def test_mappedGaze():
     refGazeY = np.array([165., 166., 165., 203., 242., 257., 260., 264., 263., 261.])
 
     # read in the mapped gaze output file
-    outputData = np.genfromtxt(join(testDataDir, 'test_output/gazeData_mapped.tsv'), skip_header=1)
+    outputData = np.genfromtxt(join(outputDir, 'gazeData_mapped.tsv'), skip_header=1)
 
     # confirm worldGaze data matches expectations
     np.testing.assert_allclose(outputData[:,3], worldGazeX, 0, 1)
@@ -58,10 +58,8 @@ def test_mappedGaze():
     np.testing.assert_allclose(outputData[:,5], refGazeX, 0, 1)
     np.testing.assert_allclose(outputData[:,6], refGazeY, 0, 1)
 
-def test_outputVids():
+def test_outputVids(outputDir):
     """ confirm that the output vids are valid vid files with the appropriate dims """
-    outputDir = join(testDataDir, 'test_output')
-
     # check ref_gaze.m4v
     vid = cv2.VideoCapture(join(outputDir, 'ref_gaze.m4v'))
     vidSize = (int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)),
@@ -79,9 +77,3 @@ def test_outputVids():
     vidSize = (int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)),
                int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)))
     assert vidSize == (1920, 1080)
-
-
-def test_removeTestOutput():
-    """ remove the output files from the tests """
-    #remove the test output dir
-    shutil.rmtree(join(testDataDir, 'test_output'))
@@ -0,0 +1,128 @@
+import os
+import time
+import threading
+from os.path import join
+
+import pandas as pd
+import pytest
+
+from mobileGazeMapping import mapGazeService
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_localClient(tmpdir):
+    """ confirm jobs run through the service stream progress and write the usual outputs """
+    service = mapGazeService.MappingService(nWorkers=2)
+    service.preload(join(testDataDir, 'referenceImage.jpg'))
+    client = mapGazeService.LocalClient(service)
+    try:
+        jobIds = [client.submit(join(testDataDir, 'gazeData_world.tsv'),
+                                join(testDataDir, 'worldCamera.mp4'),
+                                join(testDataDir, 'referenceImage.jpg'),
+                                str(tmpdir.join(run)),
+                                nFrames=2) for run in ['run1', 'run2']]
+
+        events = list(client.stream(jobIds[0], poll=0.5))
+        assert [e['frame'] for e in events] == [0, 1]
+        assert all(e['foundGoodMatch'] and e['numMatches'] > 10 for e in events)
+
+        for jobId, run in zip(jobIds, ['run1', 'run2']):
+            status = client.wait(jobId, poll=0.5)
+            assert status['status'] == 'done', status['error']
+            gazeMapped = pd.read_table(str(tmpdir.join(run, 'gazeData_mapped.tsv')))
+            assert abs(gazeMapped['ref_gazeX'][0] - 1032) <= 1
+            with open(str(tmpdir.join(run, 'mapGazeLog.log'))) as f:
+                assert f.read().count('features on frame') == 2
+
+        # mappers are cached, not rebuilt per job
+        assert sum(len(m) for m in service._mappers.values()) <= 2
+    finally:
+        service.shutdown()
+
+
+def test_httpClient(tmpdir):
+    """ confirm jobs can be submitted and followed over the HTTP API, and failures are reported """
+    service = mapGazeService.MappingService()
+    server = mapGazeService.makeServer(service, port=0)
+    serverThread = threading.Thread(target=server.serve_forever)
+    serverThread.daemon = True
+    serverThread.start()
+    client = mapGazeService.HTTPClient('http://127.0.0.1:{}'.format(server.server_address[1]))
+    try:
+        jobId = client.submit(join(testDataDir, 'gazeData_world.tsv'),
+                              join(testDataDir, 'worldCamera.mp4'),
+                              join(testDataDir, 'referenceImage.jpg'),
+                              str(tmpdir.join('output')),
+                              nFrames=2)
+        status = client.wait(jobId, poll=0.5)
+        assert status['status'] == 'done', status['error']
+        assert status['nEvents'] == 2
+        assert os.path.exists(str(tmpdir.join('output', 'gazeData_mapped.tsv')))
+
+        badId = client.submit(str(tmpdir.join('missing.tsv')),
+                              join(testDataDir, 'worldCamera.mp4'),
+                              join(testDataDir, 'referenceImage.jpg'),
+                              str(tmpdir.join('bad')))
+        status = client.wait(badId, poll=0.5)
+        assert status['status'] == 'failed'
+        assert status['error']
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.shutdown()
+
+
+def test_retention(tmpdir, monkeypatch):
+    """ confirm read and surplus events are dropped, and finished jobs are forgotten """
+    service = mapGazeService.MappingService(maxEvents=3, maxFinishedJobs=2)
+    client = mapGazeService.LocalClient(service)
+    try:
+        jobId = client.submit(join(testDataDir, 'gazeData_world.tsv'),
+                              join(testDataDir, 'worldCamera.mp4'),
+                              join(testDataDir, 'referenceImage.jpg'),
+                              str(tmpdir.join('output')),
+                              nFrames=5)
+        # wait without reading the events
+        while client.status(jobId)['status'] not in mapGazeService.FINISHED:
+            time.sleep(0.1)
+        assert client.status(jobId)['status'] == 'done'
+
+        # only the last 3 of the 5 events are kept, and read ones are dropped
+        result = client.events(jobId)
+        assert result['first'] == 2 and [e['frame'] for e in result['events']] == [2, 3, 4]
+        result = client.events(jobId, since=4)
+        assert result['first'] == 4 and [e['frame'] for e in result['events']] == [4]
+        assert len(service.jobs[jobId]['events']) == 1
+        assert client.status(jobId)['nEvents'] == 5
+
+        # only the last 2 finished jobs are kept
+        badIds = [client.submit(str(tmpdir.join('missing.tsv')),
+                                join(testDataDir, 'worldCamera.mp4'),
+                                join(testDataDir, 'referenceImage.jpg'),
+                                str(tmpdir.join('bad'))) for i in range(3)]
+        client.wait(badIds[-1], poll=0.5)
+        assert sorted(s['id'] for s in service.allStatus()) == sorted(badIds[1:])
+
+        # and only for jobTTL seconds
+        service.jobTTL = -1
+        assert service.allStatus() == []
+    finally:
+        service.shutdown()
+
+    # each --preload is one set of reference images
+    preloaded = []
+    monkeypatch.setattr(mapGazeService.MappingService, 'preload', lambda self, refs: preloaded.append(refs))
+
+    class Server(object):
+        server_address = ('127.0.0.1', 0)
+
+        def serve_forever(self):
+            raise KeyboardInterrupt
+
+        def server_close(self):
+            pass
+    monkeypatch.setattr(mapGazeService, 'makeServer', lambda *args: Server())
+    with pytest.raises(SystemExit):
+        mapGazeService.main(['--preload', 'a.jpg', 'b.jpg', '--preload', 'c.jpg'])
+    assert preloaded == [['a.jpg', 'b.jpg'], ['c.jpg']]
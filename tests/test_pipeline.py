@@ -0,0 +1,45 @@
+import os
+import json
+import shutil
+from os.path import join
+
+import numpy as np
+import pytest
+
+from mobileGazeMapping import pipeline
+from test_preprocessAndMap import makeStimulusRecording
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg not installed')
+def test_runPipeline(tmpdir, makeSMIrecording):
+    """ confirm sessions are preprocessed and mapped concurrently within the stage limits """
+    inputDirs = [str(tmpdir.join('smi_export{}'.format(i))) for i in range(3)]
+    for inputDir in inputDirs:
+        makeStimulusRecording(makeSMIrecording, inputDir, 1)
+    outputRoot = str(tmpdir.join('output'))
+
+    manifest = pipeline.runPipeline(inputDirs, outputRoot,
+                                    referenceImage=join(testDataDir, 'referenceImage.jpg'),
+                                    limits={'copy': 1, 'transcode': 1, 'map': 2},
+                                    transcodeSettings={'preset': 'ultrafast'})
+
+    with open(join(outputRoot, pipeline.MANIFEST_NAME)) as f:
+        assert json.load(f) == manifest
+    assert manifest['limits'] == {'copy': 1, 'gaze': 2, 'transcode': 1, 'map': 2}
+
+    assert len(manifest['sessions']) == 3
+    assert len(set(e['outputDir'] for e in manifest['sessions'])) == 3
+    for entry in manifest['sessions']:
+        assert entry['status'] == 'ok', entry['error']
+        for stage in pipeline.STAGES:
+            assert entry['timings'][stage] >= 0
+            assert entry['timings'][stage + 'Wait'] >= 0
+        assert sorted(os.listdir(entry['outputDir'])) == ['frame_timestamps.tsv', 'gazeData_world.tsv',
+                                                          'mappedGazeOutput', 'worldCamera.mp4']
+        outputData = np.genfromtxt(join(entry['mappedDir'], 'gazeData_mapped.tsv'), skip_header=1)
+        np.testing.assert_allclose(outputData[:, 5], 1366 / 2, atol=15)
+
+    # one copy/transcode at a time: sessions after the first queue for them
+    assert max(e['timings']['copyWait'] for e in manifest['sessions']) > 0
@@ -0,0 +1,83 @@
+import os
+import shutil
+from os.path import join
+
+import numpy as np
+import cv2
+import pytest
+
+from mobileGazeMapping import preprocessAndMap
+from mobileGazeMapping import mapGaze
+from mobileGazeMapping.gazeData import GazeData
+from mobileGazeMapping.preprocessing import smi_preprocessing
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def makeStimulusRecording(makeSMIrecording, inputDir, sessionNum, nFrames=5):
+    """ write a synthetic SMI export whose frames show a shrunken copy of the
+    reference image, with one gaze sample per frame at its center """
+    refImg = cv2.imread(join(testDataDir, 'referenceImage.jpg'))
+    frame = np.full((300, 400, 3), 128, dtype=np.uint8)
+    frame[20:280, 100:340] = cv2.resize(refImg, (240, 260))
+    makeSMIrecording(inputDir, sessionNum, frame, nFrames, gazePos=(220, 150))
+
+
+def checkMappedGaze(outputDir):
+    """ gaze at the center of the stimulus in the world frame maps to the center of the reference image """
+    outputData = np.genfromtxt(join(outputDir, 'mappedGazeOutput', 'gazeData_mapped.tsv'), skip_header=1)
+    assert outputData.shape == (5, 7)
+    np.testing.assert_allclose(outputData[:, 5], 1366 / 2, atol=15)
+    np.testing.assert_allclose(outputData[:, 6], 1478 / 2, atol=15)
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg not installed')
+def test_preprocessAndMap(tmpdir, makeSMIrecording):
+    """ confirm a raw recording is preprocessed and mapped in a single call """
+    inputDir = str(tmpdir.join('smi_export'))
+    makeStimulusRecording(makeSMIrecording, inputDir, 1)
+
+    outputDir = preprocessAndMap.preprocessAndMap(inputDir, str(tmpdir.join('output')),
+                                                  join(testDataDir, 'referenceImage.jpg'),
+                                                  sessionNum=1,
+                                                  transcodeSettings={'preset': 'ultrafast'},
+                                                  rawMode='inplace')
+
+    # preprocessing outputs
+    for f in ['gazeData_world.tsv', 'frame_timestamps.tsv', 'worldCamera.mp4']:
+        assert os.path.exists(join(outputDir, f))
+
+    checkMappedGaze(outputDir)
+
+
+def test_preprocessAndMap_inMemoryGaze(tmpdir, monkeypatch, makeSMIrecording):
+    """ confirm the formatted gaze data is handed to the mapper in memory,
+    with the video step stubbed out (so no ffmpeg is needed) """
+    inputDir = str(tmpdir.join('smi_export'))
+    makeStimulusRecording(makeSMIrecording, inputDir, 1)
+
+    videoCalls = []
+    monkeypatch.setattr(smi_preprocessing, 'prepWorldVideo', lambda *args: videoCalls.append(args))
+    mapperInputs = []
+    processRecording = mapGaze.processRecording
+
+    def recordInputs(**kwargs):
+        mapperInputs.append(kwargs)
+        return processRecording(**kwargs)
+    monkeypatch.setattr(mapGaze, 'processRecording', recordInputs)
+
+    outputDir = preprocessAndMap.preprocessAndMap(inputDir, str(tmpdir.join('output')),
+                                                  join(testDataDir, 'referenceImage.jpg'),
+                                                  sessionNum=1,
+                                                  rawMode='inplace')
+
+    assert len(videoCalls) == 1
+    assert len(mapperInputs) == 1
+    gazeData = mapperInputs[0]['gazeData']
+    assert isinstance(gazeData, GazeData)
+    assert gazeData.nFrames == 5
+    np.testing.assert_array_equal(gazeData.frame_idx, np.arange(5))
+    np.testing.assert_allclose(gazeData.norm_pos_x, 220 / 400)
+    # frames read straight from the raw movie
+    assert mapperInputs[0]['worldCameraVid'] == join(inputDir, 'rec-1-recording.avi')
+    checkMappedGaze(outputDir)
@@ -0,0 +1,39 @@
+import os
+from os.path import join
+
+import numpy as np
+
+from mobileGazeMapping.benchmarks import regression
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_compareOutputs():
+    """ confirm each kind of difference from the golden outputs is measured """
+    golden = regression.readOutputs(join(testDataDir, 'golden', 'testRecording'))
+    refSizes = {'referenceImage': (1366, 1478)}
+    errors = regression.compareOutputs(golden, golden, refSizes)
+    assert errors == {'homographyError': 0.0, 'gazeError': 0.0, 'frameMismatch': 0.0}
+
+    homographies = golden[0]['referenceImage'].copy()
+    # world camera frame shifted 3 px right
+    homographies[1] = homographies[1].dot(np.array([[1, 0, -3], [0, 1, 0], [0, 0, 1]]))
+    homographies[2] = np.nan
+    gaze = golden[1].copy()
+    gaze.loc[0, 'ref_gazeX'] += 4
+    errors = regression.compareOutputs(golden, ({'referenceImage': homographies}, gaze), refSizes)
+    np.testing.assert_allclose(errors['homographyError'], 3)
+    assert errors['gazeError'] == 4
+    assert errors['frameMismatch'] == 1 / len(homographies)
+    assert not regression.withinTolerance(errors, regression.MODES['serial']['tolerance'])
+
+
+def test_modesMatchGolden():
+    """ confirm the mapping modes stay within their tolerances of the golden outputs """
+    results = regression.runHarness(regression.TEST_RECORDINGS, join(testDataDir, 'golden'),
+                                    modes=['serial', 'guided', 'prefilter', 'dedup'], nFrames=10)
+    assert [r['mode'] for r in results] == ['serial', 'guided', 'prefilter', 'dedup']
+    for r in results:
+        assert r['passed'], r
+        assert r['speedup'] > 0
+    assert results[0]['gazeError'] == 0 and results[0]['speedup'] == 1
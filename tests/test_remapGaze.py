@@ -0,0 +1,56 @@
+import os
+from os.path import join
+
+import numpy as np
+import cv2
+import pandas as pd
+import pytest
+
+from mobileGazeMapping import mapGaze
+from mobileGazeMapping import remapGaze
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_perspectiveTransform():
+    """ confirm batched mapping matches OpenCV's, point by point and frame by frame """
+    rng = np.random.RandomState(0)
+    homographies = np.eye(3) + rng.uniform(-0.1, 0.1, (20, 3, 3)) * [[10, 10, 100], [10, 10, 100], [0.001, 0.001, 1]]
+    homographies[5] = np.nan
+    points = rng.uniform(0, 1000, (500, 2))
+    frameIdx = rng.randint(-2, 22, 500)
+
+    mapped = remapGaze.perspectiveTransform(points, homographies, frameIdx)
+    for i, (point, frame) in enumerate(zip(points, frameIdx)):
+        if frame < 0 or frame >= 20 or frame == 5:
+            assert np.isnan(mapped[i]).all()
+        else:
+            expected = cv2.perspectiveTransform(point.reshape(1, 1, 2), homographies[frame]).ravel()
+            np.testing.assert_allclose(mapped[i], expected, rtol=1e-9)
+
+    # a single homography, rounded like mapCoords2D
+    rounded = remapGaze.perspectiveTransform(points[:3], homographies[0], rounded=True)
+    assert [tuple(p) for p in rounded] == [mapGaze.mapCoords2D(tuple(p), homographies[0]) for p in points[:3]]
+
+    with pytest.raises(ValueError):
+        remapGaze.perspectiveTransform(points, homographies)
+
+
+def test_remapRecording(tmpdir):
+    """ confirm remapping with the stored homographies reproduces the mapped gaze """
+    outputDir = str(tmpdir)
+    gazeFile = join(testDataDir, 'gazeData_world.tsv')
+    mapper = mapGaze.GazeMapper(join(testDataDir, 'referenceImage.jpg'), videoSettings={'layout': 'none'})
+    mapped = mapper.map_recording(gazeFile, join(testDataDir, 'worldCamera.mp4'), outputDir, nFrames=5)
+
+    remapGaze.main([outputDir, gazeFile, join(testDataDir, 'worldCamera.mp4')])
+    remapped = pd.read_table(join(outputDir, 'gazeData_remapped.tsv'))
+    assert list(remapped.columns) == list(mapped.columns)
+    np.testing.assert_allclose(remapped.values, mapped.values, atol=1e-3)
+
+    # unrounded, to another file
+    remapGaze.main([outputDir, gazeFile, join(testDataDir, 'worldCamera.mp4'), '--float',
+                    '-o', join(outputDir, 'float.tsv')])
+    unrounded = pd.read_table(join(outputDir, 'float.tsv'))
+    assert (unrounded['ref_gazeX'] != unrounded['ref_gazeX'].round()).any()
+    np.testing.assert_allclose(unrounded['ref_gazeX'], mapped['ref_gazeX'], atol=0.5)
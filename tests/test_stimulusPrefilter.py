@@ -0,0 +1,77 @@
+import os
+from os.path import join
+
+import numpy as np
+import cv2
+import pandas as pd
+import pytest
+
+from mobileGazeMapping import mapGaze
+from mobileGazeMapping import stimulusPrefilter
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def shuffledTiles(frame, tileSize, rng):
+    """ frame cut into tiles and put back together in random order """
+    rows, cols = frame.shape[0] // tileSize, frame.shape[1] // tileSize
+    tiles = [frame[r * tileSize:(r + 1) * tileSize, c * tileSize:(c + 1) * tileSize]
+             for r in range(rows) for c in range(cols)]
+    tiles = [tiles[i] for i in rng.permutation(len(tiles))]
+    return np.vstack([np.hstack(tiles[r * cols:(r + 1) * cols]) for r in range(rows)])
+
+
+def test_scores():
+    """ confirm frames showing the stimulus score far above frames that don't """
+    refImg = cv2.imread(join(testDataDir, 'referenceImage.jpg'), cv2.IMREAD_GRAYSCALE)
+    prefilter = stimulusPrefilter.StimulusPrefilter([refImg])
+    vid = cv2.VideoCapture(join(testDataDir, 'worldCamera.mp4'))
+    frames = [cv2.cvtColor(vid.read()[1], cv2.COLOR_BGR2GRAY) for i in range(3)]
+    vid.release()
+
+    present = np.concatenate([prefilter.scores(frame) for frame in frames])
+    assert (present > 50).all() and prefilter.present(present).all()
+
+    rng = np.random.RandomState(0)
+    absent = [np.full_like(frames[0], 128),
+              rng.randint(0, 256, frames[0].shape).astype(np.uint8),
+              shuffledTiles(frames[0], 120, rng)]
+    scores = np.concatenate([prefilter.scores(frame) for frame in absent])
+    assert not prefilter.present(scores).any()
+
+    with pytest.raises(ValueError):
+        stimulusPrefilter.getPrefilterSettings({'minScore': 3})
+
+
+def test_skipFrames(tmpdir, monkeypatch):
+    """ confirm frames without any reference are skipped, and references that aren't found aren't registered """
+    noiseRef = str(tmpdir.join('noiseImage.jpg'))
+    rng = np.random.RandomState(0)
+    cv2.imwrite(noiseRef, cv2.resize(rng.randint(0, 255, (60, 80, 3)).astype(np.uint8), (800, 600),
+                                     interpolation=cv2.INTER_NEAREST))
+    mapper = mapGaze.GazeMapper([join(testDataDir, 'referenceImage.jpg'), noiseRef], prefilter={})
+    warnings = []
+    monkeypatch.setattr(mapper.logger, 'warning', lambda msg, *args: warnings.append(msg))
+
+    vid = cv2.VideoCapture(join(testDataDir, 'worldCamera.mp4'))
+    frame = vid.read()[1]
+    vid.release()
+    fr = mapper.map_frame(frame, 0)
+    assert fr['foundGoodMatch']
+    assert [refFr['skipped'] for refFr in fr['references']] == [False, True]
+    assert 'numMatches' not in fr['references'][1]
+
+    fr = mapper.map_frame(np.full_like(frame, 128), 1)
+    assert not fr['foundGoodMatch'] and all(refFr['skipped'] for refFr in fr['references'])
+    assert warnings == []
+
+    # recorded in the metrics, and the mapping is unchanged
+    outputDir = str(tmpdir.join('output'))
+    gazeMapped = mapper.map_recording(join(testDataDir, 'gazeData_world.tsv'), join(testDataDir, 'worldCamera.mp4'),
+                                      outputDir, nFrames=3)
+    np.testing.assert_allclose(gazeMapped['ref_gazeX'][:6], [1032, 1034, 1033, 977, 893, 857], atol=1)
+    metrics = pd.read_table(join(outputDir, 'frameMetrics.tsv'))
+    assert metrics.groupby('refImage')['skipped'].all().to_dict() == {'referenceImage': False, 'noiseImage': True}
+    assert (metrics['prefilterScore'][metrics.refImage == 'referenceImage'] >= 10).all()
+    with open(join(outputDir, 'mapGazeLog.log')) as f:
+        assert 'Prefilter skipped 0 of 3 frames' in f.read()
@@ -0,0 +1,101 @@
+import os
+import argparse
+import multiprocessing
+from os.path import join
+
+import cv2
+import pytest
+
+from mobileGazeMapping import mapGaze
+from mobileGazeMapping import threadTuning
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_threadSettings():
+    """ confirm thread settings are checked, applied, and restored """
+    with pytest.raises(ValueError):
+        threadTuning.getThreadSettings({'threads': 2})
+    with pytest.raises(ValueError):
+        threadTuning.getThreadSettings({'numpyThreads': 0})
+    assert threadTuning.splitCores(3, nCores=8) == {'cvThreads': 2, 'openCL': None, 'numpyThreads': 2}
+    assert threadTuning.splitCores(16, nCores=8)['cvThreads'] == 1
+
+    previous = threadTuning.applyThreadSettings({'cvThreads': 1, 'openCL': False})
+    try:
+        assert cv2.getNumThreads() == 1 and not cv2.ocl.useOpenCL()
+        assert threadTuning.describeThreadSettings().startswith('OpenCV threads: 1, OpenCL: ')
+    finally:
+        threadTuning.applyThreadSettings(dict(previous, numpyThreads=None))
+    assert cv2.getNumThreads() == previous['cvThreads']
+
+
+def test_threadsLogged(tmpdir):
+    """ confirm the thread settings of a mapping job are recorded in its log """
+    outputDir = str(tmpdir.join('output'))
+    previous = threadTuning.currentThreadSettings()
+    try:
+        mapGaze.processRecording(join(testDataDir, 'gazeData_world.tsv'), join(testDataDir, 'worldCamera.mp4'),
+                                 join(testDataDir, 'referenceImage.jpg'), outputDir, nFrames=2,
+                                 threads={'cvThreads': 1}, videoSettings={'layout': 'none'})
+    finally:
+        threadTuning.applyThreadSettings(dict(previous, numpyThreads=None))
+    with open(join(outputDir, 'mapGazeLog.log')) as f:
+        assert 'OpenCV threads: 1,' in f.read()
+
+
+def test_autoTune():
+    """ confirm every split of the cores is timed and the fastest is picked """
+    assert threadTuning.candidateSplits(8, 8) == [(1, 8), (2, 4), (4, 2), (8, 1)]
+    assert threadTuning.candidateSplits(3, 8) == [(1, 8), (2, 4), (3, 2)]
+    assert threadTuning.candidateSplits(4, 1) == [(1, 1)]
+
+    plan = threadTuning.autoTune(join(testDataDir, 'referenceImage.jpg'), join(testDataDir, 'worldCamera.mp4'),
+                                 nJobs=2, nCores=2, nFrames=3)
+    assert [(t['processes'], t['cvThreads']) for t in plan['trials']] == [(1, 2), (2, 1)]
+    best = max(plan['trials'], key=lambda t: t['framesPerSec'])
+    assert plan['processes'] == best['processes'] and plan['framesPerSec'] == best['framesPerSec'] > 0
+    assert plan['threads']['cvThreads'] == best['cvThreads']
+
+
+def test_spawnExecutor():
+    """ confirm calls run in spawned workers, also on the multiprocessing.Pool used before python 3.7 """
+    executors = [threadTuning.spawnExecutor(2),
+                 threadTuning._PoolExecutor(multiprocessing.get_context('spawn').Pool(2))]
+    for executor in executors:
+        with executor:
+            assert executor.submit(threadTuning.splitCores, 2, nCores=8).result()['cvThreads'] == 4
+            pids = set(executor.submit(os.getpid).result() for i in range(4))
+            assert os.getpid() not in pids
+            with pytest.raises(ValueError):
+                executor.submit(int, 'x').result()
+
+
+def test_threadPlan(tmpdir):
+    """ confirm a saved plan fills in the thread settings and is recorded in the mapping log """
+    plan = {'processes': 2, 'threads': {'cvThreads': 1, 'openCL': None, 'numpyThreads': 1}, 'framesPerSec': 12.5,
+            'trials': [{'processes': 1, 'cvThreads': 2, 'framesPerSec': 8.0},
+                       {'processes': 2, 'cvThreads': 1, 'framesPerSec': 12.5}]}
+    planFile = str(tmpdir.join('plan.json'))
+    threadTuning.savePlan(plan, planFile)
+    assert threadTuning.loadPlan(planFile) == plan
+
+    parser = argparse.ArgumentParser()
+    threadTuning.addArguments(parser)
+    args = parser.parse_args(['--numpyThreads', '3', '--threadPlan', planFile])
+    assert threadTuning.settingsFromArgs(args) == {'cvThreads': 1, 'openCL': None, 'numpyThreads': 3}
+    assert threadTuning.planFromArgs(parser.parse_args([])) is None
+
+    outputDir = str(tmpdir.join('output'))
+    previous = threadTuning.currentThreadSettings()
+    try:
+        mapGaze.processRecording(join(testDataDir, 'gazeData_world.tsv'), join(testDataDir, 'worldCamera.mp4'),
+                                 join(testDataDir, 'referenceImage.jpg'), outputDir, nFrames=2,
+                                 videoSettings={'layout': 'none'}, threadPlan=plan)
+    finally:
+        threadTuning.applyThreadSettings(dict(previous, numpyThreads=None))
+    with open(join(outputDir, 'mapGazeLog.log')) as f:
+        log = f.read()
+    assert 'OpenCV threads: 1,' in log
+    assert 'Thread plan (auto-tuned): 2 concurrent jobs with --cvThreads 1 --numpyThreads 1 (12.5 frames/sec)' in log
+    assert log.count('Thread plan trial: ') == 2
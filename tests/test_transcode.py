@@ -0,0 +1,56 @@
+import os
+import shutil
+
+import numpy as np
+import cv2
+import pytest
+
+from mobileGazeMapping.preprocessing import transcode
+
+testDataDir = os.path.dirname(os.path.abspath(__file__))
+
+needsFFmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg not installed')
+
+
+def test_buildCommand():
+    """ confirm encoder settings and stream copy end up in the ffmpeg command """
+    cmd = transcode.buildCommand('in.avi', 'out.mp4', {'crf': 18, 'preset': 'fast', 'threads': 2},
+                                 inputOptions=['-r', '25'])
+    assert cmd[0] == 'ffmpeg'
+    assert cmd.index('-r') < cmd.index('-i')
+    for option, value in [('-c:v', 'libx264'), ('-crf', '18'), ('-preset', 'fast'),
+                          ('-threads', '2'), ('-pix_fmt', 'yuv420p')]:
+        assert cmd[cmd.index(option) + 1] == value
+    assert cmd[-1] == 'out.mp4'
+
+    cmd = transcode.buildCommand('in.mp4', 'out.mp4', streamCopy=True)
+    assert cmd[cmd.index('-c:v') + 1] == 'copy'
+    assert '-crf' not in cmd
+
+
+def test_transcodeError(tmpdir):
+    """ confirm a failed transcode raises instead of passing silently """
+    with pytest.raises(RuntimeError):
+        transcode.transcode(str(tmpdir.join('missing.avi')), str(tmpdir.join('out.mp4')),
+                            {'ffmpeg': str(tmpdir.join('no_ffmpeg_here')), 'streamCopy': False})
+
+
+@needsFFmpeg
+def test_transcode(tmpdir):
+    """ confirm an AVI is encoded to H.264/yuv420p, and an H.264 mp4 is stream-copied """
+    src = str(tmpdir.join('src.avi'))
+    vidOut = cv2.VideoWriter(src, cv2.VideoWriter_fourcc(*'MJPG'), 25, (64, 48), True)
+    for i in range(10):
+        vidOut.write(np.full((48, 64, 3), i * 20, dtype=np.uint8))
+    vidOut.release()
+
+    settings = {'preset': 'ultrafast', 'threads': 1}
+    encoded = str(tmpdir.join('encoded.mp4'))
+    assert transcode.transcode(src, encoded, settings)['mode'] == 'encode'
+    assert transcode.probeVideo(encoded) == {'codec': 'h264', 'pix_fmt': 'yuv420p'}
+
+    copied = str(tmpdir.join('copied.mp4'))
+    assert transcode.transcode(encoded, copied, settings)['mode'] == 'copy'
+    vid = cv2.VideoCapture(copied)
+    assert int(vid.get(cv2.CAP_PROP_FRAME_COUNT)) == 10
+    vid.release()